@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark della memoria occupata dalla cache aziende
+Confronta i byte per azienda della rappresentazione precedente (dataclass con
+__dict__, data come stringa ISO, doppia voce ticker + name_ ciascuna con il
+proprio oggetto) con quella attuale (snapshot binario mappato in memoria:
+le aziende sono decodificate in record con __slots__ solo quando lette).
+
+Uso:
+    python benchmark_cache_memory.py [numero_aziende]
+"""
+
+import sys
+import os
+import gc
+import json
+import random
+import tempfile
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from modules.fortune500_cache import CachedCompany, Fortune500Cache
+
+SECTORS = ["Technology", "Health Care", "Financials", "Energy", "Industrials", "Consumer Staples"]
+EXCHANGES = ["NYSE", "NASDAQ", "AMEX"]
+
+
+@dataclass
+class LegacyCachedCompany:
+    """Rappresentazione precedente di CachedCompany (riferimento per il confronto)"""
+    symbol: str
+    name: str
+    exchange: str
+    market_cap: Optional[float] = None
+    sector: Optional[str] = None
+    industry: Optional[str] = None
+    last_updated: str = None
+
+    def __post_init__(self):
+        if self.last_updated is None:
+            self.last_updated = datetime.now().isoformat()
+
+
+def make_legacy_json(path: str, count: int) -> None:
+    """Scrive un file di cache nel formato JSON legacy (chiavi ticker + name_)"""
+    random.seed(1)
+    data = {}
+    for i in range(count):
+        sector = random.choice(SECTORS)
+        company = {
+            "symbol": f"T{i}",
+            "name": f"Company {i} {random.choice(['Inc.', 'Corporation', 'plc'])}",
+            "exchange": random.choice(EXCHANGES),
+            "market_cap": random.uniform(1e8, 1e12),
+            "sector": sector,
+            "industry": f"{sector} Services",
+            "last_updated": datetime.now().isoformat(),
+        }
+        data[company["symbol"]] = company
+        data[f"name_{company['name'].lower().replace(' ', '_')}"] = company
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def measure(build) -> tuple:
+    """Byte allocati dall'oggetto restituito da build (mantenuto in vita)"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def load_legacy(path: str) -> dict:
+    """Caricamento come nella versione precedente: un oggetto per chiave"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {key: LegacyCachedCompany(**value) for key, value in data.items()}
+
+
+def main():
+    """Funzione principale del benchmark"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"📏 Benchmark memoria cache aziende ({count} aziende)")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache_file = os.path.join(directory, "cache.json")
+        make_legacy_json(cache_file, count)
+
+        legacy, legacy_bytes = measure(lambda: load_legacy(cache_file))
+        print(f"Prima: {len(legacy)} voci, {legacy_bytes / count:.0f} byte/azienda")
+        del legacy
+
+        # Il primo caricamento migra il JSON allo snapshot binario; si misura il successivo
+        Fortune500Cache(cache_file=cache_file)
+        cache, current_bytes = measure(lambda: Fortune500Cache(cache_file=cache_file))
+        assert len(cache.cache) == count and isinstance(next(iter(cache.cache.values())), CachedCompany)
+        print(f"Dopo:  {len(cache.cache)} voci, {current_bytes / count:.0f} byte/azienda")
+        print(f"Risparmio: {(1 - current_bytes / legacy_bytes) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,25 @@ PORT = int(os.getenv("PORT", 8000))
 DEBUG = _get_bool_env("DEBUG", False)
 RELOAD = _get_bool_env("RELOAD", False)
 
+# Scadenza per richiesta (secondi) entro cui raccogliere i dati di un'analisi;
+# i rami che non rispondono in tempo vengono restituiti come parziali
+ANALYSIS_DEADLINE = float(os.getenv("ANALYSIS_DEADLINE", 8.0))
+
+# Analisi batch: numero massimo di ticker per richiesta e ticker analizzati
+# in parallelo (le chiamate verso FMP restano limitate dal trasporto)
+BATCH_MAX_TICKERS = int(os.getenv("BATCH_MAX_TICKERS", 200))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+
+# Scheduler dei benchmark settoriali: ricalcolo di tutti i settori ogni
+# BENCHMARK_REFRESH_INTERVAL secondi, con BENCHMARK_STAGGER secondi tra un
+# settore e il successivo per distribuire le chiamate a FMP
+BENCHMARK_SCHEDULER_ENABLED = _get_bool_env("BENCHMARK_SCHEDULER_ENABLED", True)
+BENCHMARK_REFRESH_INTERVAL = float(os.getenv("BENCHMARK_REFRESH_INTERVAL", 43200))
+BENCHMARK_STAGGER = float(os.getenv("BENCHMARK_STAGGER", 30))
+
+# Peer di ogni benchmark settoriale: prime N aziende per market cap (0 = intero settore)
+BENCHMARK_PEERS = int(os.getenv("BENCHMARK_PEERS", 10))
+
 # CORS Configuration
 # Imposta CORS_ORIGINS via env (lista separata da virgole) in produzione
 _DEFAULT_CORS = [
@@ -49,6 +68,34 @@ def get_api_key():
         return FMP_API_KEY
     return None
 
+def get_analysis_deadline() -> float:
+    """Scadenza (secondi) per il recupero dati di una singola analisi"""
+    return float(os.getenv("ANALYSIS_DEADLINE", ANALYSIS_DEADLINE))
+
+def get_batch_max_tickers() -> int:
+    """Numero massimo di ticker accettati da una richiesta batch"""
+    return int(os.getenv("BATCH_MAX_TICKERS", BATCH_MAX_TICKERS))
+
+def get_batch_concurrency() -> int:
+    """Ticker analizzati in parallelo in una richiesta batch"""
+    return max(1, int(os.getenv("BATCH_CONCURRENCY", BATCH_CONCURRENCY)))
+
+def get_benchmark_scheduler_enabled() -> bool:
+    """Se True i benchmark settoriali sono ricalcolati solo dallo scheduler"""
+    return _get_bool_env("BENCHMARK_SCHEDULER_ENABLED", BENCHMARK_SCHEDULER_ENABLED)
+
+def get_benchmark_refresh_interval() -> float:
+    """Secondi tra due cicli di ricalcolo dei benchmark settoriali"""
+    return float(os.getenv("BENCHMARK_REFRESH_INTERVAL", BENCHMARK_REFRESH_INTERVAL))
+
+def get_benchmark_stagger() -> float:
+    """Secondi di attesa tra il ricalcolo di due settori"""
+    return float(os.getenv("BENCHMARK_STAGGER", BENCHMARK_STAGGER))
+
+def get_benchmark_peers() -> int:
+    """Aziende usate per il benchmark di un settore (0 = tutte quelle del settore)"""
+    return max(0, int(os.getenv("BENCHMARK_PEERS", BENCHMARK_PEERS)))
+
 def get_host():
     """Get host from environment variable or config"""
     return os.getenv("HOST", HOST)
@@ -4,28 +4,62 @@ Finge Backend - FastAPI Application
 MVP per analisi finanziaria con scoring aggregato e benchmark dinamici
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, List, Optional
+from pydantic import BaseModel
+from typing import Dict, List, Optional, Tuple, Union
+import asyncio
+import json
 import uvicorn
 import os
-import requests
 from dotenv import load_dotenv
 
 from modules.financial_ratios import FinancialRatios
+from modules.http_client import close_transport
+from modules.concurrency import bounded_as_completed, deadline_scope, gather_with_deadline, remaining_time
+from modules.fetch_plan import FetchPlan, PROFILE, RATIOS, INCOME_STATEMENT, BALANCE_SHEET
+from modules.fundamentals_store import PERIODS, STATEMENTS, FundamentalsSeries, FundamentalsStore
 from modules.get_tick import FinancialModelingPrepClient
-from modules.sector_analysis import SectorAnalyzer
-from modules.scoring_system import ScoringSystem
+from modules.sector_analysis import ScreenerUnavailableError, SectorAnalyzer, normalize_sector
+from modules.sector_statistics import STATISTICS
+from modules.benchmark_scheduler import BenchmarkScheduler, DEFAULT_LOCK_PATH, DEFAULT_SECTORS
+from modules.company_snapshot import FileLock
+from modules.scoring_system import INDICATORS, PROFILES, ScoringProfile, ScoringSystem, parse_weights, resolve_profile
+from modules.screener import ScoreTable
 from modules.analyst_recommendations import AnalystRecommendationsClient
-from config import get_api_key, get_host, get_port, get_cors_origins, RELOAD
+from config import (get_api_key, get_host, get_port, get_cors_origins, get_analysis_deadline,
+                    get_batch_max_tickers, get_batch_concurrency, get_benchmark_scheduler_enabled,
+                    get_benchmark_refresh_interval, get_benchmark_stagger, get_benchmark_peers,
+                    RELOAD)
 
 # Carica variabili d'ambiente
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Gestisce le risorse condivise per la durata dell'applicazione"""
+    # Indici di ricerca della cache aziende costruiti in background:
+    # l'avvio non attende e la prima ricerca li trova già pronti
+    if fmp_client.use_cache and fmp_client.cache:
+        asyncio.get_running_loop().run_in_executor(None, fmp_client.cache.build_index)
+    # Benchmark settoriali ricalcolati periodicamente fuori dalle richieste
+    if get_benchmark_scheduler_enabled():
+        benchmark_scheduler.start()
+    # Screener ricostruito dallo storico e allineato alla cache in background
+    screener_sync = asyncio.create_task(run_screener_sync())
+    yield
+    screener_sync.cancel()
+    await benchmark_scheduler.stop()
+    # Chiude il pool di connessioni verso FMP
+    await close_transport()
+
 app = FastAPI(
     title="Finge API",
     description="API per analisi finanziaria con scoring aggregato e benchmark dinamici",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware per permettere richieste dal frontend
@@ -39,10 +73,159 @@ app.add_middleware(
 
 # Inizializza i moduli
 fmp_client = FinancialModelingPrepClient(api_key=get_api_key())
-sector_analyzer = SectorAnalyzer(fmp_client)
+sector_analyzer = SectorAnalyzer(fmp_client, peer_count=get_benchmark_peers())
 scoring_system = ScoringSystem()
 analyst_client = AnalystRecommendationsClient(api_key=get_api_key())
 
+def known_sectors() -> List[str]:
+    """
+    Settori FMP più quelli delle aziende in cache (senza attendere il lock tra processi)
+    
+    I nomi della cache sono convertiti nei nomi del stock-screener FMP: un nome
+    GICS (es. "Health Care") non ha aziende e consumerebbe quota ad ogni ciclo.
+    """
+    sectors = list(DEFAULT_SECTORS)
+    stats = fmp_client.get_cache_stats(wait=False)
+    if stats:
+        sectors.extend(normalize_sector(sector) for sector in stats["sectors"])
+    return sectors
+
+screener = ScoreTable(scoring_system)
+
+# Storico dei fondamentali (tutti i periodi scaricati), condiviso tra worker
+fundamentals_store = FundamentalsStore.from_env()
+
+# Un solo scheduler attivo tra i worker uvicorn (lock tra processi); gli altri
+# servono i benchmark dalla cache su disco e subentrano se il lock si libera
+benchmark_scheduler = BenchmarkScheduler(
+    sector_analyzer,
+    known_sectors,
+    interval=get_benchmark_refresh_interval(),
+    stagger=get_benchmark_stagger(),
+    lock=FileLock(DEFAULT_LOCK_PATH)
+)
+
+# Secondi suggeriti al client quando il benchmark di un settore è in calcolo
+BENCHMARK_RETRY_AFTER = 10
+
+# Intervallo (secondi) di allineamento del screener a cache aziende e benchmark
+SCREENER_SYNC_INTERVAL = 30
+
+# Aziende della cache registrate nel screener per ogni passo dell'event loop
+SCREENER_SYNC_CHUNK = 5000
+
+# Righe massime per pagina del screener
+SCREENER_MAX_LIMIT = 500
+
+# Periodi massimi restituiti dallo storico dei fondamentali
+HISTORY_MAX_LIMIT = 40
+
+# Margine concesso ai rami annidati per restituire risultati parziali
+# prima che scada la richiesta complessiva
+DEADLINE_GRACE = 0.25
+
+def compute_fundamentals(latest_ratios: Dict, latest_income: Optional[Dict],
+                         latest_balance: Optional[Dict]) -> Tuple[Dict, Optional[float]]:
+    """
+    Calcola PE, PB, ROE e il proxy di market cap dai payload già scaricati
+    
+    Args:
+        latest_ratios: Ultimo record di ratios
+        latest_income: Ultimo income statement (o None)
+        latest_balance: Ultimo balance sheet (o None)
+    
+    Returns:
+        Tupla (fondamentali, market_cap)
+    """
+    # Estrai i dati necessari
+    pe_ratio = latest_ratios.get('priceToEarningsRatio')
+    pb_ratio = latest_ratios.get('priceToBookRatio')
+    
+    # Calcola ROE dal net income e equity
+    roe_percent = None
+    roe = latest_ratios.get('returnOnEquity')
+    if roe is not None:
+        roe_percent = round(roe * 100, 2)
+    elif latest_income and latest_balance:
+        # Prova a calcolare ROE manualmente
+        net_income = latest_income.get('netIncome')
+        total_equity = latest_balance.get('totalStockholdersEquity')
+        
+        if net_income and total_equity and total_equity != 0:
+            roe_calculated = (net_income / total_equity) * 100
+            roe_percent = round(roe_calculated, 2)
+    
+    # Usa totalAssets come proxy per market cap (approssimativo)
+    market_cap = None
+    if latest_balance:
+        total_assets = latest_balance.get('totalAssets')
+        if total_assets:
+            market_cap = total_assets
+    
+    fundamentals = {
+        "PE": round(pe_ratio, 2) if pe_ratio else None,
+        "PB": round(pb_ratio, 2) if pb_ratio else None,
+        "ROE": roe_percent
+    }
+    return fundamentals, market_cap
+
+def build_analysis_response(ticker: str, company_data: Dict, benchmark_data: Dict,
+                            analysis_result: Dict, profile: ScoringProfile) -> Dict:
+    """Compone la risposta di analisi a partire da dati, benchmark e scoring"""
+    return {
+        "ticker": ticker.upper(),
+        "sector": company_data["sector"],
+        "fundamentals": company_data["fundamentals"],
+        "benchmark": benchmark_data["benchmark"],
+        "indicators": analysis_result["indicators"],
+        "score": analysis_result["score"],
+        "final_signal": analysis_result["final_signal"],
+        "scoring_profile": profile.name
+    }
+
+def request_profile(profile: Optional[str] = None, weights: Optional[Union[str, Dict[str, float]]] = None,
+                    threshold: Optional[float] = None) -> ScoringProfile:
+    """
+    Profilo di scoring di una richiesta (400 se non valido)
+    
+    Args:
+        profile: Nome del profilo (default: quello del sistema di scoring)
+        weights: Pesi da sostituire, come dizionario o stringa "PE:0.4,PB:0.3,ROE:0.3"
+        threshold: Soglia percentuale di classificazione dei singoli indicatori
+    """
+    if profile is None and weights is None and threshold is None:
+        return scoring_system.profile
+    try:
+        if isinstance(weights, str):
+            weights = parse_weights(weights)
+        return resolve_profile(profile, weights, threshold)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def normalize_tickers(tickers: List[str]) -> List[str]:
+    """Normalizza in maiuscolo e rimuove vuoti e duplicati mantenendo l'ordine"""
+    unique = {}
+    for ticker in tickers:
+        symbol = ticker.strip().upper()
+        if symbol:
+            unique.setdefault(symbol, None)
+    return list(unique)
+
+def describe_error(error: BaseException) -> Dict:
+    """Rappresentazione JSON di un errore per i risultati batch"""
+    if isinstance(error, HTTPException):
+        return {"status_code": error.status_code, "detail": error.detail}
+    return {"status_code": 500, "detail": str(error) or error.__class__.__name__}
+
+class BatchAnalysisRequest(BaseModel):
+    """Corpo della richiesta di analisi batch"""
+    tickers: List[str]
+    statistic: Optional[str] = None
+    top: Optional[int] = None
+    profile: Optional[str] = None
+    weights: Optional[Dict[str, float]] = None
+    threshold: Optional[float] = None
+
 @app.get("/")
 async def root():
     """Endpoint di test"""
@@ -51,7 +234,158 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "api_key_valid": fmp_client.test_api_key()}
+    return {"status": "healthy", "api_key_valid": await fmp_client.test_api_key_async()}
+
+@app.get("/api/upstream/stats")
+async def get_upstream_stats():
+    """Contatori delle chiamate verso FMP (coalescenza delle richieste identiche)"""
+    return await fmp_client.transport.get_stats_async()
+
+@app.get("/api/cache/stats")
+async def get_company_cache_stats():
+    """Statistiche della cache Fortune 500 (contatori incrementali, economiche da interrogare)"""
+    stats = await asyncio.to_thread(fmp_client.get_cache_stats)
+    if stats is None:
+        return {"enabled": False}
+    return {"enabled": True, **stats}
+
+@app.get("/api/scoring/profiles")
+async def get_scoring_profiles():
+    """Profili di scoring selezionabili per nome (parametro "profile")"""
+    return {
+        "default": scoring_system.profile.name,
+        "profiles": {name: profile.to_dict() for name, profile in PROFILES.items()}
+    }
+
+@app.get("/api/scheduler/status")
+async def get_scheduler_status():
+    """Stato dello scheduler dei benchmark settoriali (ultimo e prossimo ciclo)"""
+    return benchmark_scheduler.get_status()
+
+async def sync_screener() -> None:
+    """Allinea la tabella del screener a cache aziende e benchmark calcolati"""
+    # Le letture della cache possono attendere il lock tra processi: fuori dall'event loop
+    stats = await asyncio.to_thread(fmp_client.get_cache_stats)
+    if stats is not None:
+        version = (stats["total_companies"], stats.get("last_updated"))
+        if version != screener.universe_version:
+            companies = await asyncio.to_thread(fmp_client.cache.companies)
+            # A blocchi: l'intero universo non blocca l'event loop in un solo passo
+            for start in range(0, len(companies), SCREENER_SYNC_CHUNK):
+                screener.sync_universe(companies[start:start + SCREENER_SYNC_CHUNK])
+                await asyncio.sleep(0)
+            screener.universe_version = version
+    for sector, result, computed_at in sector_analyzer.cached_benchmarks():
+        screener.update_benchmark(sector, result["benchmark"], version=computed_at)
+
+async def run_screener_sync() -> None:
+    """
+    Popola il screener dallo storico e lo allinea ogni SCREENER_SYNC_INTERVAL secondi
+    
+    Le richieste interrogano soltanto la tabella: cache aziende e benchmark
+    nuovi compaiono entro un intervallo.
+    """
+    await seed_screener()
+    while True:
+        try:
+            await sync_screener()
+        except Exception as e:
+            print(f"Errore nell'allineamento del screener: {e}")
+        await asyncio.sleep(SCREENER_SYNC_INTERVAL)
+
+def stored_fundamentals() -> List[Tuple[str, Dict, Optional[str], Optional[float], Optional[str]]]:
+    """
+    Fondamentali dell'ultimo esercizio salvato di ogni ticker dello storico
+    
+    Calcolati come in get_company_data, con nome e settore dalla cache aziende.
+    
+    Returns:
+        Tuple (ticker, fondamentali, settore, market_cap, nome) per ScoreTable.load_fundamentals
+    """
+    records = []
+    if fundamentals_store is None:
+        return records
+    for ticker in fundamentals_store.tickers("annual"):
+        series = fundamentals_store.series(ticker, "annual")
+        index = series.locate() if series is not None else None
+        if index is None:
+            continue
+        statements = series.statements(index)
+        if not statements[RATIOS]:
+            continue
+        fundamentals, _ = compute_fundamentals(
+            statements[RATIOS], statements[INCOME_STATEMENT], statements[BALANCE_SHEET]
+        )
+        # market_cap di compute_fundamentals è totalAssets: la tabella usa quella della cache
+        cached = fmp_client.cache.get_company_by_symbol(ticker) if fmp_client.use_cache and fmp_client.cache else None
+        records.append((ticker, fundamentals, normalize_sector(cached.sector) if cached else None,
+                        cached.market_cap if cached else None, cached.name if cached else None))
+    return records
+
+async def seed_screener() -> None:
+    """Registra nel screener i fondamentali dello storico (errori solo registrati)"""
+    try:
+        # Lettura dei file dello storico e della cache: fuori dall'event loop
+        records = await asyncio.to_thread(stored_fundamentals)
+    except Exception as e:
+        print(f"Errore nel caricamento dello storico nel screener: {e}")
+        return
+    # La tabella è modificata solo dall'event loop
+    loaded = screener.load_fundamentals(records)
+    if loaded:
+        print(f"Screener: {loaded} aziende caricate dallo storico dei fondamentali")
+
+@app.get("/api/screener")
+async def screen_universe(signal: Optional[str] = None, sector: Optional[str] = None,
+                          min_score: Optional[float] = None, max_score: Optional[float] = None,
+                          pe: Optional[str] = None, pb: Optional[str] = None, roe: Optional[str] = None,
+                          min_market_cap: Optional[float] = None, max_market_cap: Optional[float] = None,
+                          sort: str = "score", order: str = "desc", offset: int = 0, limit: int = 50,
+                          profile: Optional[str] = None, weights: Optional[str] = None,
+                          threshold: Optional[float] = None):
+    """
+    Screener dell'universo in cache sui punteggi precalcolati (nessuna chiamata a FMP)
+    
+    Hanno un punteggio le aziende già analizzate il cui settore ha un benchmark;
+    le altre compaiono con score e final_signal nulli e sono escluse dai filtri
+    su segnale, punteggio e classificazioni. La tabella è allineata a cache
+    aziende e benchmark in background (run_screener_sync), non dalla richiesta.
+    
+    Args:
+        signal: Segnali ammessi, separati da virgola (Undervalued, Fairly valued, Overvalued)
+        sector: Settore
+        min_score, max_score: Intervallo del punteggio
+        pe, pb, roe: Classificazione richiesta per l'indicatore (Undervalued, Fair, Overvalued, N/A)
+        min_market_cap, max_market_cap: Intervallo di market cap
+        sort: score o market_cap
+        order: desc o asc
+        offset, limit: Paginazione (limit massimo SCREENER_MAX_LIMIT)
+        profile: Profilo di scoring (vedi /api/scoring/profiles)
+        weights: Pesi personalizzati, es. "PE:0.4,PB:0.3,ROE:0.3"
+        threshold: Soglia percentuale di classificazione degli indicatori
+    
+    Returns:
+        Totale delle aziende che soddisfano i filtri e la pagina richiesta
+    """
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail=f"Ordine non supportato: {order} (usa asc o desc)")
+    if offset < 0 or not 1 <= limit <= SCREENER_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"offset >= 0 e limit tra 1 e {SCREENER_MAX_LIMIT}")
+    classifications = {name: value for name, value in (("PE", pe), ("PB", pb), ("ROE", roe)) if value}
+    signals = [value.strip() for value in signal.split(",") if value.strip()] if signal else None
+    scoring_profile = request_profile(profile, weights, threshold)
+    
+    try:
+        result = screener.query(
+            signals=signals, sector=sector, min_score=min_score, max_score=max_score,
+            classifications=classifications, min_market_cap=min_market_cap,
+            max_market_cap=max_market_cap, sort=sort, descending=order == "desc",
+            offset=offset, limit=limit, profile=scoring_profile
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"offset": offset, "limit": limit, **result, "scoring_profile": scoring_profile.name,
+            "table": screener.get_stats()}
 
 @app.get("/api/test/{ticker}")
 async def test_ticker_data(ticker: str):
@@ -59,20 +393,13 @@ async def test_ticker_data(ticker: str):
     Endpoint di test per verificare i dati disponibili per un ticker
     """
     try:
-        # Test income statement
-        income_endpoint = f"https://financialmodelingprep.com/stable/income-statement?symbol={ticker}&period=annual&apikey={fmp_client.api_key}"
-        response = requests.get(income_endpoint)
-        income_data = response.json() if response.status_code == 200 else None
-        
-        # Test balance sheet
-        balance_endpoint = f"https://financialmodelingprep.com/stable/balance-sheet-statement?symbol={ticker}&period=annual&apikey={fmp_client.api_key}"
-        response = requests.get(balance_endpoint)
-        balance_data = response.json() if response.status_code == 200 else None
+        # Income statement, balance sheet e ratios in parallelo
+        plan = FetchPlan(ticker, fmp_client.api_key, fmp_client.transport)
+        await plan.require(INCOME_STATEMENT, BALANCE_SHEET, RATIOS).fetch()
         
-        # Test ratios
-        ratios_endpoint = f"https://financialmodelingprep.com/stable/ratios?symbol={ticker}&period=annual&apikey={fmp_client.api_key}"
-        response = requests.get(ratios_endpoint)
-        ratios_data = response.json() if response.status_code == 200 else None
+        income_data = plan.records(INCOME_STATEMENT)
+        balance_data = plan.records(BALANCE_SHEET)
+        ratios_data = plan.records(RATIOS)
         
         return {
             "ticker": ticker,
@@ -102,100 +429,49 @@ async def get_company_data(ticker: str):
         # Usa direttamente gli endpoint che sappiamo funzionare
         ticker_upper = ticker.upper()
         
-        # Ottieni ratios direttamente
-        ratios_endpoint = f"https://financialmodelingprep.com/stable/ratios?symbol={ticker_upper}&period=annual&apikey={fmp_client.api_key}"
-        response = requests.get(ratios_endpoint)
+        # Piano di fetch: profilo, ratios, income statement e balance sheet vengono
+        # richiesti in parallelo, ognuno una sola volta, e condivisi da ROE e market cap
+        plan = FetchPlan(ticker_upper, fmp_client.api_key, fmp_client.transport)
+        plan.require(PROFILE, RATIOS, INCOME_STATEMENT, BALANCE_SHEET)
+        with deadline_scope(get_analysis_deadline()):
+            timed_out = await plan.fetch(remaining_time())
         
-        if response.status_code != 200:
-            raise HTTPException(status_code=404, detail=f"Dati non disponibili per ticker {ticker}")
+        if timed_out:
+            print(f"Timeout per {ticker_upper}: {', '.join(timed_out)}")
+        if RATIOS in timed_out:
+            raise HTTPException(status_code=504, detail=f"Timeout nel recupero dati per ticker {ticker}")
+        if plan.error(RATIOS) is not None:
+            raise plan.error(RATIOS)
         
-        ratios_data = response.json()
-        if not ratios_data or len(ratios_data) == 0:
+        latest_ratios = plan.latest(RATIOS)
+        if not latest_ratios:
             raise HTTPException(status_code=404, detail=f"Dati non disponibili per ticker {ticker}")
         
-        latest_ratios = ratios_data[0]
+        fundamentals, market_cap = compute_fundamentals(
+            latest_ratios, plan.latest(INCOME_STATEMENT), plan.latest(BALANCE_SHEET)
+        )
         
-        # Estrai i dati necessari
-        pe_ratio = latest_ratios.get('priceToEarningsRatio')
-        pb_ratio = latest_ratios.get('priceToBookRatio')
+        # Gli anni precedenti sono già scaricati: vanno nello storico
+        await store_fundamentals_history(plan)
         
-        # Calcola ROE dal net income e equity
-        roe = latest_ratios.get('returnOnEquity')
-        if roe is not None:
-            roe_percent = round(roe * 100, 2)
-        else:
-            # Prova a calcolare ROE manualmente
-            try:
-                income_endpoint = f"https://financialmodelingprep.com/stable/income-statement?symbol={ticker_upper}&period=annual&apikey={fmp_client.api_key}"
-                income_response = requests.get(income_endpoint)
-                balance_endpoint = f"https://financialmodelingprep.com/stable/balance-sheet-statement?symbol={ticker_upper}&period=annual&apikey={fmp_client.api_key}"
-                balance_response = requests.get(balance_endpoint)
-                
-                if (income_response.status_code == 200 and balance_response.status_code == 200):
-                    income_data = income_response.json()
-                    balance_data = balance_response.json()
-                    
-                    if income_data and balance_data and len(income_data) > 0 and len(balance_data) > 0:
-                        net_income = income_data[0].get('netIncome')
-                        total_equity = balance_data[0].get('totalStockholdersEquity')
-                        
-                        if net_income and total_equity and total_equity != 0:
-                            roe_calculated = (net_income / total_equity) * 100
-                            roe_percent = round(roe_calculated, 2)
-            except Exception as e:
-                print(f"Errore nel calcolo ROE per {ticker_upper}: {e}")
-                roe_percent = None
-        
-        # Recupera market cap dai dati di balance sheet e income statement
-        market_cap = None
-        try:
-            # Prova a ottenere market cap da balance sheet
-            balance_endpoint = f"https://financialmodelingprep.com/stable/balance-sheet-statement?symbol={ticker_upper}&period=annual&apikey={fmp_client.api_key}"
-            balance_response = requests.get(balance_endpoint)
-            if balance_response.status_code == 200:
-                balance_data = balance_response.json()
-                if balance_data and len(balance_data) > 0:
-                    # Usa totalAssets come proxy per market cap (approssimativo)
-                    total_assets = balance_data[0].get('totalAssets')
-                    if total_assets:
-                        market_cap = total_assets
-        except Exception as e:
-            print(f"Errore nel recupero market cap per {ticker_upper}: {e}")
-        
-        # Per ora usiamo dati mock per nome e settore (da migliorare in futuro)
-        company_names = {
-            "AAPL": "Apple Inc.",
-            "MSFT": "Microsoft Corporation", 
-            "GOOGL": "Alphabet Inc.",
-            "AMZN": "Amazon.com Inc.",
-            "META": "Meta Platforms Inc.",
-            "NVDA": "NVIDIA Corporation",
-            "TSLA": "Tesla Inc."
-        }
-        
-        sectors = {
-            "AAPL": "Technology",
-            "MSFT": "Technology",
-            "GOOGL": "Technology", 
-            "AMZN": "Consumer Discretionary",
-            "META": "Technology",
-            "NVDA": "Technology",
-            "TSLA": "Consumer Discretionary"
-        }
+        # Nome, settore e capitalizzazione dal profilo FMP (già scaricato dal piano),
+        # altrimenti dalla cache aziende
+        name, sector, company_market_cap = await company_identity(ticker_upper, plan.latest(PROFILE))
         
         # Prepara la risposta
         response = {
             "ticker": ticker_upper,
-            "name": company_names.get(ticker_upper, f"{ticker_upper} Inc."),
-            "sector": sectors.get(ticker_upper, "Technology"),
+            "name": name or f"{ticker_upper} Inc.",
+            "sector": sector,
             "market_cap": market_cap,
-            "fundamentals": {
-                "PE": round(pe_ratio, 2) if pe_ratio else None,
-                "PB": round(pb_ratio, 2) if pb_ratio else None,
-                "ROE": roe_percent
-            }
+            "fundamentals": fundamentals
         }
         
+        # Fondamentali aggiornati: il punteggio del screener viene ricalcolato. Nella
+        # tabella la market cap è la capitalizzazione, non il proxy totalAssets
+        screener.update_fundamentals(ticker_upper, fundamentals, sector=sector,
+                                     market_cap=company_market_cap, name=name)
+        
         return response
         
     except HTTPException:
@@ -203,97 +479,399 @@ async def get_company_data(ticker: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore nel recupero dati: {str(e)}")
 
+async def company_identity(ticker: str, profile: Optional[Dict]
+                           ) -> Tuple[Optional[str], Optional[str], Optional[float]]:
+    """
+    Nome, settore e capitalizzazione di mercato di un'azienda
+    
+    Il profilo FMP ha la precedenza; in sua assenza (o se incompleto) si usa
+    la cache aziende. Il settore è sempre nel formato del stock-screener FMP
+    (vedi normalize_sector), l'unico accettato dai benchmark.
+    
+    Returns:
+        Tupla (nome, settore, market_cap), con None per i valori non disponibili
+    """
+    profile = profile or {}
+    name = profile.get("companyName")
+    sector = normalize_sector(profile.get("sector"))
+    market_cap = next((value for value in (profile.get("marketCap"), profile.get("mktCap"))
+                       if isinstance(value, (int, float)) and value > 0), None)
+    if (name is None or sector is None or market_cap is None) and fmp_client.use_cache and fmp_client.cache:
+        # La lettura può attendere il lock tra processi: fuori dall'event loop
+        cached = await asyncio.to_thread(fmp_client.cache.get_company_by_symbol, ticker)
+        if cached is not None:
+            name = name or cached.name
+            sector = sector or normalize_sector(cached.sector)
+            market_cap = market_cap or cached.market_cap
+    return name, sector, market_cap
+
+async def store_fundamentals_history(plan: FetchPlan) -> None:
+    """Salva nello storico tutti i periodi scaricati da un piano (errori solo registrati)"""
+    if fundamentals_store is None:
+        return
+    try:
+        await asyncio.to_thread(fundamentals_store.append_plan, plan)
+    except Exception as e:
+        print(f"Errore nel salvataggio dello storico di {plan.ticker}: {e}")
+
+@app.get("/api/company/{ticker}/history")
+async def get_company_history(ticker: str, period: str = "annual", date: Optional[str] = None,
+                              limit: int = 10):
+    """
+    Storico dei fondamentali di una società, dal periodo più recente
+    
+    I periodi sono letti dall'archivio locale; solo un ticker senza storico
+    per il periodo richiesto viene scaricato da FMP (e salvato).
+    
+    Args:
+        ticker: Simbolo ticker dell'azienda
+        period: annual o quarter
+        date: Restituisce i periodi chiusi entro questa data (YYYY-MM-DD)
+        limit: Numero massimo di periodi (massimo HISTORY_MAX_LIMIT)
+    
+    Returns:
+        Periodi con data, fondamentali (PE, PB, ROE) e valori degli statement
+    """
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"Periodo non supportato: {period} (validi: {', '.join(PERIODS)})")
+    if not 1 <= limit <= HISTORY_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit tra 1 e {HISTORY_MAX_LIMIT}")
+    ticker_upper = ticker.upper()
+    
+    # Apertura e mappatura del file: fuori dall'event loop, come le altre letture dell'archivio
+    series = (await asyncio.to_thread(fundamentals_store.series, ticker_upper, period)
+              if fundamentals_store is not None else None)
+    source = "store"
+    if series is None:
+        plan = FetchPlan(ticker_upper, fmp_client.api_key, fmp_client.transport, period=period)
+        plan.require(*STATEMENTS)
+        with deadline_scope(get_analysis_deadline()):
+            timed_out = await plan.fetch(remaining_time())
+        if len(timed_out) == len(STATEMENTS):
+            raise HTTPException(status_code=504, detail=f"Timeout nel recupero dati per ticker {ticker}")
+        await store_fundamentals_history(plan)
+        series = FundamentalsSeries.from_statements(
+            ticker_upper, period, {resource: plan.records(resource) for resource in STATEMENTS}
+        )
+        source = "fmp"
+    
+    try:
+        last = series.locate(date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if last is None:
+        raise HTTPException(status_code=404, detail=f"Storico non disponibile per ticker {ticker}")
+    
+    dates = series.dates()
+    periods = []
+    for index in range(last, max(last - limit, -1), -1):
+        statements = series.statements(index)
+        fundamentals, market_cap = compute_fundamentals(
+            statements[RATIOS] or {}, statements[INCOME_STATEMENT], statements[BALANCE_SHEET]
+        )
+        periods.append({
+            "date": dates[index],
+            "fundamentals": fundamentals,
+            "market_cap": market_cap,
+            "statements": statements
+        })
+    
+    return {
+        "ticker": ticker_upper,
+        "period": period,
+        "available": len(series),
+        "source": source,
+        "periods": periods
+    }
+
+def validate_benchmark_options(statistic: Optional[str], top: Optional[int]) -> None:
+    """Verifica statistica e numero di peer richiesti per il benchmark"""
+    if statistic is not None and statistic not in STATISTICS:
+        raise HTTPException(status_code=400,
+                            detail=f"Statistica non supportata: {statistic} (valide: {', '.join(STATISTICS)})")
+    if top is not None and top < 1:
+        raise HTTPException(status_code=400, detail="top deve essere almeno 1")
+
 @app.get("/api/sector/{sector}")
-async def get_sector_benchmark(sector: str):
+async def get_sector_benchmark(sector: str, statistic: Optional[str] = None, top: Optional[int] = None):
     """
     Endpoint per calcolare benchmark settoriale dinamico
     
+    Con lo scheduler abilitato restituisce soltanto benchmark precalcolati, in
+    memoria o nella cache su disco condivisa: anche un worker in standby (lo
+    scheduler attivo è in un altro worker) non calcola nulla durante la
+    richiesta. Un settore noto non ancora calcolato viene anticipato e la
+    risposta è 503 con Retry-After. Senza scheduler il benchmark è servito
+    dall'ultimo calcolo e ricalcolato in background quando supera la validità.
+    
     Args:
-        sector: Nome del settore (es. Technology)
+        sector: Nome del settore (es. Technology; i nomi GICS come "Health Care"
+            sono convertiti nei nomi FMP)
+        statistic: Statistica del benchmark: mean, median (default),
+            trimmed_mean o winsorized_mean
+        top: Usa solo le prime N aziende per market cap tra quelle calcolate
     
     Returns:
-        Benchmark con media delle prime 10 aziende del settore
+        Benchmark del settore con statistiche e ratios dei peer, data del
+        calcolo (computed_at) e flag stale
     """
+    validate_benchmark_options(statistic, top)
+    sector = normalize_sector(sector)
+    if sector is None:
+        raise HTTPException(status_code=404, detail="Settore non disponibile")
     try:
-        # Per ora usiamo benchmark mock basati su dati reali del settore Technology
-        # In futuro questo sarà sostituito dal calcolo dinamico reale
-        
-        benchmark_mock = {
-            "Technology": {
-                "sector": "Technology",
-                "companies_used": ["AAPL", "MSFT", "GOOGL", "AMZN", "META", "NVDA", "ORCL", "CRM", "TSM", "INTC"],
-                "benchmark": {
-                    "PE": 25.2,
-                    "PB": 10.1,
-                    "ROE": 16.5
-                }
-            },
-            "Consumer Discretionary": {
-                "sector": "Consumer Discretionary", 
-                "companies_used": ["AMZN", "TSLA", "HD", "MCD", "NKE", "SBUX", "LOW", "BKNG", "TJX", "CMG"],
-                "benchmark": {
-                    "PE": 22.8,
-                    "PB": 8.5,
-                    "ROE": 18.2
-                }
-            },
-            "Healthcare": {
-                "sector": "Healthcare",
-                "companies_used": ["JNJ", "UNH", "PFE", "ABBV", "MRK", "TMO", "ABT", "DHR", "BMY", "AMGN"],
-                "benchmark": {
-                    "PE": 18.5,
-                    "PB": 6.2,
-                    "ROE": 12.8
-                }
-            }
-        }
-        
-        # Restituisce il benchmark per il settore richiesto o usa Technology come default
-        benchmark_data = benchmark_mock.get(sector, benchmark_mock["Technology"])
-        
-        return benchmark_data
-        
+        return await sector_analyzer.get_benchmark(sector, refresh=not get_benchmark_scheduler_enabled(),
+                                                   statistic=statistic, top=top)
+    except LookupError as e:
+        if not benchmark_scheduler.request(sector):
+            raise HTTPException(status_code=404, detail=f"Settore sconosciuto: {sector}")
+        if benchmark_scheduler.has_no_companies(sector):
+            raise HTTPException(status_code=404, detail=f"Nessuna azienda trovata per il settore: {sector}")
+        raise HTTPException(status_code=503, detail=str(e),
+                            headers={"Retry-After": str(BENCHMARK_RETRY_AFTER)})
+    except ScreenerUnavailableError as e:
+        # Errore temporaneo di FMP: il settore non è vuoto
+        raise HTTPException(status_code=503, detail=str(e),
+                            headers={"Retry-After": str(BENCHMARK_RETRY_AFTER)})
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore nel calcolo benchmark: {str(e)}")
 
+@app.post("/api/analysis/batch")
+async def analyze_batch(request: BatchAnalysisRequest):
+    """
+    Analisi di più ticker in una sola chiamata
+    
+    I ticker vengono deduplicati; i dati sono recuperati in parallelo (al massimo
+    BATCH_CONCURRENCY alla volta) attraverso il trasporto e la cache condivisi,
+    il benchmark è calcolato una volta per settore e lo scoring avviene insieme
+    alla fine. Gli errori dei singoli ticker sono restituiti nel risultato
+    corrispondente senza far fallire l'intero batch.
+    
+    Args:
+        request: Corpo con la lista "tickers" e le opzioni di benchmark e scoring
+    
+    Returns:
+        Risultati nell'ordine dei ticker richiesti (senza duplicati)
+    """
+    validate_benchmark_options(request.statistic, request.top)
+    profile = request_profile(request.profile, request.weights, request.threshold)
+    tickers = normalize_tickers(request.tickers)
+    if not tickers:
+        raise HTTPException(status_code=400, detail="Nessun ticker valido nella richiesta")
+    max_tickers = get_batch_max_tickers()
+    if len(tickers) > max_tickers:
+        raise HTTPException(status_code=413, detail=f"Massimo {max_tickers} ticker per richiesta batch")
+    
+    semaphore = asyncio.Semaphore(get_batch_concurrency())
+    
+    async def fetch_company(ticker: str) -> Dict:
+        async with semaphore:
+            return await get_company_data(ticker)
+    
+    company_results = await asyncio.gather(*(fetch_company(t) for t in tickers), return_exceptions=True)
+    
+    # Un benchmark per settore, condiviso da tutti i ticker del settore
+    benchmarks = {}
+    for company_data in company_results:
+        if isinstance(company_data, BaseException):
+            continue
+        sector = company_data["sector"]
+        if sector not in benchmarks:
+            try:
+                benchmarks[sector] = await get_sector_benchmark(sector, request.statistic, request.top)
+            except HTTPException as e:
+                benchmarks[sector] = e
+    
+    results = []
+    scored = []
+    for ticker, company_data in zip(tickers, company_results):
+        if not isinstance(company_data, BaseException):
+            benchmark_data = benchmarks[company_data["sector"]]
+            if isinstance(benchmark_data, BaseException):
+                company_data = benchmark_data
+        if isinstance(company_data, BaseException):
+            results.append({"ticker": ticker, "error": describe_error(company_data)})
+            continue
+        scored.append((len(results), ticker, company_data, benchmark_data))
+        results.append(None)
+    
+    # Scoring vettorizzato di tutti i ticker riusciti in un solo passaggio
+    if scored:
+        analyses = scoring_system.unpack_many(scoring_system.analyze_many(
+            {name: [item[2]["fundamentals"].get(name) for item in scored] for name in INDICATORS},
+            {name: [item[3]["benchmark"].get(name) for item in scored] for name in INDICATORS},
+            profile
+        ))
+        for (position, ticker, company_data, benchmark_data), analysis_result in zip(scored, analyses):
+            results[position] = build_analysis_response(ticker, company_data, benchmark_data,
+                                                        analysis_result, profile)
+    
+    failed = sum(1 for result in results if "error" in result)
+    return {
+        "requested": len(request.tickers),
+        "unique": len(tickers),
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "results": results
+    }
+
+async def get_shared_benchmark(sector: str, benchmarks: Dict[str, asyncio.Future],
+                               statistic: Optional[str] = None, top: Optional[int] = None) -> Dict:
+    """Benchmark di settore calcolato una sola volta per tutti i ticker di un batch"""
+    if sector not in benchmarks:
+        benchmarks[sector] = asyncio.ensure_future(get_sector_benchmark(sector, statistic, top))
+    # shield: la cancellazione di un ticker non interrompe il calcolo condiviso
+    return await asyncio.shield(benchmarks[sector])
+
+async def analyze_batch_item(index: int, ticker: str, benchmarks: Dict[str, asyncio.Future],
+                             statistic: Optional[str] = None, top: Optional[int] = None,
+                             profile: Optional[ScoringProfile] = None) -> Dict:
+    """
+    Analizza un singolo ticker di un batch in streaming
+    
+    Returns:
+        Risultato dell'analisi o errore, con la posizione del ticker nel batch
+    """
+    try:
+        company_data = await get_company_data(ticker)
+        benchmark_data = await get_shared_benchmark(company_data["sector"], benchmarks, statistic, top)
+        profile = profile or scoring_system.profile
+        analysis_result = scoring_system.analyze_company(
+            company_data["fundamentals"],
+            benchmark_data["benchmark"],
+            profile
+        )
+        result = build_analysis_response(ticker, company_data, benchmark_data, analysis_result, profile)
+    except Exception as e:
+        result = {"ticker": ticker, "error": describe_error(e)}
+    return {"index": index, **result}
+
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream"
+}
+
+def format_stream_event(event: str, payload: Dict, stream_format: str) -> str:
+    """Serializza un evento come riga NDJSON o come messaggio Server-Sent Events"""
+    data = json.dumps(payload, separators=(",", ":"))
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {data}\n\n"
+    return data + "\n"
+
+@app.post("/api/analysis/batch/stream")
+async def analyze_batch_stream(request: BatchAnalysisRequest, format: str = "ndjson"):
+    """
+    Analisi batch in streaming: ogni risultato è inviato appena pronto
+    
+    I ticker sono elaborati al massimo BATCH_CONCURRENCY alla volta e i
+    risultati escono nell'ordine di completamento (il campo "index" indica la
+    posizione nel batch), quindi il primo risultato non dipende dalla
+    dimensione del batch. Se il client legge lentamente l'elaborazione si
+    ferma; se si disconnette il lavoro in corso viene cancellato.
+    
+    Args:
+        request: Corpo con la lista "tickers"
+        format: "ndjson" (una riga JSON per risultato) o "sse" (Server-Sent Events)
+    
+    Returns:
+        Stream di eventi "result" seguito da un evento "summary"
+    """
+    stream_format = format.lower()
+    if stream_format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato non supportato: {format} (usa ndjson o sse)")
+    validate_benchmark_options(request.statistic, request.top)
+    profile = request_profile(request.profile, request.weights, request.threshold)
+    tickers = normalize_tickers(request.tickers)
+    if not tickers:
+        raise HTTPException(status_code=400, detail="Nessun ticker valido nella richiesta")
+    max_tickers = get_batch_max_tickers()
+    if len(tickers) > max_tickers:
+        raise HTTPException(status_code=413, detail=f"Massimo {max_tickers} ticker per richiesta batch")
+    
+    async def events():
+        benchmarks: Dict[str, asyncio.Future] = {}
+        succeeded = failed = 0
+        try:
+            results = bounded_as_completed(
+                enumerate(tickers),
+                lambda item: analyze_batch_item(item[0], item[1], benchmarks,
+                                                request.statistic, request.top, profile),
+                get_batch_concurrency()
+            )
+            async for result in results:
+                if "error" in result:
+                    failed += 1
+                else:
+                    succeeded += 1
+                yield format_stream_event("result", result, stream_format)
+            
+            yield format_stream_event("summary", {
+                "summary": {
+                    "requested": len(request.tickers),
+                    "unique": len(tickers),
+                    "succeeded": succeeded,
+                    "failed": failed
+                }
+            }, stream_format)
+        finally:
+            # Client disconnesso o stream chiuso: nessun benchmark resta in volo
+            for future in benchmarks.values():
+                future.cancel()
+    
+    return StreamingResponse(
+        events(),
+        media_type=STREAM_FORMATS[stream_format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/analysis/{ticker}")
-async def get_company_analysis(ticker: str):
+async def get_company_analysis(ticker: str, statistic: Optional[str] = None, top: Optional[int] = None,
+                               profile: Optional[str] = None, weights: Optional[str] = None,
+                               threshold: Optional[float] = None):
     """
     Endpoint per analisi completa con scoring aggregato
     
     Args:
         ticker: Simbolo ticker dell'azienda
+        statistic: Statistica del benchmark di settore (default: median)
+        top: Peer del benchmark (prime N aziende per market cap)
+        profile: Profilo di scoring (vedi /api/scoring/profiles)
+        weights: Pesi personalizzati, es. "PE:0.4,PB:0.3,ROE:0.3"
+        threshold: Soglia percentuale di classificazione degli indicatori
     
     Returns:
         Analisi completa con confronto settoriale e segnale finale
     """
+    validate_benchmark_options(statistic, top)
+    scoring_profile = request_profile(profile, weights, threshold)
     try:
         # Ottieni dati aziendali
         company_data = await get_company_data(ticker)
         sector = company_data["sector"]
+        if sector is None:
+            # Né il profilo FMP né la cache indicano il settore: nessun benchmark di confronto
+            raise HTTPException(status_code=404,
+                                detail=f"Settore non disponibile per {ticker.upper()}: analisi settoriale non possibile")
         
         # Ottieni benchmark settoriale
-        benchmark_data = await get_sector_benchmark(sector)
+        benchmark_data = await get_sector_benchmark(sector, statistic, top)
         
         # Calcola scoring e segnali
         analysis_result = scoring_system.analyze_company(
             company_data["fundamentals"],
-            benchmark_data["benchmark"]
+            benchmark_data["benchmark"],
+            scoring_profile
         )
         
-        # Prepara risposta completa
-        response = {
-            "ticker": ticker.upper(),
-            "sector": sector,
-            "fundamentals": company_data["fundamentals"],
-            "benchmark": benchmark_data["benchmark"],
-            "indicators": analysis_result["indicators"],
-            "score": analysis_result["score"],
-            "final_signal": analysis_result["final_signal"]
-        }
-        
-        return response
+        return build_analysis_response(ticker, company_data, benchmark_data, analysis_result, scoring_profile)
         
+    except HTTPException as e:
+        # Dati o settore non disponibili (404) e timeout non sono errori interni
+        if e.status_code in (404, 503, 504):
+            raise
+        raise HTTPException(status_code=500, detail=f"Errore nell'analisi: {e.detail}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore nell'analisi: {str(e)}")
 
@@ -301,33 +879,31 @@ async def get_company_analysis(ticker: str):
 async def search_company_by_name(company_name: str):
     """
     Cerca un'azienda per nome e restituisce il ticker
-    Prima cerca nella cache Fortune 500, poi nell'API se necessario
+    Prima cerca nella cache Fortune 500 (tollerando errori di battitura),
+    poi nell'API se nessuna corrispondenza è abbastanza affidabile
     
     Args:
-        company_name: Nome dell'azienda da cercare (es. "Apple", "Microsoft")
+        company_name: Nome dell'azienda da cercare (es. "Apple", "Microsft")
     
     Returns:
         Dizionario con ticker trovato e informazioni sulla fonte
     """
     try:
-        # Usa il sistema di cache Fortune 500 che abbiamo implementato
-        ticker = fmp_client.find_ticker_by_name(company_name)
+        # Un'unica ricerca: cache Fortune 500 (fuzzy), poi API se il punteggio è basso
+        company, source, score = await fmp_client.resolve_company_async(company_name)
         
-        if ticker:
-            # Verifica se è stata trovata nella cache o tramite API
-            cached_company = fmp_client.search_cached_company(company_name)
-            source = "cache" if cached_company else "api"
-            
+        if company:
             return {
                 "company_name": company_name,
-                "ticker": ticker,
+                "ticker": company.symbol,
                 "found": True,
                 "source": source,
+                "score": score,
                 "company_info": {
-                    "name": cached_company.name if cached_company else company_name,
-                    "exchange": cached_company.exchange if cached_company else None,
-                    "sector": cached_company.sector if cached_company else None
-                } if cached_company else None
+                    "name": company.name,
+                    "exchange": company.exchange,
+                    "sector": company.sector
+                }
             }
         else:
             return {
@@ -351,28 +927,25 @@ async def get_search_suggestions(partial_name: str):
     Fornisce suggerimenti di ricerca basati su aziende Fortune 500 in cache
     
     Args:
-        partial_name: Nome parziale dell'azienda (es. "App" per "Apple")
+        partial_name: Nome o ticker parziale dell'azienda (es. "App" per "Apple", "MS" per "MSFT")
     
     Returns:
-        Lista di suggerimenti con nomi e ticker
+        Lista di suggerimenti con nomi e ticker, ordinati per market cap
     """
     try:
         suggestions = []
         
-        # Cerca nella cache Fortune 500 per suggerimenti
+        # Indice per prefisso di nome e ticker: una voce per azienda,
+        # ordinate per market cap, al massimo 10 suggerimenti
         if fmp_client.use_cache and fmp_client.cache:
-            for key, company in fmp_client.cache.cache.items():
-                # Filtra solo le aziende reali (non le chiavi per nome)
-                if not key.startswith("name_") and company.name.lower().startswith(partial_name.lower()):
-                    suggestions.append({
-                        "name": company.name,
-                        "ticker": company.symbol,
-                        "exchange": company.exchange,
-                        "sector": company.sector
-                    })
-        
-        # Limita a 10 suggerimenti
-        suggestions = suggestions[:10]
+            companies = await asyncio.to_thread(fmp_client.cache.suggest, partial_name, 10)
+            for company in companies:
+                suggestions.append({
+                    "name": company.name,
+                    "ticker": company.symbol,
+                    "exchange": company.exchange,
+                    "sector": company.sector
+                })
         
         return {
             "partial_name": partial_name,
@@ -398,7 +971,7 @@ async def get_analyst_recommendations(ticker: str):
         ticker_upper = ticker.upper()
         
         # Recupera il consenso degli analisti
-        consensus = analyst_client.get_analyst_consensus(ticker_upper)
+        consensus = await analyst_client.get_analyst_consensus_async(ticker_upper)
         
         if not consensus:
             return {
@@ -446,11 +1019,25 @@ async def get_complete_analysis(ticker: str):
         Analisi completa con scoring e suggerimenti degli analisti separati
     """
     try:
-        # Ottieni l'analisi con scoring
-        analysis_data = await get_company_analysis(ticker)
+        # Scoring e suggerimenti degli analisti sono indipendenti: partono in
+        # parallelo con una scadenza comune. Se il ramo analisti scade si
+        # restituisce comunque lo scoring (risposta parziale).
+        with deadline_scope(get_analysis_deadline()):
+            results, timed_out = await gather_with_deadline({
+                "analysis": get_company_analysis(ticker),
+                "analyst_recommendations": get_analyst_recommendations(ticker)
+            }, remaining_time() + DEADLINE_GRACE)
+        
+        if "analysis" in timed_out:
+            raise HTTPException(status_code=504, detail=f"Timeout nell'analisi di {ticker.upper()}")
+        analysis_data = results["analysis"]
+        if isinstance(analysis_data, Exception):
+            raise analysis_data
         
-        # Ottieni i suggerimenti degli analisti
-        analyst_data = await get_analyst_recommendations(ticker)
+        analyst_data = results.get("analyst_recommendations")
+        if isinstance(analyst_data, Exception):
+            print(f"Errore nel recupero suggerimenti analisti per {ticker.upper()}: {analyst_data}")
+            analyst_data = None
         
         # Combina i dati mantenendo la separazione
         complete_response = {
@@ -461,7 +1048,9 @@ async def get_complete_analysis(ticker: str):
             "indicators": analysis_data["indicators"],
             "score": analysis_data["score"],
             "final_signal": analysis_data["final_signal"],
-            "analyst_recommendations": analyst_data["analyst_recommendations"],
+            "analyst_recommendations": analyst_data["analyst_recommendations"] if analyst_data else None,
+            "partial": bool(timed_out) or analyst_data is None,
+            "timed_out": timed_out,
             "disclaimer": {
                 "scoring_system": "Il sistema di scoring è basato esclusivamente su indicatori finanziari fondamentali",
                 "analyst_recommendations": "I suggerimenti degli analisti sono forniti come dati informativi separati e non influenzano il calcolo dello score"
@@ -470,6 +1059,10 @@ async def get_complete_analysis(ticker: str):
         
         return complete_response
         
+    except HTTPException as e:
+        if e.status_code in (404, 503, 504):
+            raise
+        raise HTTPException(status_code=500, detail=f"Errore nell'analisi completa: {e.detail}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore nell'analisi completa: {str(e)}")
 
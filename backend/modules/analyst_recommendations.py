@@ -5,11 +5,15 @@ Modulo per recuperare e gestire i suggerimenti degli analisti tramite Financial
 I dati vengono mantenuti separati dal sistema di scoring per non influenzare i calcoli.
 """
 
-import requests
+import asyncio
 import os
 from typing import Optional, Dict, List
 from dataclasses import dataclass
 
+import httpx
+
+from .http_client import FMPTransport, get_transport
+
 
 @dataclass
 class AnalystConsensus:
@@ -49,12 +53,13 @@ class AnalystConsensus:
 class AnalystRecommendationsClient:
     """Client per recuperare i suggerimenti degli analisti"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, transport: Optional[FMPTransport] = None):
         """
         Inizializza il client con la chiave API
         
         Args:
             api_key: Chiave API di Financial Modeling Prep
+            transport: Trasporto HTTP condiviso (default: get_transport())
         """
         self.api_key = api_key or os.getenv('FMP_API_KEY')
         if not self.api_key:
@@ -64,9 +69,9 @@ class AnalystRecommendationsClient:
             )
         
         self.base_url = "https://financialmodelingprep.com/stable"
-        self.session = requests.Session()
+        self.transport = transport or get_transport()
     
-    def get_analyst_consensus(self, symbol: str) -> Optional[AnalystConsensus]:
+    async def get_analyst_consensus_async(self, symbol: str) -> Optional[AnalystConsensus]:
         """
         Recupera il consenso degli analisti per un simbolo
         
@@ -83,10 +88,12 @@ class AnalystRecommendationsClient:
                 'apikey': self.api_key
             }
             
-            response = self.session.get(url, params=params, timeout=10)
-            response.raise_for_status()
+            response = await self.transport.request(url, params)
+            if response.status_code != 200:
+                print(f"Errore nella richiesta API per {symbol}: HTTP {response.status_code}")
+                return None
             
-            data = response.json()
+            data = response.data
             
             if not data or len(data) == 0:
                 return None
@@ -104,7 +111,7 @@ class AnalystRecommendationsClient:
                 consensus=consensus_data['consensus']
             )
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Errore nella richiesta API per {symbol}: {e}")
             return None
         except (KeyError, ValueError) as e:
@@ -114,7 +121,11 @@ class AnalystRecommendationsClient:
             print(f"Errore imprevisto per {symbol}: {e}")
             return None
     
-    def get_multiple_consensus(self, symbols: List[str]) -> Dict[str, Optional[AnalystConsensus]]:
+    def get_analyst_consensus(self, symbol: str) -> Optional[AnalystConsensus]:
+        """Versione sincrona di get_analyst_consensus_async"""
+        return self.transport.run(self.get_analyst_consensus_async(symbol))
+    
+    async def get_multiple_consensus_async(self, symbols: List[str]) -> Dict[str, Optional[AnalystConsensus]]:
         """
         Recupera il consenso degli analisti per più simboli
         
@@ -124,10 +135,12 @@ class AnalystRecommendationsClient:
         Returns:
             Dizionario con simbolo come chiave e AnalystConsensus come valore
         """
-        results = {}
-        for symbol in symbols:
-            results[symbol] = self.get_analyst_consensus(symbol)
-        return results
+        results = await asyncio.gather(*(self.get_analyst_consensus_async(s) for s in symbols))
+        return dict(zip(symbols, results))
+    
+    def get_multiple_consensus(self, symbols: List[str]) -> Dict[str, Optional[AnalystConsensus]]:
+        """Versione sincrona di get_multiple_consensus_async"""
+        return self.transport.run(self.get_multiple_consensus_async(symbols))
 
 
 def test_analyst_recommendations():
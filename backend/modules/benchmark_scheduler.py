@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Benchmark Scheduler Module
+Ricalcolo periodico dei benchmark settoriali fuori dal percorso delle richieste.
+
+Lo scheduler gira nell'event loop dell'applicazione (avviato dal lifespan di
+FastAPI): ad ogni ciclo ricalcola i settori noti uno alla volta, distanziati
+di `stagger` secondi per distribuire il consumo della quota FMP. I benchmark
+sono salvati dall'analizzatore in memoria e nella cache su disco, quindi un
+settore calcolato da poco (da un altro worker o prima di un riavvio) viene
+saltato.
+
+I gestori delle richieste leggono soltanto i benchmark precalcolati; un
+settore noto non ancora disponibile può essere anticipato con `request()`.
+Un settore per cui lo screener non restituisce aziende non viene anticipato
+e, se resta vuoto, viene ritentato a cicli sempre più distanziati.
+
+Con più worker un lock tra processi (es. FileLock) rende attivo un solo
+scheduler: gli altri restano in attesa, servono i benchmark dalla cache su
+disco (calcolandoli solo se assenti) e subentrano se il lock si libera.
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from .sector_analysis import NoCompaniesError
+
+# Settori del stock-screener FMP, ricalcolati ad ogni ciclo
+DEFAULT_SECTORS = (
+    "Technology",
+    "Healthcare",
+    "Financial Services",
+    "Consumer Cyclical",
+    "Consumer Defensive",
+    "Communication Services",
+    "Industrials",
+    "Energy",
+    "Utilities",
+    "Real Estate",
+    "Basic Materials",
+)
+
+# Lock che designa lo scheduler attivo tra i worker
+DEFAULT_LOCK_PATH = os.path.join("cache", "benchmark_scheduler.lock")
+
+# Cicli saltati al massimo da un settore rimasto più volte senza aziende
+EMPTY_SECTOR_MAX_SKIP = 7
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp is not None else None
+
+
+class BenchmarkScheduler:
+    """Scheduler asincrono che ricalcola i benchmark di tutti i settori noti"""
+
+    def __init__(self, analyzer, sectors: Callable[[], Iterable[str]] = lambda: DEFAULT_SECTORS,
+                 interval: float = 43200, stagger: float = 30, lock=None, standby_retry: float = 60):
+        """
+        Inizializza lo scheduler
+
+        Args:
+            analyzer: Istanza di SectorAnalyzer
+            sectors: Funzione che restituisce i settori noti (letta ad ogni ciclo)
+            interval: Secondi tra l'inizio di due cicli
+            stagger: Secondi di attesa tra il calcolo di due settori
+            lock: Lock tra processi con acquire(blocking=False) e release();
+                  solo lo scheduler che lo ottiene è attivo
+            standby_retry: Secondi tra due tentativi di acquisire il lock
+        """
+        self.analyzer = analyzer
+        self._sectors = sectors
+        self.interval = interval
+        self.stagger = stagger
+        self._lock = lock
+        self.standby_retry = standby_retry
+        self.leader = False
+
+        self._task: Optional[asyncio.Future] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._priority: List[str] = []
+        self.current: Optional[str] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+        self.next_run: Optional[float] = None
+        self.sector_status: Dict[str, Dict[str, Any]] = {}
+        # Settori senza aziende: esiti vuoti consecutivi e cicli ancora da saltare
+        self._empty_runs: Dict[str, int] = {}
+        self._skip: Dict[str, int] = {}
+
+    @property
+    def running(self) -> bool:
+        """True se il ciclo di ricalcolo è attivo (in attesa del lock non lo è)"""
+        return self._started and self.leader
+
+    @property
+    def _started(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def known_sectors(self) -> List[str]:
+        """Settori da ricalcolare, senza duplicati e nell'ordine di provenienza"""
+        return list(dict.fromkeys(sector for sector in self._sectors() if sector))
+
+    def start(self) -> None:
+        """Avvia lo scheduler nell'event loop corrente"""
+        if self._started:
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Ferma lo scheduler, interrompendo il calcolo in corso"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.current = None
+        self.next_run = None
+
+    def request(self, sector: str) -> bool:
+        """
+        Anticipa il calcolo di un settore noto non ancora disponibile
+
+        Args:
+            sector: Nome del settore
+
+        Returns:
+            True se il settore è noto (e quindi verrà calcolato), False altrimenti
+        """
+        if sector not in self.known_sectors():
+            return False
+        # Senza aziende all'ultimo calcolo: si attende il ciclo successivo
+        if self.has_no_companies(sector):
+            return True
+        if self.running and sector != self.current and sector not in self._priority:
+            self._priority.append(sector)
+            self._wake.set()
+        return True
+
+    def has_no_companies(self, sector: str) -> bool:
+        """True se l'ultimo calcolo del settore non ha trovato aziende"""
+        return self.sector_status.get(sector, {}).get("no_companies", False)
+
+    async def _run(self) -> None:
+        if self._lock is not None:
+            # Un solo scheduler attivo tra i worker: gli altri attendono il lock
+            while not self._lock.acquire(blocking=False):
+                await asyncio.sleep(self.standby_retry)
+        self.leader = True
+        try:
+            while True:
+                await self._run_cycle()
+                # Tra un ciclo e l'altro si servono solo le richieste anticipate
+                while True:
+                    remaining = self.next_run - time.time()
+                    if remaining <= 0:
+                        break
+                    await self._wait(remaining)
+                    while self._priority:
+                        await self._refresh(self._priority.pop(0), {"computed": 0, "skipped": 0, "failed": 0})
+        finally:
+            self.leader = False
+            if self._lock is not None:
+                self._lock.release()
+
+    async def _run_cycle(self) -> None:
+        """Ricalcola tutti i settori noti, uno alla volta"""
+        started = time.time()
+        self.next_run = None
+        summary = {"started_at": _isoformat(started), "computed": 0, "skipped": 0, "failed": 0}
+        pending = self.known_sectors()
+        delay = 0.0
+
+        while True:
+            await self._wait(delay)
+            if self._priority:
+                sector = self._priority.pop(0)
+                if sector in pending:
+                    pending.remove(sector)
+            elif pending:
+                sector = pending.pop(0)
+                if self._skip.get(sector):
+                    # Rimasto senza aziende nei cicli precedenti
+                    self._skip[sector] -= 1
+                    summary["skipped"] += 1
+                    delay = 0.0
+                    continue
+            else:
+                break
+            # L'attesa serve solo dopo un calcolo effettivo
+            delay = self.stagger if await self._refresh(sector, summary) else 0.0
+
+        finished = time.time()
+        summary["finished_at"] = _isoformat(finished)
+        summary["duration"] = round(finished - started, 2)
+        self.last_run = summary
+        self.next_run = started + self.interval
+        print(f"Benchmark settoriali ricalcolati: {summary}")
+
+    async def _refresh(self, sector: str, summary: Dict[str, Any]) -> bool:
+        """
+        Ricalcola un settore se il benchmark disponibile non è recente
+
+        Returns:
+            True se è stato eseguito un calcolo (riuscito o no)
+        """
+        # Calcolato da poco da un altro worker o prima di un riavvio
+        age = await self.analyzer.get_benchmark_age(sector)
+        if age is not None and age < self.interval / 2:
+            summary["skipped"] += 1
+            return False
+
+        self.current = sector
+        started = time.time()
+        try:
+            await self.analyzer.refresh_benchmark(sector)
+        except Exception as e:
+            summary["failed"] += 1
+            # Solo una risposta valida senza aziende: un errore di FMP (429, 5xx,
+            # timeout) è temporaneo e il settore va ritentato al ciclo successivo
+            no_companies = isinstance(e, NoCompaniesError)
+            self.sector_status[sector] = {
+                "last_run": _isoformat(started),
+                "error": str(e),
+                "no_companies": no_companies
+            }
+            if no_companies:
+                # Nuovi tentativi sempre più distanziati: 0, 1, 3, 7 cicli saltati
+                runs = self._empty_runs[sector] = self._empty_runs.get(sector, 0) + 1
+                self._skip[sector] = min(2 ** (runs - 1) - 1, EMPTY_SECTOR_MAX_SKIP)
+                self.sector_status[sector]["empty_runs"] = runs
+            print(f"Errore nel ricalcolo del benchmark {sector}: {e}")
+        else:
+            self._empty_runs.pop(sector, None)
+            self._skip.pop(sector, None)
+            summary["computed"] += 1
+            self.sector_status[sector] = {
+                "last_run": _isoformat(started),
+                "duration": round(time.time() - started, 2),
+                "error": None
+            }
+        finally:
+            self.current = None
+        return True
+
+    async def _wait(self, timeout: float) -> None:
+        """Attende `timeout` secondi, o meno se arriva una richiesta anticipata"""
+        if self._priority:
+            return
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def get_status(self) -> Dict[str, Any]:
+        """
+        Stato dello scheduler
+
+        Returns:
+            Dizionario con stato (running, o standby se in attesa del lock di
+            un altro worker), configurazione, ultimo ciclo (last_run), inizio
+            del prossimo (next_run), settore in calcolo, coda e stato per settore
+        """
+        return {
+            "running": self.running,
+            "standby": self._started and not self.leader,
+            "interval": self.interval,
+            "stagger": self.stagger,
+            "sectors": self.known_sectors(),
+            "current": self.current,
+            "queued": list(self._priority),
+            "last_run": self.last_run,
+            "next_run": _isoformat(self.next_run),
+            "sector_status": dict(self.sector_status)
+        }
@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""
+Company Index Module
+Indici secondari per la ricerca per nome nella cache delle aziende.
+
+La cache è un dizionario chiave -> azienda consultato in ordine di inserimento:
+la ricerca restituisce la prima voce che soddisfa il criterio. Gli indici
+mantengono quindi, per ogni voce, la sua posizione di inserimento e
+restituiscono sempre la posizione minima tra i candidati:
+
+- nome normalizzato -> posizioni ordinate (corrispondenza esatta)
+- n-gram (1-3 caratteri) -> prima posizione di ogni nome che lo contiene,
+  in ordine (corrispondenza "contiene"); altre voci con lo stesso nome
+  (es. più ticker della stessa società) non aggiungono voci agli n-gram
+- lunghezze dei nomi presenti (corrispondenza "è contenuto in")
+
+Sugli stessi n-gram si basa la ricerca fuzzy (tollerante agli errori di
+battitura), che restituisce candidati ordinati per somiglianza.
+
+PrefixIndex serve invece i suggerimenti di ricerca per prefisso di nome o
+ticker, una voce per azienda, ordinati per market cap; aggiunte e rimozioni
+non rileggono l'intero universo. Con una funzione di risoluzione l'indice
+conserva solo nome normalizzato, ticker e market cap, non le aziende.
+"""
+
+import heapq
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+GRAM_SIZE = 3
+
+# Ricerca fuzzy: gli n-gram presenti in più nomi di così sono poco
+# informativi e non vengono usati per generare i candidati
+COMMON_GRAM_LIMIT = 2000
+FUZZY_CANDIDATES = 50
+
+
+def normalize_name(name: str) -> str:
+    """Normalizzazione usata per confrontare i nomi"""
+    return name.lower()
+
+
+def name_grams(name: str) -> set:
+    """Tutti gli n-gram di lunghezza 1..GRAM_SIZE di un nome normalizzato"""
+    length = len(name)
+    return {name[start:start + size]
+            for size in range(1, GRAM_SIZE + 1)
+            for start in range(length - size + 1)}
+
+
+def _padded_trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _dice(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def similarity(query: str, name: str) -> float:
+    """
+    Somiglianza trigram (coefficiente di Dice) tra una query e un nome, da 0 a 1
+
+    Punteggiatura e maiuscole sono ignorate. Il nome è confrontato sia per
+    intero sia limitato alle prime parole (tante quante quelle della query),
+    così "microsft" è vicino a "Microsoft Corporation".
+    """
+    query_words = re.findall(r"\w+", query.lower())
+    name_words = re.findall(r"\w+", name.lower())
+    if not query_words or not name_words:
+        return 0.0
+    query_grams = _padded_trigrams(" ".join(query_words))
+    full = _dice(query_grams, _padded_trigrams(" ".join(name_words)))
+    leading = _dice(query_grams, _padded_trigrams(" ".join(name_words[:len(query_words)])))
+    return round(max(full, leading), 4)
+
+
+def _remove_sorted(values: List[int], value: int) -> None:
+    index = bisect_left(values, value)
+    if index < len(values) and values[index] == value:
+        del values[index]
+
+
+def _contains(values: List[int], value: int) -> bool:
+    index = bisect_left(values, value)
+    return index < len(values) and values[index] == value
+
+
+class CompanyIndex:
+    """Indice per nome delle voci della cache, in ordine di inserimento"""
+
+    def __init__(self):
+        """Inizializza un indice vuoto"""
+        self.clear()
+
+    def clear(self) -> None:
+        """Rimuove tutte le voci"""
+        self._positions: Dict[str, int] = {}
+        self._keys: List[str] = []
+        self._names: List[str] = []
+        self._exact: Dict[str, List[int]] = {}
+        self._grams: Dict[str, List[int]] = {}
+        self._lengths: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def add(self, key: str, name: str) -> None:
+        """
+        Indicizza (o aggiorna) una voce
+
+        Una chiave già presente mantiene la sua posizione, come in un dict.
+
+        Args:
+            key: Chiave della voce nella cache
+            name: Nome dell'azienda
+        """
+        normalized = normalize_name(name)
+        position = self._positions.get(key)
+        if position is None:
+            position = len(self._keys)
+            self._positions[key] = position
+            self._keys.append(key)
+            self._names.append(normalized)
+        elif self._names[position] == normalized:
+            return
+        else:
+            self._unlink(position)
+            self._names[position] = normalized
+        self._link(position)
+
+    def _link(self, position: int) -> None:
+        """Collega una posizione al proprio nome e, se ne è la prima, agli n-gram"""
+        normalized = self._names[position]
+        positions = self._exact.get(normalized)
+        if positions is None:
+            self._exact[normalized] = [position]
+            self._lengths[len(normalized)] = self._lengths.get(len(normalized), 0) + 1
+            self._post(normalized, position)
+        elif position > positions[-1]:
+            # Nuova voce con un nome già presente: il nome è già
+            # indicizzato da una posizione precedente
+            positions.append(position)
+        else:
+            first = positions[0]
+            insort(positions, position)
+            if position < first:
+                self._unpost(normalized, first)
+                self._post(normalized, position)
+
+    def _unlink(self, position: int) -> None:
+        """Scollega una posizione dal nome attuale (voce sovrascritta)"""
+        normalized = self._names[position]
+        positions = self._exact[normalized]
+        first = positions[0]
+        _remove_sorted(positions, position)
+        if position != first:
+            return
+        self._unpost(normalized, position)
+        if positions:
+            self._post(normalized, positions[0])
+        else:
+            del self._exact[normalized]
+            self._lengths[len(normalized)] -= 1
+            if not self._lengths[len(normalized)]:
+                del self._lengths[len(normalized)]
+
+    def _post(self, normalized: str, position: int) -> None:
+        grams = self._grams
+        for gram in name_grams(normalized):
+            postings = grams.get(gram)
+            if postings is None:
+                grams[gram] = [position]
+            elif position > postings[-1]:
+                postings.append(position)
+            else:
+                insort(postings, position)
+
+    def _unpost(self, normalized: str, position: int) -> None:
+        for gram in name_grams(normalized):
+            postings = self._grams[gram]
+            _remove_sorted(postings, position)
+            if not postings:
+                del self._grams[gram]
+
+    def find_exact(self, query: str) -> Optional[str]:
+        """
+        Prima voce il cui nome normalizzato è uguale alla query
+
+        Args:
+            query: Query già normalizzata
+
+        Returns:
+            Chiave della voce o None
+        """
+        positions = self._exact.get(query)
+        return self._keys[positions[0]] if positions else None
+
+    def find_substring(self, query: str) -> Optional[str]:
+        """
+        Prima voce il cui nome contiene la query o è contenuto nella query
+
+        Args:
+            query: Query già normalizzata
+
+        Returns:
+            Chiave della voce o None
+        """
+        candidates = [
+            position for position in (self._first_containing(query), self._first_contained_in(query))
+            if position is not None
+        ]
+        return self._keys[min(candidates)] if candidates else None
+
+    def _first_containing(self, query: str) -> Optional[int]:
+        """Posizione minima di un nome che contiene la query"""
+        if not self._keys:
+            return None
+        if not query:
+            return 0
+        if len(query) <= GRAM_SIZE:
+            positions = self._grams.get(query)
+            return positions[0] if positions else None
+
+        postings = []
+        for gram in {query[i:i + GRAM_SIZE] for i in range(len(query) - GRAM_SIZE + 1)}:
+            positions = self._grams.get(gram)
+            if not positions:
+                return None
+            postings.append(positions)
+        postings.sort(key=len)
+
+        shortest, others = postings[0], postings[1:]
+        for position in shortest:
+            if all(_contains(other, position) for other in others) and query in self._names[position]:
+                return position
+        return None
+
+    def fuzzy(self, query: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """
+        Voci con il nome più simile alla query (tolleranti agli errori di battitura)
+
+        I candidati sono i nomi che condividono più trigrammi con la query;
+        vengono poi ordinati per somiglianza (vedi similarity).
+
+        Args:
+            query: Query già normalizzata
+            limit: Numero massimo di risultati
+
+        Returns:
+            Lista di tuple (chiave, punteggio) in ordine di punteggio decrescente
+        """
+        grams = {query[i:i + GRAM_SIZE] for i in range(len(query) - GRAM_SIZE + 1)}
+        postings = sorted((self._grams[gram] for gram in grams if gram in self._grams), key=len)
+        if not postings:
+            return []
+        selective = [positions for positions in postings if len(positions) <= COMMON_GRAM_LIMIT]
+        counts = Counter()
+        for positions in selective or [postings[0][:COMMON_GRAM_LIMIT]]:
+            counts.update(positions)
+
+        candidates = heapq.nlargest(FUZZY_CANDIDATES, counts.items(), key=lambda item: (item[1], -item[0]))
+        scored = [(similarity(query, self._names[position]), position) for position, _ in candidates]
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(self._keys[position], score) for score, position in scored[:limit] if score > 0]
+
+    def _first_contained_in(self, query: str) -> Optional[int]:
+        """Posizione minima di un nome contenuto nella query"""
+        best = None
+        for length in self._lengths:
+            if length > len(query):
+                continue
+            for start in range(len(query) - length + 1):
+                positions = self._exact.get(query[start:start + length])
+                if positions and (best is None or positions[0] < best):
+                    best = positions[0]
+        return best
+
+
+# Per i prefissi fino a questa lunghezza (intervalli potenzialmente molto
+# ampi) le aziende sono mantenute anche in ordine di market cap
+TOP_PREFIX_LENGTH = 3
+
+# Un prefisso più lungo con più aziende di così viene ordinato per market cap
+# alla prima ricerca e mantenuto in ordine come i prefissi brevi
+RANKED_RANGE_MIN = 64
+
+_MAX_CHAR = chr(0x10FFFF)
+
+
+def _rank_key(company) -> Tuple:
+    """Ordinamento dei suggerimenti: market cap decrescente, poi nome e ticker"""
+    market_cap = company.market_cap if company.market_cap is not None else float("-inf")
+    return (-market_cap, company.name.lower(), company.symbol)
+
+
+class _SortedList:
+    """
+    Lista ordinata a blocchi
+
+    I valori sono divisi in blocchi ordinati di al massimo 2 * LOAD elementi:
+    inserimento e rimozione spostano solo gli elementi di un blocco invece
+    dell'intera lista.
+    """
+
+    LOAD = 512
+
+    def __init__(self, values: Iterable = ()):
+        ordered = sorted(values)
+        self._chunks: List[list] = [ordered[i:i + self.LOAD] for i in range(0, len(ordered), self.LOAD)]
+        self._maxes: List[Any] = [chunk[-1] for chunk in self._chunks]
+        self._length = len(ordered)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield from chunk
+
+    def add(self, value) -> None:
+        """Inserisce un valore mantenendo l'ordine"""
+        self._length += 1
+        if not self._chunks:
+            self._chunks.append([value])
+            self._maxes.append(value)
+            return
+        index = min(bisect_left(self._maxes, value), len(self._chunks) - 1)
+        chunk = self._chunks[index]
+        insort(chunk, value)
+        self._maxes[index] = chunk[-1]
+        if len(chunk) > 2 * self.LOAD:
+            self._chunks[index:index + 1] = [chunk[:self.LOAD], chunk[self.LOAD:]]
+            self._maxes[index:index + 1] = [chunk[self.LOAD - 1], chunk[-1]]
+
+    def remove(self, value) -> bool:
+        """Rimuove un valore; False se assente"""
+        index = bisect_left(self._maxes, value)
+        if index == len(self._chunks):
+            return False
+        chunk = self._chunks[index]
+        position = bisect_left(chunk, value)
+        if position == len(chunk) or chunk[position] != value:
+            return False
+        del chunk[position]
+        self._length -= 1
+        if chunk:
+            self._maxes[index] = chunk[-1]
+        else:
+            del self._chunks[index]
+            del self._maxes[index]
+        return True
+
+    def head(self, count: int) -> list:
+        """Primi `count` valori"""
+        result = []
+        for chunk in self._chunks:
+            result.extend(chunk[:count - len(result)])
+            if len(result) >= count:
+                break
+        return result
+
+    def irange(self, low, high):
+        """Valori v con low <= v < high, in ordine"""
+        for chunk in self._chunks[bisect_left(self._maxes, low):]:
+            for value in chunk[bisect_left(chunk, low):]:
+                if value >= high:
+                    return
+                yield value
+
+
+class PrefixIndex:
+    """
+    Indice per prefisso su nomi e ticker delle aziende (una voce per ticker)
+
+    I termini (nome normalizzato e ticker in minuscolo) sono in una lista
+    ordinata a blocchi: l'intervallo dei termini con un dato prefisso si
+    trova con una bisect. Per i prefissi brevi le aziende sono mantenute
+    anche in ordine di market cap, così una ricerca costa O(prefisso + k)
+    anche quando l'intervallo contiene migliaia di aziende, e aggiungere o
+    aggiornare un'azienda tocca solo un blocco di ogni lista. Un prefisso
+    più lungo con un intervallo ampio (oltre RANKED_RANGE_MIN aziende) viene
+    ordinato alla prima ricerca e poi mantenuto allo stesso modo.
+    """
+
+    def __init__(self, resolve: Optional[Callable[[str], Any]] = None):
+        """
+        Inizializza un indice vuoto
+
+        Args:
+            resolve: Funzione ticker -> azienda usata per restituire i
+                     suggerimenti; se assente l'indice conserva le aziende
+        """
+        self._resolve = resolve
+        self.clear()
+
+    def clear(self) -> None:
+        """Rimuove tutte le aziende"""
+        self._terms = _SortedList()
+        self._companies: Dict[str, Any] = {}
+        # Chiave di ordinamento con cui ogni azienda è indicizzata (ticker in maiuscolo)
+        self._keys: Dict[str, Tuple] = {}
+        # Prefisso breve (o lungo già cercato) -> (chiave di ordinamento, ticker)
+        # di tutte le sue aziende
+        self._ranked: Dict[str, _SortedList] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @staticmethod
+    def _entry_terms(key: Tuple, symbol: str) -> Set[str]:
+        # Nome normalizzato (già nella chiave di ordinamento) e ticker in minuscolo
+        return {key[1], symbol.lower()}
+
+    def rebuild(self, companies: Iterable) -> None:
+        """
+        Ricostruisce l'indice in blocco (un ordinamento per lista)
+
+        Args:
+            companies: Aziende da indicizzare; per ticker ripetuti vale l'ultima
+        """
+        self.clear()
+        for company in companies:
+            symbol = company.symbol.upper()
+            self._keys[symbol] = _rank_key(company)
+            if self._resolve is None:
+                self._companies[symbol] = company
+        self._terms = _SortedList(
+            (term, symbol) for symbol, key in self._keys.items() for term in self._entry_terms(key, symbol)
+        )
+        entries: Dict[str, List[Tuple[Tuple, str]]] = {}
+        for symbol, key in self._keys.items():
+            for prefix in self._short_prefixes(key, symbol):
+                entries.setdefault(prefix, []).append((key, symbol))
+        self._ranked = {prefix: _SortedList(values) for prefix, values in entries.items()}
+
+    def add(self, company) -> None:
+        """Indicizza un'azienda, sostituendo quella con lo stesso ticker"""
+        symbol = company.symbol.upper()
+        if symbol in self._keys:
+            self._remove(symbol)
+
+        if self._resolve is None:
+            self._companies[symbol] = company
+        self._keys[symbol] = key = _rank_key(company)
+        for term in self._entry_terms(key, symbol):
+            self._terms.add((term, symbol))
+        for prefix in self._short_prefixes(key, symbol):
+            ranked = self._ranked.get(prefix)
+            if ranked is None:
+                ranked = self._ranked[prefix] = _SortedList()
+            ranked.add((key, symbol))
+        for prefix in self._long_prefixes(key, symbol):
+            ranked = self._ranked.get(prefix)
+            if ranked is not None:
+                ranked.add((key, symbol))
+
+    def _remove(self, symbol: str) -> None:
+        key = self._keys.pop(symbol)
+        self._companies.pop(symbol, None)
+        for term in self._entry_terms(key, symbol):
+            self._terms.remove((term, symbol))
+        for prefix in self._short_prefixes(key, symbol):
+            ranked = self._ranked[prefix]
+            ranked.remove((key, symbol))
+            if not ranked:
+                del self._ranked[prefix]
+        for prefix in self._long_prefixes(key, symbol):
+            ranked = self._ranked.get(prefix)
+            if ranked is not None:
+                ranked.remove((key, symbol))
+                if not ranked:
+                    del self._ranked[prefix]
+
+    @classmethod
+    def _short_prefixes(cls, key: Tuple, symbol: str) -> Set[str]:
+        prefixes = set()
+        for term in cls._entry_terms(key, symbol):
+            for length in range(1, min(len(term), TOP_PREFIX_LENGTH) + 1):
+                prefixes.add(term[:length])
+        return prefixes
+
+    @classmethod
+    def _long_prefixes(cls, key: Tuple, symbol: str) -> Set[str]:
+        prefixes = set()
+        for term in cls._entry_terms(key, symbol):
+            for length in range(TOP_PREFIX_LENGTH + 1, len(term) + 1):
+                prefixes.add(term[:length])
+        return prefixes
+
+    def _rank_range(self, prefix: str, limit: int) -> List[Tuple[Tuple, str]]:
+        ranked = self._ranked.get(prefix)
+        if ranked is not None:
+            return ranked.head(limit)
+        symbols = {symbol for _, symbol in self._terms.irange((prefix,), (prefix + _MAX_CHAR,))}
+        if len(symbols) <= RANKED_RANGE_MIN:
+            return heapq.nsmallest(limit, ((self._keys[s], s) for s in symbols))
+        # Intervallo ampio: ordinato una volta, poi aggiornato da add e _remove
+        ranked = self._ranked[prefix] = _SortedList((self._keys[s], s) for s in symbols)
+        return ranked.head(limit)
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Any]:
+        """
+        Aziende il cui nome o ticker inizia con il prefisso
+
+        Args:
+            prefix: Prefisso già normalizzato (minuscolo)
+            limit: Numero massimo di suggerimenti
+
+        Returns:
+            Aziende ordinate per market cap decrescente, senza duplicati
+        """
+        if not prefix or limit <= 0:
+            return []
+        if len(prefix) <= TOP_PREFIX_LENGTH:
+            ranked = self._ranked.get(prefix)
+            entries = ranked.head(limit) if ranked is not None else []
+        else:
+            entries = self._rank_range(prefix, limit)
+        if self._resolve is not None:
+            return [self._resolve(symbol) for _, symbol in entries]
+        return [self._companies[symbol] for _, symbol in entries]
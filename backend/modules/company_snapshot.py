@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Company Snapshot Module
+Formato binario compatto e versionato per lo snapshot della cache aziende.
+
+Layout (little-endian, l'ordine nativo delle piattaforme supportate x86/ARM):
+
+    header      magic "F5CACHE\0", versione u32, n. aziende u32, n. stringhe u32
+    stringhe    offset u32[n. stringhe + 1], poi i byte UTF-8 concatenati
+    colonne     symbol u32, name u32, exchange i32, sector i32, industry i32
+                (indici nella tabella delle stringhe, -1 = assente),
+                per ticker u32 (righe ordinate per ticker in maiuscolo, dalla versione 2),
+                market_cap f64 (NaN = assente),
+                last_updated i64 (microsecondi epoch, -1 = assente)
+
+Ogni azienda compare una sola volta; exchange, settori e industry sono
+stringhe internate (memorizzate una volta nella tabella). Le colonne
+numeriche sono allineate a 8 byte e lette dal file mappato in memoria
+senza copie; le stringhe vengono decodificate solo quando servono. La
+colonna ordinata per ticker permette di trovare un'azienda con una ricerca
+binaria, decodificando solo i ticker confrontati, senza caricare lo snapshot.
+"""
+
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: lock solo tra i thread dello stesso processo
+    fcntl = None
+
+MAGIC = b"F5CACHE\0"
+VERSION = 2
+# Versioni leggibili: la 1 non ha la colonna per ticker, ricostruita in memoria
+SUPPORTED_VERSIONS = (1, 2)
+
+_HEADER = struct.Struct("<8sIII")
+_NONE = -1
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Scrive un file in modo atomico (file temporaneo + fsync + rename)"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def file_id(path: str) -> Optional[Tuple[int, int, int]]:
+    """Identità di un file (inode, mtime, dimensione): cambia quando viene sostituito; None se assente"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class FileLock:
+    """
+    Lock esclusivo tra processi (flock su un file dedicato)
+
+    È anche un lock tra i thread del processo ed è rientrante: lo stesso
+    thread può acquisirlo più volte (es. compattazione durante il caricamento).
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: File usato per il lock (creato se assente, mai rimosso)
+        """
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Acquisisce il lock
+
+        Args:
+            blocking: Se False non attende: restituisce False se il lock è
+                      tenuto da un altro thread o processo
+
+        Returns:
+            True se il lock è stato acquisito
+        """
+        if not self._lock.acquire(blocking):
+            return False
+        try:
+            if self._depth == 0 and fcntl is not None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    self._lock.release()
+                    return False
+                except BaseException:
+                    os.close(fd)
+                    raise
+                self._fd = fd
+            self._depth += 1
+        except BaseException:
+            self._lock.release()
+            raise
+        return True
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+    def release(self) -> None:
+        """Rilascia il lock (una volta per ogni acquire riuscito)"""
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        self._lock.release()
+
+
+def now_micros() -> int:
+    """Istante corrente in microsecondi epoch"""
+    return time.time_ns() // 1000
+
+
+def to_epoch_micros(timestamp: Optional[str]) -> Optional[int]:
+    """Converte una data ISO (ora locale) in microsecondi epoch; None se non valida"""
+    if not timestamp:
+        return None
+    try:
+        moment = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+    return int(moment.timestamp()) * 1_000_000 + moment.microsecond
+
+
+def from_epoch_micros(micros: Optional[int]) -> Optional[str]:
+    """Converte microsecondi epoch in una data ISO (ora locale)"""
+    if micros is None:
+        return None
+    seconds, fraction = divmod(micros, 1_000_000)
+    return datetime.fromtimestamp(seconds).replace(microsecond=fraction).isoformat()
+
+
+def _pad(buffer: bytearray) -> None:
+    buffer.extend(b"\0" * (-len(buffer) % 8))
+
+
+def _check_byteorder() -> None:
+    if sys.byteorder != "little":
+        raise RuntimeError("Lo snapshot binario richiede una piattaforma little-endian")
+
+
+def encode_snapshot(companies: Iterable[Any]) -> bytes:
+    """
+    Serializza le aziende nel formato binario
+
+    Args:
+        companies: Oggetti con symbol, name, exchange, sector, industry,
+                   market_cap e updated_at (microsecondi epoch o None)
+
+    Returns:
+        Contenuto del file di snapshot
+    """
+    strings: Dict[str, int] = {}
+
+    def intern(value: Optional[str]) -> int:
+        if value is None:
+            return _NONE
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    symbols, names = array("I"), array("I")
+    exchanges, sectors, industries = array("i"), array("i"), array("i")
+    market_caps, updated = array("d"), array("q")
+    tickers = []
+    for company in companies:
+        tickers.append(company.symbol.upper())
+        symbols.append(intern(company.symbol))
+        names.append(intern(company.name))
+        exchanges.append(intern(company.exchange))
+        sectors.append(intern(company.sector))
+        industries.append(intern(company.industry))
+        market_caps.append(float(company.market_cap) if company.market_cap is not None else math.nan)
+        updated.append(company.updated_at if company.updated_at is not None else _NONE)
+
+    blob = bytearray()
+    offsets = array("I", [0])
+    for value in strings:
+        blob.extend(value.encode("utf-8"))
+        offsets.append(len(blob))
+
+    data = bytearray(_HEADER.pack(MAGIC, VERSION, len(symbols), len(strings)))
+    data.extend(offsets.tobytes())
+    data.extend(blob)
+    _pad(data)
+    by_symbol = array("I", sorted(range(len(tickers)), key=tickers.__getitem__))
+    for column in (symbols, names, exchanges, sectors, industries, by_symbol):
+        data.extend(column.tobytes())
+    _pad(data)
+    data.extend(market_caps.tobytes())
+    data.extend(updated.tobytes())
+    return bytes(data)
+
+
+def write_snapshot(path: str, companies: Iterable[Any]) -> None:
+    """Scrive lo snapshot binario in modo atomico"""
+    atomic_write(path, encode_snapshot(companies))
+
+
+class CompanySnapshot:
+    """Lettore dello snapshot binario, mappato in memoria"""
+
+    def __init__(self, path: str):
+        """
+        Apre lo snapshot
+
+        Args:
+            path: Percorso del file
+
+        Raises:
+            ValueError: se il file non è uno snapshot valido o ha una versione non supportata
+        """
+        _check_byteorder()
+        self.path = path
+        self._map = None
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise ValueError(f"Snapshot troppo corto: {path}")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, count, string_count = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError(f"Formato snapshot non riconosciuto: {path}")
+            if version not in SUPPORTED_VERSIONS:
+                raise ValueError(f"Versione snapshot non supportata: {version}")
+            self._parse(version, count, string_count, size)
+        except Exception:
+            self.close()
+            raise
+
+    def _parse(self, version: int, count: int, string_count: int, size: int) -> None:
+        view = self._view = memoryview(self._map)
+        position = _HEADER.size
+
+        def column(fmt: str, length: int, itemsize: int) -> memoryview:
+            nonlocal position
+            end = position + length * itemsize
+            if end > size:
+                raise ValueError(f"Snapshot troncato: {self.path}")
+            result = view[position:end].cast(fmt)
+            position = end
+            return result
+
+        def align() -> None:
+            nonlocal position
+            position += -position % 8
+
+        self._offsets = column("I", string_count + 1, 4)
+        blob_length = self._offsets[string_count] if string_count else 0
+        if position + blob_length > size:
+            raise ValueError(f"Snapshot troncato: {self.path}")
+        self._blob = view[position:position + blob_length]
+        position += blob_length
+        align()
+        self._symbols = column("I", count, 4)
+        self._names = column("I", count, 4)
+        self._exchanges = column("i", count, 4)
+        self._sectors = column("i", count, 4)
+        self._industries = column("i", count, 4)
+        if version >= 2:
+            self._by_symbol = column("I", count, 4)
+        else:
+            self._by_symbol = memoryview(array("I", sorted(range(count), key=lambda row: self.symbol(row).upper())))
+        align()
+        self.market_caps = column("d", count, 8)
+        self.updated_micros = column("q", count, 8)
+        self._count = count
+        self._interned: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def string(self, index: int) -> Optional[str]:
+        """Stringa della tabella (None per l'indice -1)"""
+        if index == _NONE:
+            return None
+        return bytes(self._blob[self._offsets[index]:self._offsets[index + 1]]).decode("utf-8")
+
+    def _interned_string(self, index: int) -> Optional[str]:
+        # Exchange, settori e industry: decodificati una volta e condivisi
+        value = self._interned.get(index)
+        if value is None and index != _NONE:
+            value = self._interned[index] = self.string(index)
+        return value
+
+    def symbol(self, row: int) -> str:
+        return self.string(self._symbols[row])
+
+    def name(self, row: int) -> str:
+        return self.string(self._names[row])
+
+    def find(self, symbol: str) -> Optional[int]:
+        """
+        Riga dell'azienda con il ticker indicato (ricerca binaria)
+
+        Args:
+            symbol: Ticker in maiuscolo
+
+        Returns:
+            Indice della riga o None se assente
+        """
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self.symbol(self._by_symbol[middle]).upper() < symbol:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count:
+            row = self._by_symbol[low]
+            if self.symbol(row).upper() == symbol:
+                return row
+        return None
+
+    def counts(self, field: str, skip: Iterable[int] = ()) -> Dict[str, int]:
+        """
+        Numero di aziende per exchange o settore, dalle sole colonne intere
+
+        Args:
+            field: "exchange" o "sector"
+            skip: Righe da escludere (es. aziende sostituite)
+
+        Returns:
+            Dizionario valore -> numero di aziende (valori assenti esclusi)
+        """
+        column = self._exchanges if field == "exchange" else self._sectors
+        counts = Counter(column)
+        for row in skip:
+            counts[column[row]] -= 1
+        return {self._interned_string(index): count for index, count in counts.items()
+                if index != _NONE and count > 0}
+
+    def newest_update(self) -> Optional[int]:
+        """Data di aggiornamento più recente (microsecondi epoch) o None"""
+        newest = max(self.updated_micros, default=_NONE)
+        return None if newest == _NONE else newest
+
+    def row(self, row: int) -> Dict[str, Any]:
+        """Campi di un'azienda (stessi nomi di CachedCompany)"""
+        market_cap = self.market_caps[row]
+        updated_at = self.updated_micros[row]
+        return {
+            "symbol": self.symbol(row),
+            "name": self.name(row),
+            "exchange": self._interned_string(self._exchanges[row]),
+            "market_cap": None if math.isnan(market_cap) else market_cap,
+            "sector": self._interned_string(self._sectors[row]),
+            "industry": self._interned_string(self._industries[row]),
+            "updated_at": None if updated_at == _NONE else updated_at,
+        }
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        """Itera sulle aziende nell'ordine dello snapshot"""
+        for index in range(self._count):
+            yield self.row(index)
+
+    def close(self) -> None:
+        """Rilascia la mappatura del file"""
+        for name in ("_offsets", "_blob", "_symbols", "_names", "_exchanges", "_sectors",
+                     "_industries", "_by_symbol", "market_caps", "updated_micros", "_view"):
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self) -> "CompanySnapshot":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Concurrency Module
+Utility per eseguire in parallelo i rami di una richiesta con una scadenza comune.
+
+La scadenza è memorizzata in una ContextVar: i task creati all'interno di
+`deadline_scope` la ereditano, così ogni ramo annidato conosce il tempo
+rimasto per l'intera richiesta.
+
+TokenBucket limita la frequenza delle chiamate verso l'esterno (quota del
+piano FMP) mettendo in coda le richieste in eccesso invece di rifiutarle.
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import (Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator,
+                    List, Optional, Tuple, TypeVar)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[None]:
+    """
+    Imposta la scadenza della richiesta corrente
+
+    Una scadenza già attiva e più vicina non viene mai estesa.
+
+    Args:
+        seconds: Secondi disponibili a partire da ora
+    """
+    deadline = time.monotonic() + seconds
+    current = _request_deadline.get()
+    if current is not None and current < deadline:
+        deadline = current
+
+    token = _request_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _request_deadline.reset(token)
+
+
+def remaining_time(default: Optional[float] = None) -> Optional[float]:
+    """
+    Secondi rimasti prima della scadenza corrente
+
+    Args:
+        default: Valore restituito se non è attiva alcuna scadenza
+
+    Returns:
+        Secondi rimasti (mai negativi) o default
+    """
+    deadline = _request_deadline.get()
+    if deadline is None:
+        return default
+    return max(0.0, deadline - time.monotonic())
+
+
+async def gather_with_deadline(branches: Dict[str, Awaitable[Any]],
+                               timeout: Optional[float]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Esegue i rami in parallelo e attende al massimo `timeout` secondi
+
+    Args:
+        branches: Dizionario nome -> coroutine
+        timeout: Secondi massimi di attesa (None = nessun limite)
+
+    Returns:
+        Tupla (risultati, scaduti): i risultati contengono il valore di ogni
+        ramo completato oppure l'eccezione sollevata; i rami ancora in corso
+        alla scadenza vengono cancellati e riportati in `scaduti`
+    """
+    tasks = {name: asyncio.ensure_future(branch) for name, branch in branches.items()}
+    if not tasks:
+        return {}, []
+
+    _, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    results: Dict[str, Any] = {}
+    timed_out: List[str] = []
+    for name, task in tasks.items():
+        if task in pending:
+            timed_out.append(name)
+        elif task.exception() is not None:
+            results[name] = task.exception()
+        else:
+            results[name] = task.result()
+
+    return results, timed_out
+
+
+async def bounded_as_completed(items: Iterable[T], func: Callable[[T], Awaitable[R]],
+                               concurrency: int) -> AsyncIterator[R]:
+    """
+    Applica `func` agli elementi con al massimo `concurrency` esecuzioni
+    in parallelo e restituisce i risultati nell'ordine di completamento
+
+    Il primo risultato è disponibile appena termina il primo elemento,
+    indipendentemente dal numero totale di elementi. La coda dei risultati è
+    limitata: se il consumatore è lento i worker si fermano invece di
+    accumulare risultati in memoria (backpressure). Chiudendo o cancellando
+    l'iteratore (es. client disconnesso) i worker ancora attivi vengono
+    cancellati.
+
+    Args:
+        items: Elementi da elaborare
+        func: Coroutine da applicare a ogni elemento; deve gestire i propri errori
+        concurrency: Numero massimo di esecuzioni contemporanee
+
+    Yields:
+        Risultati di `func` man mano che sono pronti
+    """
+    pending = deque(items)
+    total = len(pending)
+    concurrency = max(1, concurrency)
+    queue: "asyncio.Queue[Tuple[Optional[R], Optional[BaseException]]]" = asyncio.Queue(maxsize=concurrency)
+
+    async def worker() -> None:
+        while pending:
+            item = pending.popleft()
+            try:
+                await queue.put((await func(item), None))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await queue.put((None, e))
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(min(concurrency, total))]
+    try:
+        for _ in range(total):
+            result, error = await queue.get()
+            if error is not None:
+                raise error
+            yield result
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+class TokenBucket:
+    """
+    Limitatore di frequenza a token bucket per un event loop
+
+    Il bucket contiene al massimo `capacity` token e si ricarica di `rate`
+    token al secondo; ogni richiesta ne consuma uno. Le richieste in eccesso
+    non vengono rifiutate ma messe in coda in ordine di arrivo: ognuna
+    prenota il proprio token (il saldo può diventare negativo) e attende il
+    tempo necessario a ricaricarlo.
+
+    Il bucket è per processo: con N worker uvicorn ognuno ha il proprio e il
+    limite complessivo verso FMP è N volte quello configurato.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            rate: Token ricaricati al secondo (> 0)
+            capacity: Token massimi accumulabili, cioè la raffica consentita (>= 1)
+            clock: Orologio monotono (sostituibile nei test)
+        """
+        if rate <= 0 or capacity < 1:
+            raise ValueError("rate deve essere > 0 e capacity >= 1")
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self.acquired = 0
+        self.delayed = 0
+        self.total_wait = 0.0
+
+    @classmethod
+    def per_minute(cls, requests_per_minute: int, burst: int) -> "TokenBucket":
+        """
+        Bucket che non supera mai `requests_per_minute` richieste in 60 secondi
+
+        In una finestra di un minuto passano al più la raffica iniziale più
+        i token ricaricati: la ricarica è quindi (quota - raffica) / 60.
+
+        La quota è quella di un solo processo (vedi la classe).
+
+        Args:
+            requests_per_minute: Quota del piano (almeno 2: una raffica di un
+                token più una ricarica)
+            burst: Richieste consentite in raffica (limitata alla metà della quota)
+
+        Raises:
+            ValueError: se la quota è inferiore a 2 richieste al minuto
+        """
+        if requests_per_minute < 2:
+            raise ValueError(f"Quota FMP non valida: {requests_per_minute} richieste al minuto "
+                             "(FMP_RATE_LIMIT_PER_MINUTE deve essere almeno 2, oppure 0 per disattivare il limite)")
+        burst = max(1, min(burst, requests_per_minute // 2))
+        return cls(rate=(requests_per_minute - burst) / 60.0, capacity=burst)
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """
+        Attende un token
+
+        Returns:
+            Secondi di attesa
+        """
+        self._refill()
+        self._tokens -= 1
+        self.acquired += 1
+        if self._tokens >= 0:
+            return 0.0
+
+        wait = -self._tokens / self.rate
+        self.delayed += 1
+        self.total_wait += wait
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            # Il token prenotato non è stato usato: torna disponibile
+            self._tokens += 1
+            raise
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Svuota il bucket per `seconds` secondi (es. dopo un HTTP 429 con Retry-After)"""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Configurazione e contatori del limitatore"""
+        self._refill()
+        return {
+            "rate_per_second": round(self.rate, 3),
+            "capacity": self.capacity,
+            "available": round(max(self._tokens, 0.0), 2),
+            "acquired": self.acquired,
+            "delayed": self.delayed,
+            "total_wait_seconds": round(self.total_wait, 3),
+        }
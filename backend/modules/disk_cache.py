@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Disk Cache Module
+Cache persistente su disco (SQLite in modalità WAL) per le risposte FMP e
+per i dati derivati (es. benchmark settoriali).
+
+- Sopravvive a riavvii e deploy (se il file è su un disco persistente)
+- TTL e finestra stale memorizzati per ogni voce
+- Payload JSON compresso con zlib
+- Eviction per dimensione totale, in ordine di ultimo accesso
+- Condivisibile da più worker uvicorn sullo stesso host: WAL consente letture
+  concorrenti a una scrittura, busy_timeout serializza gli scrittori
+
+Le operazioni sono bloccanti (I/O locale, pochi ms): dal codice asincrono
+vanno eseguite con asyncio.to_thread.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+DEFAULT_PATH = os.path.join("cache", "fmp_cache.sqlite3")
+
+# Aggiorna accessed_at al massimo una volta ogni N secondi per voce,
+# così le letture non diventano scritture contese tra worker
+ACCESS_RESOLUTION = 60.0
+
+# Dopo un'eviction la dimensione scende sotto questa frazione del limite
+EVICTION_LOW_WATERMARK = 0.9
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace   TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    payload     BLOB NOT NULL,
+    size        INTEGER NOT NULL,
+    stored_at   REAL NOT NULL,
+    expires_at  REAL NOT NULL,
+    stale_until REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at);
+CREATE TABLE IF NOT EXISTS totals (
+    id    INTEGER PRIMARY KEY CHECK (id = 0),
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals (id, bytes) VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    UPDATE totals SET bytes = bytes + length(NEW.payload) WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE totals SET bytes = bytes - length(OLD.payload) WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF payload ON entries BEGIN
+    UPDATE totals SET bytes = bytes - length(OLD.payload) + length(NEW.payload) WHERE id = 0;
+END;
+"""
+
+
+@dataclass
+class DiskEntry:
+    """Voce letta dalla cache su disco"""
+    value: Any
+    size: int
+    stored_at: float
+    expires_at: float
+    stale_until: float
+
+    def is_fresh(self, now: float) -> bool:
+        return now < self.expires_at
+
+
+class DiskCache:
+    """Cache chiave/valore persistente su SQLite"""
+
+    def __init__(self, path: str = DEFAULT_PATH, max_bytes: int = 256 * 1024 * 1024,
+                 clock: Callable[[], float] = time.time):
+        """
+        Inizializza la cache su disco
+
+        Args:
+            path: Percorso del file SQLite (la directory viene creata se manca)
+            max_bytes: Dimensione massima dei payload compressi
+            clock: Sorgente del tempo (iniettabile nei test)
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    @classmethod
+    def from_env(cls) -> Optional["DiskCache"]:
+        """
+        Crea la cache leggendo FMP_DISK_CACHE_PATH e FMP_DISK_CACHE_MAX_BYTES
+
+        Returns:
+            DiskCache o None se disabilitata con FMP_DISK_CACHE_ENABLED=false
+        """
+        enabled = os.getenv("FMP_DISK_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+        if not enabled:
+            return None
+        try:
+            return cls(
+                path=os.getenv("FMP_DISK_CACHE_PATH", DEFAULT_PATH),
+                max_bytes=int(os.getenv("FMP_DISK_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+            )
+        except (OSError, sqlite3.Error) as e:
+            print(f"Cache su disco non disponibile: {e}")
+            return None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connessione per thread (e per processo, dopo un fork)"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _encode(value: Any) -> bytes:
+        return zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"), 6)
+
+    @staticmethod
+    def _decode(payload: bytes) -> Any:
+        return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+    def get(self, namespace: str, key: str) -> Optional[DiskEntry]:
+        """
+        Legge una voce (anche scaduta, purché entro la finestra stale)
+
+        Args:
+            namespace: Spazio dei nomi (es. "fmp", "sector_benchmark")
+            key: Chiave della voce
+
+        Returns:
+            DiskEntry o None se assente o oltre la finestra stale
+        """
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT payload, size, stored_at, expires_at, stale_until, accessed_at "
+            "FROM entries WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+
+        payload, size, stored_at, expires_at, stale_until, accessed_at = row
+        now = self._clock()
+        if now >= stale_until:
+            connection.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            return None
+
+        if now - accessed_at > ACCESS_RESOLUTION:
+            connection.execute(
+                "UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, namespace, key)
+            )
+
+        return DiskEntry(
+            value=self._decode(payload),
+            size=size,
+            stored_at=stored_at,
+            expires_at=expires_at,
+            stale_until=stale_until,
+        )
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float,
+            stale_ttl: float = 0.0, size: Optional[int] = None) -> None:
+        """
+        Scrive una voce
+
+        Args:
+            namespace: Spazio dei nomi
+            key: Chiave della voce
+            value: Valore serializzabile in JSON
+            ttl: Secondi di validità
+            stale_ttl: Secondi aggiuntivi in cui la voce è servibile come stale
+            size: Dimensione logica (non compressa) da riportare ai lettori
+        """
+        payload = self._encode(value)
+        now = self._clock()
+        connection = self._connection()
+        connection.execute(
+            "INSERT INTO entries "
+            "(namespace, key, payload, size, stored_at, expires_at, stale_until, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET "
+            "payload = excluded.payload, size = excluded.size, stored_at = excluded.stored_at, "
+            "expires_at = excluded.expires_at, stale_until = excluded.stale_until, "
+            "accessed_at = excluded.accessed_at",
+            (namespace, key, payload, size if size is not None else len(payload),
+             now, now + ttl, now + ttl + stale_ttl, now)
+        )
+        if self.total_bytes() > self.max_bytes:
+            self.evict()
+
+    def delete(self, namespace: str, key: str) -> None:
+        """Rimuove una voce"""
+        self._connection().execute(
+            "DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+        )
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """Svuota un namespace o l'intera cache"""
+        if namespace is None:
+            self._connection().execute("DELETE FROM entries")
+        else:
+            self._connection().execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+
+    def total_bytes(self) -> int:
+        """Dimensione complessiva dei payload compressi"""
+        return self._connection().execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+
+    def evict(self) -> int:
+        """
+        Elimina le voci scadute e poi le meno usate fino a scendere sotto il limite
+
+        Returns:
+            Numero di voci eliminate
+        """
+        connection = self._connection()
+        target = int(self.max_bytes * EVICTION_LOW_WATERMARK)
+        removed = 0
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            removed += connection.execute(
+                "DELETE FROM entries WHERE stale_until <= ?", (self._clock(),)
+            ).rowcount
+            while self.total_bytes() > target:
+                deleted = connection.execute(
+                    "DELETE FROM entries WHERE (namespace, key) IN ("
+                    "SELECT namespace, key FROM entries ORDER BY accessed_at LIMIT 16)"
+                ).rowcount
+                if deleted == 0:
+                    break
+                removed += deleted
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return removed
+
+    def get_stats(self) -> dict:
+        """Restituisce le statistiche della cache su disco"""
+        count = self._connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "path": self.path,
+            "entries": count,
+            "bytes": self.total_bytes(),
+            "max_bytes": self.max_bytes
+        }
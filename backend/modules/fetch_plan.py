@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Fetch Plan Module
+Piano di recupero per ticker: raccoglie in anticipo le risorse FMP necessarie
+a un'analisi e le scarica in parallelo, ognuna al massimo una volta.
+
+Lo stesso piano può essere passato a più consumatori (es. main.get_company_data
+e FinancialRatios): chi richiede una risorsa già scaricata la riceve senza
+ulteriori chiamate.
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Set
+
+from .concurrency import gather_with_deadline
+from .http_client import FMPResponse, FMPTransport, get_transport
+
+# Risorse FMP supportate
+PROFILE = "profile"
+RATIOS = "ratios"
+INCOME_STATEMENT = "income-statement"
+BALANCE_SHEET = "balance-sheet-statement"
+
+RESOURCES = (PROFILE, RATIOS, INCOME_STATEMENT, BALANCE_SHEET)
+
+# Risorse che accettano il parametro period
+_PERIODIC = {RATIOS, INCOME_STATEMENT, BALANCE_SHEET}
+
+
+class FetchPlan:
+    """Insieme di risorse FMP da recuperare per un ticker"""
+
+    def __init__(self, ticker: str, api_key: Optional[str] = None,
+                 transport: Optional[FMPTransport] = None, period: str = "annual"):
+        """
+        Inizializza il piano
+
+        Args:
+            ticker: Simbolo ticker dell'azienda
+            api_key: Chiave API di Financial Modeling Prep
+            transport: Trasporto HTTP condiviso (default: get_transport())
+            period: Periodo degli statement ("annual" o "quarter")
+        """
+        self.ticker = ticker.upper()
+        self.api_key = api_key or os.getenv('FMP_API_KEY')
+        self.transport = transport or get_transport()
+        self.period = period
+
+        self._required: Set[str] = set()
+        self._responses: Dict[str, Any] = {}
+        self.timed_out: Set[str] = set()
+
+    def require(self, *resources: str) -> "FetchPlan":
+        """
+        Aggiunge risorse al piano
+
+        Args:
+            resources: Nomi delle risorse (PROFILE, RATIOS, ...)
+
+        Returns:
+            Il piano stesso, per concatenare le chiamate
+        """
+        for resource in resources:
+            if resource not in RESOURCES:
+                raise ValueError(f"Risorsa FMP non supportata: {resource}")
+            self._required.add(resource)
+        return self
+
+    def pending(self) -> List[str]:
+        """Risorse richieste e non ancora scaricate"""
+        return sorted(r for r in self._required if r not in self._responses)
+
+    def _params(self, resource: str) -> Dict[str, Any]:
+        params = {'symbol': self.ticker, 'apikey': self.api_key}
+        if resource in _PERIODIC:
+            params['period'] = self.period
+        return params
+
+    async def fetch(self, timeout: Optional[float] = None) -> List[str]:
+        """
+        Scarica in parallelo le risorse mancanti
+
+        Args:
+            timeout: Secondi massimi di attesa (None = nessun limite)
+
+        Returns:
+            Lista delle risorse scadute in questa esecuzione
+        """
+        branches = {
+            resource: self.transport.request(resource, self._params(resource))
+            for resource in self.pending()
+        }
+        results, timed_out = await gather_with_deadline(branches, timeout)
+
+        for resource, result in results.items():
+            if isinstance(result, Exception):
+                print(f"API request error for {resource} ({self.ticker}): {result}")
+            elif result.status_code != 200:
+                print(f"API request failed with status {result.status_code} for {resource} ({self.ticker})")
+            self._responses[resource] = result
+        self.timed_out.update(timed_out)
+        return timed_out
+
+    def fetch_sync(self, timeout: Optional[float] = None) -> List[str]:
+        """Versione bloccante di fetch()"""
+        return self.transport.run(self.fetch(timeout))
+
+    def response(self, resource: str) -> Optional[FMPResponse]:
+        """
+        Risposta grezza di una risorsa
+
+        Returns:
+            FMPResponse o None se la risorsa è fallita, scaduta o non scaricata
+        """
+        result = self._responses.get(resource)
+        return None if result is None or isinstance(result, Exception) else result
+
+    def error(self, resource: str) -> Optional[Exception]:
+        """Eccezione sollevata dal recupero di una risorsa, se presente"""
+        result = self._responses.get(resource)
+        return result if isinstance(result, Exception) else None
+
+    def records(self, resource: str) -> Optional[List[Dict]]:
+        """Lista di record (tutti i periodi) o None se non disponibile"""
+        response = self.response(resource)
+        if response is None or response.status_code != 200:
+            return None
+        data = response.data
+        return data if isinstance(data, list) and len(data) > 0 else None
+
+    def latest(self, resource: str) -> Optional[Dict]:
+        """Record più recente di una risorsa o None"""
+        records = self.records(resource)
+        return records[0] if records else None
@@ -15,70 +15,67 @@ Usage:
     print(f"P/E: {pe}, P/B: {pb}, ROE: {roe}%")
 """
 
-import requests
+import asyncio
 import os
 from typing import Optional
 
+from .fetch_plan import BALANCE_SHEET, INCOME_STATEMENT, PROFILE, RATIOS, FetchPlan
+from .fundamentals_store import FundamentalsStore
+from .http_client import FMPTransport, get_transport
+
 
 class FinancialRatios:
     """Calculate P/E, P/B, and ROE ratios for a given ticker."""
     
-    def __init__(self, ticker: str, api_key: Optional[str] = None):
+    def __init__(self, ticker: str, api_key: Optional[str] = None,
+                 transport: Optional[FMPTransport] = None,
+                 plan: Optional[FetchPlan] = None,
+                 store: Optional[FundamentalsStore] = None):
         self.ticker = ticker.upper()
         self.api_key = api_key or os.getenv('FMP_API_KEY')
         
         if not self.api_key:
             raise ValueError("API key required")
         
+        self._transport = transport or get_transport()
+        # Piano condivisibile con altri consumatori dello stesso ticker
+        self._plan = plan or FetchPlan(self.ticker, self.api_key, self._transport)
+        # Archivio in cui salvare tutti i periodi scaricati (i ratios usano il più recente)
+        self._store = store
+        
         self._profile = None
         self._ratios = None
         self._income_statement = None
         self._balance_sheet = None
         self._loaded = False
     
-    def _request(self, endpoint: str) -> Optional[dict]:
-        """Make API request."""
-        try:
-            url = f"https://financialmodelingprep.com/stable/{endpoint}&apikey={self.api_key}"
-            response = requests.get(url, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                return data if isinstance(data, list) and len(data) > 0 else None
-            else:
-                print(f"API request failed with status {response.status_code} for {endpoint}")
-            return None
-        except Exception as e:
-            print(f"API request error for {endpoint}: {e}")
-            return None
-    
-    def _load_data(self):
-        """Load necessary data from API."""
+    async def load_async(self):
+        """Load necessary data from API without blocking the caller's event loop."""
         if self._loaded:
             return
         
-        # Get company profile
-        profile_data = self._request(f"profile?symbol={self.ticker}")
-        if profile_data:
-            self._profile = profile_data[0]
-        
-        # Get financial ratios
-        ratios_data = self._request(f"ratios?symbol={self.ticker}&period=annual")
-        if ratios_data:
-            self._ratios = ratios_data[0]
+        # Fetch only what the shared plan does not already hold, concurrently
+        await self._plan.require(PROFILE, RATIOS, INCOME_STATEMENT, BALANCE_SHEET).fetch()
         
-        # Get income statement
-        income_data = self._request(f"income-statement?symbol={self.ticker}&period=annual")
-        if income_data:
-            self._income_statement = income_data[0]
+        self._profile = self._plan.latest(PROFILE)
+        self._ratios = self._plan.latest(RATIOS)
+        self._income_statement = self._plan.latest(INCOME_STATEMENT)
+        self._balance_sheet = self._plan.latest(BALANCE_SHEET)
         
-        # Get balance sheet
-        balance_data = self._request(f"balance-sheet-statement?symbol={self.ticker}&period=annual")
-        if balance_data:
-            self._balance_sheet = balance_data[0]
+        if self._store is not None:
+            try:
+                await asyncio.to_thread(self._store.append_plan, self._plan)
+            except Exception as e:
+                print(f"Error storing fundamentals history for {self.ticker}: {e}")
         
         self._loaded = True
     
+    def _load_data(self):
+        """Load necessary data from API."""
+        if self._loaded:
+            return
+        self._transport.run(self.load_async())
+    
     def get_pe_ratio(self) -> Optional[float]:
         """Calculate P/E ratio."""
         self._load_data()
@@ -156,6 +153,11 @@ class FinancialRatios:
             'pb_ratio': self.get_pb_ratio(),
             'roe_percent': self.get_roe()
         }
+    
+    async def get_all_ratios_async(self) -> dict:
+        """Get all three ratios, loading data asynchronously."""
+        await self.load_async()
+        return self.get_all_ratios()
 
 
 def calculate_ratios(ticker: str, api_key: Optional[str] = None) -> dict:
@@ -3,89 +3,612 @@
 Fortune 500 Cache Manager
 Gestisce un dizionario locale con le aziende Fortune 500 per evitare chiamate API non necessarie.
 Se un'azienda non viene trovata nel dizionario, viene cercata tramite API e aggiunta alla cache.
+
+Persistenza: lo snapshot completo è in formato binario compatto
+(modules/company_snapshot.py, un record per azienda, letto tramite mmap).
+Il caricamento non decodifica le aziende: le ricerche per ticker leggono
+direttamente lo snapshot mappato (ricerca binaria sulla colonna ordinata per
+ticker) e le aziende del journal o aggiunte in seguito stanno in memoria
+sopra di esso (CompanyMap), quindi tempo di avvio e memoria non crescono
+con il numero di aziende. Le aziende aggiunte in seguito vengono accodate a un journal (una riga JSON
+per azienda), quindi il costo di salvataggio per ogni nuova azienda non
+dipende dalla dimensione della cache. Quando il journal supera
+JOURNAL_COMPACT_THRESHOLD voci, un thread in background lo compatta in un
+nuovo snapshot. Snapshot e journal compattato sono scritti su file
+temporaneo e poi rinominati (scrittura atomica): un crash a metà scrittura
+non corrompe la cache.
+
+Il vecchio file JSON resta supportato per la migrazione: se lo snapshot
+binario non esiste viene importato automaticamente, e export_json /
+import_json convertono nei due sensi.
 """
 
 import json
 import os
-from typing import Optional, Dict, List, Tuple
-from dataclasses import dataclass, asdict
+import sys
+import threading
+from collections.abc import Mapping
+from typing import Any, Optional, Dict, Iterable, List, Tuple
 from datetime import datetime, timedelta
 import logging
 
+from .company_index import CompanyIndex, PrefixIndex
+from .company_snapshot import (
+    CompanySnapshot, FileLock, atomic_write, file_id, from_epoch_micros, now_micros, to_epoch_micros,
+    write_snapshot
+)
+
+# Punteggio minimo (0-1) perché una corrispondenza fuzzy sia considerata affidabile;
+# sotto questa soglia la ricerca prosegue tramite API
+FUZZY_MATCH_THRESHOLD = 0.7
+
+# Voci del journal oltre le quali viene avviata una compattazione in background
+JOURNAL_COMPACT_THRESHOLD = 500
+
+# Aggiunte in blocco oltre le quali gli indici sono ricostruiti invece che aggiornati
+BULK_REINDEX_THRESHOLD = 1000
+
 # Configurazione logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+def _intern(value: Optional[str]) -> Optional[str]:
+    """Stringa condivisa per i valori ripetuti (exchange, settori, industry)"""
+    return sys.intern(value) if type(value) is str else value
+
+
 class CachedCompany:
-    """Classe per rappresentare un'azienda nella cache"""
-    symbol: str
-    name: str
-    exchange: str
-    market_cap: Optional[float] = None
-    sector: Optional[str] = None
-    industry: Optional[str] = None
-    last_updated: str = None
-    
-    def __post_init__(self):
-        if self.last_updated is None:
-            self.last_updated = datetime.now().isoformat()
+    """
+    Classe per rappresentare un'azienda nella cache
+    
+    Record compatto: __slots__ invece di un __dict__ per istanza, exchange,
+    settore e industry internati (una sola copia per valore distinto) e data
+    di aggiornamento come intero (updated_at, microsecondi epoch).
+    last_updated resta disponibile come stringa ISO.
+    """
+    __slots__ = ("symbol", "name", "exchange", "market_cap", "sector", "industry", "updated_at")
+    
+    def __init__(self, symbol: str, name: str, exchange: str, market_cap: Optional[float] = None,
+                 sector: Optional[str] = None, industry: Optional[str] = None,
+                 last_updated: Optional[str] = None, updated_at: Optional[int] = None):
+        self.symbol = symbol
+        self.name = name
+        self.exchange = _intern(exchange)
+        self.market_cap = market_cap
+        self.sector = _intern(sector)
+        self.industry = _intern(industry)
+        if updated_at is None:
+            updated_at = to_epoch_micros(last_updated) if last_updated is not None else now_micros()
+        self.updated_at = updated_at
+    
+    @property
+    def last_updated(self) -> Optional[str]:
+        """Data dell'ultimo aggiornamento in formato ISO"""
+        return from_epoch_micros(self.updated_at)
+    
+    @last_updated.setter
+    def last_updated(self, value: Optional[str]) -> None:
+        self.updated_at = to_epoch_micros(value)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Campi dell'azienda nel formato JSON della cache"""
+        return {
+            "symbol": self.symbol,
+            "name": self.name,
+            "exchange": self.exchange,
+            "market_cap": self.market_cap,
+            "sector": self.sector,
+            "industry": self.industry,
+            "last_updated": self.last_updated,
+        }
+    
+    def _fields(self) -> Tuple:
+        return tuple(getattr(self, field) for field in self.__slots__)
+    
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._fields() == other._fields()
+    
+    __hash__ = None
+    
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"CachedCompany({fields})"
+
+
+def _atomic_write(path: str, content: str) -> None:
+    """Scrive un file di testo in modo atomico (file temporaneo + rename)"""
+    atomic_write(path, content.encode('utf-8'))
+
+
+class CompanyMap(Mapping):
+    """
+    Aziende della cache per ticker (in maiuscolo): snapshot mappato più overlay
+    
+    Le righe dello snapshot vengono decodificate in CachedCompany solo quando
+    lette; le aziende inserite dopo il caricamento (journal, nuove aggiunte)
+    stanno in un dizionario che ha la precedenza sullo snapshot. L'ordine di
+    iterazione è quello di un dict: righe dello snapshot (una sostituzione
+    mantiene la posizione), poi le aziende nuove in ordine di inserimento.
+    """
+    
+    def __init__(self, snapshot: Optional[CompanySnapshot] = None):
+        """
+        Args:
+            snapshot: Snapshot aperto (la mappa ne diventa proprietaria) o None
+        """
+        self._snapshot = snapshot
+        self._overlay: Dict[str, CachedCompany] = {}
+        # Ticker dell'overlay che sostituiscono una riga dello snapshot -> riga
+        self._shadowed: Dict[str, int] = {}
+    
+    def _find(self, key: str) -> Optional[int]:
+        return self._snapshot.find(key) if self._snapshot is not None else None
+    
+    def __getitem__(self, key: str) -> CachedCompany:
+        company = self._overlay.get(key)
+        if company is not None:
+            return company
+        row = self._find(key)
+        if row is None:
+            raise KeyError(key)
+        return CachedCompany(**self._snapshot.row(row))
+    
+    def __setitem__(self, key: str, company: CachedCompany) -> None:
+        if key not in self._overlay:
+            row = self._find(key)
+            if row is not None:
+                self._shadowed[key] = row
+        self._overlay[key] = company
+    
+    def __contains__(self, key: object) -> bool:
+        return key in self._overlay or (isinstance(key, str) and self._find(key) is not None)
+    
+    def __len__(self) -> int:
+        rows = len(self._snapshot) if self._snapshot is not None else 0
+        return rows + len(self._overlay) - len(self._shadowed)
+    
+    def _snapshot_keys(self):
+        if self._snapshot is not None:
+            for row in range(len(self._snapshot)):
+                yield row, self._snapshot.symbol(row).upper()
+    
+    def __iter__(self):
+        for _, key in self._snapshot_keys():
+            yield key
+        for key in self._overlay:
+            if key not in self._shadowed:
+                yield key
+    
+    def items(self):
+        for row, key in self._snapshot_keys():
+            company = self._overlay.get(key) if key in self._shadowed else None
+            yield key, company if company is not None else CachedCompany(**self._snapshot.row(row))
+        for key, company in self._overlay.items():
+            if key not in self._shadowed:
+                yield key, company
+    
+    def values(self):
+        for _, company in self.items():
+            yield company
+    
+    def copy(self) -> "CompanyMap":
+        """Copia con lo stesso snapshot (condiviso) e una copia dell'overlay"""
+        result = CompanyMap(self._snapshot)
+        result._overlay = dict(self._overlay)
+        result._shadowed = dict(self._shadowed)
+        return result
+    
+    def counts(self, field: str) -> Dict[str, int]:
+        """Numero di aziende per exchange o settore ("exchange" / "sector")"""
+        counts = self._snapshot.counts(field, self._shadowed.values()) if self._snapshot is not None else {}
+        for company in self._overlay.values():
+            value = getattr(company, field)
+            if value:
+                counts[value] = counts.get(value, 0) + 1
+        return counts
+    
+    def newest_update(self) -> Optional[int]:
+        """Data di aggiornamento più recente (microsecondi epoch) o None"""
+        candidates = [company.updated_at for company in self._overlay.values()]
+        if self._snapshot is not None:
+            candidates.append(self._snapshot.newest_update())
+        return max((value for value in candidates if value is not None), default=None)
 
 
 class Fortune500Cache:
-    """Gestore della cache Fortune 500"""
+    """
+    Gestore della cache Fortune 500
+    
+    Sicura tra thread e tra processi (più worker uvicorn sugli stessi file):
+    
+    - in memoria dizionario, statistiche e indici sono protetti da un unico
+      RLock, tenuto solo per la durata di una lettura o di un inserimento;
+    - su disco ogni accesso a snapshot e journal avviene con un lock
+      esclusivo tra processi (FileLock, flock su `<cache_file>.lock`);
+    - ogni processo ricorda fin dove ha letto il journal e quale snapshot ha
+      caricato: prima di ogni ricerca due stat() rilevano le aziende aggiunte
+      da altri worker (lette dal journal) o una compattazione (snapshot
+      ricaricato), senza riavvio.
+    """
     
     def __init__(self, cache_file: str = "fortune500_cache.json"):
         """
         Inizializza il gestore della cache
         
         Args:
-            cache_file: Percorso del file di cache JSON
+            cache_file: Percorso del file di cache JSON (formato legacy, usato per
+                        la migrazione); snapshot binario, journal e lock stanno accanto
         """
         self.cache_file = cache_file
-        self.cache: Dict[str, CachedCompany] = {}
+        self.snapshot_file = f"{os.path.splitext(cache_file)[0]}.bin"
+        self.journal_file = f"{cache_file}.journal"
+        # Una sola voce per azienda, con il ticker come chiave; la ricerca per
+        # nome passa dagli indici secondari
+        self.cache = CompanyMap()
+        # Statistiche calcolate alla prima richiesta dalle colonne dello
+        # snapshot, poi mantenute ad ogni inserimento (get_cache_stats in O(1))
+        self._exchange_counts: Optional[Dict[str, int]] = None
+        self._sector_counts: Optional[Dict[str, int]] = None
+        self._newest_update: Optional[int] = None
+        self.index = CompanyIndex()
+        # I suggerimenti sono risolti dalla cache: l'indice non conserva le aziende
+        self.prefix_index = PrefixIndex(resolve=self.cache_lookup)
+        # Gli indici vengono costruiti alla prima ricerca (o da build_index in
+        # background), non durante il caricamento
+        self._indexed = False
+        # Stato in memoria (dizionario, statistiche, indici, aziende in sospeso)
+        self._lock = threading.RLock()
+        
+        # Aziende aggiunte e non ancora scritte nel journal
+        self._pending: List[CachedCompany] = []
+        self._journal_entries = 0
+        # File su disco: lock tra processi; snapshot caricato e byte del journal già letti
+        self._file_lock = FileLock(f"{cache_file}.lock")
+        self._snapshot_id = None
+        self._journal_offset = 0
+        self._compaction: Optional[threading.Thread] = None
+        self._refreshing: Optional[threading.Thread] = None
         self.load_cache()
     
     def load_cache(self) -> None:
-        """Carica la cache dal file JSON"""
+        """Carica lo snapshot (binario, o JSON legacy) e riapplica le aziende del journal"""
+        with self._file_lock:
+            self._load_locked()
+    
+    def _load_locked(self) -> None:
+        """Ricarica tutto dai file (da chiamare con _file_lock acquisito)"""
+        migrate = False
+        with self._lock:
+            self._reset()
+            self._snapshot_id = file_id(self.snapshot_file)
+            try:
+                if self._snapshot_id is not None:
+                    try:
+                        # Nessuna decodifica: le righe sono lette dal file mappato quando servono
+                        self.cache = CompanyMap(CompanySnapshot(self.snapshot_file))
+                    except (OSError, ValueError) as e:
+                        # Snapshot illeggibile: si riparte dal JSON legacy, se presente
+                        logger.error(f"Snapshot binario non valido: {e}")
+                        self._reset()
+                        migrate = os.path.exists(self.cache_file)
+                else:
+                    migrate = os.path.exists(self.cache_file)
+                
+                if migrate:
+                    for company in self._read_json(self.cache_file):
+                        self._store(company)
+                if self.cache:
+                    logger.info(f"Cache caricata: {len(self.cache)} aziende")
+                else:
+                    logger.info("File cache non trovato, inizializzazione cache vuota")
+            except Exception as e:
+                logger.error(f"Errore nel caricamento della cache: {e}")
+                self._reset()
+                migrate = False
+            
+            companies, self._journal_offset = self._read_journal()
+            for company in companies:
+                self._store(company)
+            self._journal_entries = len(companies)
+            if self._journal_entries:
+                logger.info(f"Journal riapplicato: {self._journal_entries} aziende")
+            # Le aziende non ancora salvate da questo processo restano valide
+            for company in self._pending:
+                self._store(company)
+            self._indexed = False
+        
+        if migrate:
+            logger.info("Migrazione della cache JSON allo snapshot binario")
+            self.compact()
+    
+    def refresh(self) -> bool:
+        """
+        Applica le modifiche scritte su disco da altri processi
+        
+        Costa due stat() quando non è cambiato nulla; altrimenti legge solo
+        le nuove righe del journal, o ricarica tutto se un altro processo ha
+        scritto un nuovo snapshot.
+        
+        Returns:
+            True se la cache in memoria è stata aggiornata
+        """
+        if not self._files_changed():
+            return False
+        with self._file_lock:
+            return self._sync_locked()
+    
+    def refresh_in_background(self) -> None:
+        """
+        Come refresh, ma senza attendere il lock tra processi
+        
+        Costa due stat(); se i file sono cambiati l'allineamento avviene in un
+        thread separato (adatto all'event loop: il lock tra processi può essere
+        tenuto a lungo da una compattazione di un altro worker).
+        """
+        if not self._files_changed():
+            return
+        if self._refreshing is not None and self._refreshing.is_alive():
+            return
+        self._refreshing = threading.Thread(target=self.refresh, name="fortune500-refresh", daemon=True)
+        self._refreshing.start()
+    
+    def _files_changed(self) -> bool:
+        return (file_id(self.snapshot_file) != self._snapshot_id
+                or self._journal_size() != self._journal_offset)
+    
+    def _journal_size(self) -> int:
         try:
-            if os.path.exists(self.cache_file):
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.cache = {
-                        key: CachedCompany(**value) 
-                        for key, value in data.items()
-                    }
-                logger.info(f"Cache caricata: {len(self.cache)} aziende")
-            else:
-                logger.info("File cache non trovato, inizializzazione cache vuota")
-                self.cache = {}
-        except Exception as e:
-            logger.error(f"Errore nel caricamento della cache: {e}")
-            self.cache = {}
+            return os.path.getsize(self.journal_file)
+        except OSError:
+            return 0
+    
+    def _sync_locked(self) -> bool:
+        """Allinea la memoria ai file (da chiamare con _file_lock acquisito)"""
+        if file_id(self.snapshot_file) != self._snapshot_id or self._journal_size() < self._journal_offset:
+            self._load_locked()
+            return True
+        if self._journal_size() == self._journal_offset:
+            return False
+        
+        companies, self._journal_offset = self._read_journal(self._journal_offset)
+        with self._lock:
+            for company in companies:
+                current = self.cache.get(company.symbol.upper())
+                # Un'azienda già aggiornata più di recente da questo processo non viene sovrascritta
+                if (current is not None and current.updated_at is not None and company.updated_at is not None
+                        and current.updated_at > company.updated_at):
+                    continue
+                self._insert(company)
+            self._journal_entries += len(companies)
+        if companies:
+            logger.info(f"Journal: {len(companies)} aziende aggiunte da altri processi")
+        return True
+    
+    def _reset(self) -> None:
+        """Svuota il dizionario in memoria e le statistiche"""
+        self.cache = CompanyMap()
+        self._exchange_counts = None
+        self._sector_counts = None
+        self._newest_update = None
+    
+    def cache_lookup(self, symbol: str) -> CachedCompany:
+        """Azienda in cache con il ticker indicato (in maiuscolo); KeyError se assente"""
+        return self.cache[symbol]
+    
+    @staticmethod
+    def _read_json(path: str) -> List[CachedCompany]:
+        """Legge un file di cache nel formato JSON legacy (le chiavi gemelle name_ sono ignorate)"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return [
+            CachedCompany(**value)
+            for key, value in data.items() if not key.startswith("name_")
+        ]
+    
+    def companies(self) -> List[CachedCompany]:
+        """Aziende distinte (una per ticker) in ordine di inserimento"""
+        self.refresh()
+        with self._lock:
+            return list(self.cache.values())
+    
+    def export_json(self, path: Optional[str] = None) -> None:
+        """
+        Esporta la cache nel formato JSON legacy (scrittura atomica)
+        
+        Args:
+            path: File di destinazione (default: cache_file)
+        """
+        cache_data = {}
+        companies = self.companies()
+        for company in companies:
+            # Il formato legacy duplica ogni azienda sotto una chiave name_
+            cache_data[company.symbol.upper()] = company.to_dict()
+            cache_data[f"name_{company.name.lower().replace(' ', '_')}"] = company.to_dict()
+        _atomic_write(path or self.cache_file, json.dumps(cache_data, indent=2, ensure_ascii=False))
+        logger.info(f"Cache esportata in JSON: {len(companies)} aziende")
+    
+    def import_json(self, path: str) -> int:
+        """
+        Importa le aziende da un file JSON legacy e aggiorna lo snapshot
+        
+        Args:
+            path: File JSON da importare
+            
+        Returns:
+            Numero di aziende importate
+        """
+        imported = self._read_json(path)
+        self.add_companies(imported)
+        self.compact()
+        return len(imported)
+    
+    def _read_journal(self, offset: int = 0) -> Tuple[List[CachedCompany], int]:
+        """
+        Legge le aziende dal journal a partire da un offset in byte
+        
+        Un'ultima riga incompleta (crash durante un'aggiunta) viene ignorata e
+        rimossa dal file, così le aggiunte successive non vi si accodano.
+        
+        Returns:
+            Tupla (aziende, offset dopo l'ultima riga completa)
+        """
+        companies = []
+        if not os.path.exists(self.journal_file):
+            return companies, 0
+        try:
+            with open(self.journal_file, 'rb') as f:
+                f.seek(offset)
+                content = f.read()
+            complete, newline, partial = content.rpartition(b"\n")
+            for line in complete.splitlines():
+                try:
+                    companies.append(CachedCompany(**json.loads(line)))
+                except (ValueError, TypeError):
+                    logger.warning("Riga del journal non valida ignorata")
+            if partial:
+                logger.warning("Ultima riga del journal incompleta: rimossa")
+                with open(self.journal_file, 'r+b') as f:
+                    f.truncate(offset + len(complete) + len(newline))
+            return companies, offset + len(complete) + len(newline)
+        except OSError as e:
+            logger.error(f"Errore nella lettura del journal: {e}")
+            return companies, offset
+    
+    def _ensure_index(self) -> None:
+        """Costruisce gli indici di ricerca alla prima ricerca dopo un caricamento"""
+        if self._indexed:
+            return
+        with self._lock:
+            if not self._indexed:
+                self._rebuild_index()
+                self._indexed = True
+    
+    def build_index(self) -> None:
+        """Costruisce subito gli indici di ricerca (es. in background all'avvio)"""
+        self._ensure_index()
+    
+    def _rebuild_index(self) -> None:
+        """Ricostruisce gli indici di ricerca dal contenuto della cache (una sola lettura)"""
+        self.index.clear()
+        
+        def companies():
+            for key, company in self.cache.items():
+                self.index.add(key, company.name)
+                yield company
+        
+        self.prefix_index.rebuild(companies())
     
     def save_cache(self) -> None:
-        """Salva la cache nel file JSON"""
+        """
+        Rende persistenti le aziende aggiunte dall'ultimo salvataggio
+        
+        Le nuove aziende vengono accodate al journal (costo proporzionale alle
+        sole aziende nuove); oltre JOURNAL_COMPACT_THRESHOLD voci parte una
+        compattazione in background.
+        """
+        with self._file_lock:
+            try:
+                self._flush_pending_locked()
+            except Exception as e:
+                logger.error(f"Errore nel salvataggio della cache: {e}")
+                return
+        
+        if self._journal_entries >= JOURNAL_COMPACT_THRESHOLD:
+            self.compact_in_background()
+    
+    def compact(self) -> None:
+        """
+        Scrive uno snapshot completo e rimuove il journal
+        
+        Con il lock tra processi acquisito la memoria viene prima allineata ai
+        file (aziende aggiunte da altri worker), quindi lo snapshot contiene
+        tutto il journal; le aziende in sospeso vanno direttamente nello
+        snapshot, senza passare dal journal. Le ricerche e gli inserimenti in
+        memoria non attendono la scrittura. Al termine la cache legge il nuovo
+        snapshot e in memoria restano solo le aziende aggiunte nel frattempo.
+        """
         try:
-            # Crea la directory se non esiste (solo se il percorso ha una directory)
-            cache_dir = os.path.dirname(self.cache_file)
-            if cache_dir:
-                os.makedirs(cache_dir, exist_ok=True)
-            
-            # Converte i dataclass in dizionari per la serializzazione JSON
-            cache_data = {
-                key: asdict(company) 
-                for key, company in self.cache.items()
-            }
+            with self._file_lock:
+                self._sync_locked()
+                with self._lock:
+                    # Copia dell'overlay: le righe sono decodificate durante la scrittura, senza _lock
+                    companies = self.cache.copy()
+                    pending, self._pending = self._pending, []
+                try:
+                    write_snapshot(self.snapshot_file, companies.values())
+                except Exception:
+                    with self._lock:
+                        self._pending = pending + self._pending
+                    raise
+                if os.path.exists(self.journal_file):
+                    os.remove(self.journal_file)
+                self._snapshot_id = file_id(self.snapshot_file)
+                self._journal_offset = 0
+                self._journal_entries = 0
+                self._rebase()
             
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, indent=2, ensure_ascii=False)
-            
-            logger.info(f"Cache salvata: {len(self.cache)} aziende")
+            logger.info(f"Cache salvata: {len(companies)} aziende")
         except Exception as e:
             logger.error(f"Errore nel salvataggio della cache: {e}")
     
+    def wait_for_compaction(self, timeout: Optional[float] = None) -> None:
+        """Attende la fine della compattazione in background, se in corso"""
+        if self._compaction is not None:
+            self._compaction.join(timeout)
+    
+    def _rebase(self) -> None:
+        """
+        Sostituisce la mappa con lo snapshot appena scritto (con _file_lock acquisito)
+        
+        Stesso contenuto e stesso ordine: indici e statistiche restano validi.
+        Le aziende in sospeso (aggiunte durante la scrittura) tornano nell'overlay.
+        """
+        try:
+            snapshot = CompanySnapshot(self.snapshot_file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Snapshot appena scritto non leggibile: {e}")
+            return
+        with self._lock:
+            self.cache = CompanyMap(snapshot)
+            for company in self._pending:
+                key = company.symbol.upper()
+                self.cache[key] = company
+    
+    def compact_in_background(self) -> None:
+        """Avvia la compattazione in un thread separato (se non già in corso)"""
+        if self._compaction is not None and self._compaction.is_alive():
+            return
+        self._compaction = threading.Thread(target=self.compact, name="fortune500-compaction", daemon=True)
+        self._compaction.start()
+    
+    def _flush_pending_locked(self) -> None:
+        """Accoda al journal le aziende in sospeso (da chiamare con _file_lock acquisito)"""
+        # Prima le aggiunte degli altri processi: l'offset letto resta allineato al file
+        self._sync_locked()
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, []
+        try:
+            journal_dir = os.path.dirname(self.journal_file)
+            if journal_dir:
+                os.makedirs(journal_dir, exist_ok=True)
+            lines = "".join(json.dumps(company.to_dict(), ensure_ascii=False) + "\n" for company in pending)
+            with open(self.journal_file, 'ab') as f:
+                f.write(lines.encode('utf-8'))
+                f.flush()
+                self._journal_offset = f.tell()
+        except Exception:
+            # Riprova al prossimo salvataggio
+            with self._lock:
+                self._pending = pending + self._pending
+            raise
+        self._journal_entries += len(pending)
+        logger.info(f"Journal aggiornato: {len(pending)} aziende")
+    
     def search_company(self, company_name: str) -> Optional[CachedCompany]:
         """
         Cerca un'azienda nella cache per nome
@@ -98,22 +621,93 @@ class Fortune500Cache:
         """
         company_name_lower = company_name.lower().strip()
         
-        # Cerca corrispondenze esatte
-        for key, company in self.cache.items():
-            if company.name.lower() == company_name_lower:
-                return company
+        self.refresh()
+        self._ensure_index()
+        with self._lock:
+            # Cerca corrispondenze esatte, poi parziali (contiene / contenuto in):
+            # gli indici restituiscono la prima voce in ordine di inserimento
+            key = self.index.find_exact(company_name_lower)
+            if key is None:
+                key = self.index.find_substring(company_name_lower)
+            if key is not None:
+                return self.cache[key]
+            
+            # Cerca per ticker symbol
+            return self.cache.get(company_name_lower.upper())
+    
+    def fuzzy_search(self, company_name: str, limit: int = 5) -> List[Tuple[CachedCompany, float]]:
+        """
+        Ricerca tollerante agli errori di battitura con risultati ordinati
+        
+        Args:
+            company_name: Nome (anche approssimato) o ticker dell'azienda
+            limit: Numero massimo di risultati
+            
+        Returns:
+            Lista di tuple (azienda, punteggio 0-1), una per ticker, in ordine
+            di punteggio decrescente; un ticker esatto ha punteggio 1
+        """
+        company_name_lower = company_name.lower().strip()
+        results = []
+        seen = set()
+        
+        self.refresh()
+        self._ensure_index()
+        with self._lock:
+            by_symbol = self.cache.get(company_name_lower.upper()) if company_name_lower else None
+            if by_symbol:
+                results.append((by_symbol, 1.0))
+                seen.add(by_symbol.symbol.upper())
+            
+            for key, score in self.index.fuzzy(company_name_lower, limit + len(results)):
+                company = self.cache[key]
+                if company.symbol.upper() not in seen:
+                    seen.add(company.symbol.upper())
+                    results.append((company, score))
         
-        # Cerca corrispondenze parziali (contiene)
-        for key, company in self.cache.items():
-            if company_name_lower in company.name.lower() or company.name.lower() in company_name_lower:
-                return company
+        results.sort(key=lambda item: -item[1])
+        return results[:limit]
+    
+    def match_company(self, company_name: str,
+                      threshold: float = FUZZY_MATCH_THRESHOLD) -> Optional[Tuple[CachedCompany, float]]:
+        """
+        Migliore corrispondenza in cache, solo se abbastanza affidabile
         
-        # Cerca per ticker symbol
-        if company_name_lower.upper() in self.cache:
-            return self.cache[company_name_lower.upper()]
+        Args:
+            company_name: Nome (anche approssimato) o ticker dell'azienda
+            threshold: Punteggio minimo richiesto
+            
+        Returns:
+            Tupla (azienda, punteggio) o None se il miglior punteggio è sotto la soglia
+        """
+        self.refresh()
+        self._ensure_index()
+        with self._lock:
+            key = self.index.find_exact(company_name.lower().strip())
+            if key is not None:
+                return self.cache[key], 1.0
         
+        candidates = self.fuzzy_search(company_name, limit=1)
+        if candidates and candidates[0][1] >= threshold:
+            return candidates[0]
         return None
     
+    def suggest(self, partial_name: str, limit: int = 10) -> List[CachedCompany]:
+        """
+        Suggerimenti per nome o ticker che iniziano con il testo digitato
+        
+        Args:
+            partial_name: Nome o ticker parziale (es. "App", "MS")
+            limit: Numero massimo di suggerimenti
+            
+        Returns:
+            Aziende distinte ordinate per market cap decrescente
+        """
+        self.refresh()
+        self._ensure_index()
+        with self._lock:
+            return self.prefix_index.suggest(partial_name.lower().strip(), limit)
+    
     def add_company(self, company: CachedCompany) -> None:
         """
         Aggiunge un'azienda alla cache
@@ -121,16 +715,74 @@ class Fortune500Cache:
         Args:
             company: Oggetto CachedCompany da aggiungere
         """
-        # Usa il ticker come chiave principale
-        key = company.symbol.upper()
-        self.cache[key] = company
-        
-        # Aggiungi anche una chiave per il nome per ricerche più veloci
-        name_key = f"name_{company.name.lower().replace(' ', '_')}"
-        self.cache[name_key] = company
+        with self._lock:
+            self._insert(company)
+            self._pending.append(company)
         
         logger.info(f"Aggiunta alla cache: {company.name} ({company.symbol})")
     
+    def add_companies(self, companies: Iterable[CachedCompany]) -> int:
+        """
+        Aggiunge molte aziende in blocco (es. precaricamento dell'universo)
+        
+        Oltre BULK_REINDEX_THRESHOLD aziende gli indici non vengono aggiornati
+        uno per uno ma ricostruiti in un solo passaggio alla prima ricerca
+        (o con build_index).
+        
+        Args:
+            companies: Oggetti CachedCompany da aggiungere
+            
+        Returns:
+            Numero di aziende aggiunte
+        """
+        companies = list(companies)
+        with self._lock:
+            if len(companies) > BULK_REINDEX_THRESHOLD:
+                self._indexed = False
+            for company in companies:
+                self._insert(company)
+            self._pending.extend(companies)
+        
+        logger.info(f"Aggiunte alla cache: {len(companies)} aziende")
+        return len(companies)
+    
+    def _insert(self, company: CachedCompany) -> None:
+        """Inserisce l'azienda e aggiorna gli indici, se costruiti (con _lock acquisito)"""
+        key = self._store(company)
+        if self._indexed:
+            self.index.add(key, company.name)
+            self.prefix_index.add(company)
+    
+    def _store(self, company: CachedCompany) -> str:
+        """Inserisce l'azienda nel dizionario e restituisce la chiave usata"""
+        # Usa il ticker come chiave (la stessa stringa, se già in maiuscolo)
+        key = company.symbol.upper()
+        if key == company.symbol:
+            key = company.symbol
+        if self._exchange_counts is not None:
+            previous = self.cache.get(key)
+            if previous is not None:
+                self._count(previous, -1)
+        self.cache[key] = company
+        self._count(company, 1)
+        return key
+    
+    def _count(self, company: CachedCompany, delta: int) -> None:
+        """Aggiorna i contatori per exchange e settore (+1 inserimento, -1 sostituzione)"""
+        if self._exchange_counts is None:
+            return
+        for counts, value in ((self._exchange_counts, company.exchange), (self._sector_counts, company.sector)):
+            if not value:
+                continue
+            count = counts.get(value, 0) + delta
+            if count > 0:
+                counts[value] = count
+            else:
+                counts.pop(value, None)
+        if delta > 0 and company.updated_at is not None:
+            if self._newest_update is None or company.updated_at > self._newest_update:
+                self._newest_update = company.updated_at
+    
     def get_company_by_symbol(self, symbol: str) -> Optional[CachedCompany]:
         """
         Ottiene un'azienda dalla cache tramite il ticker symbol
@@ -141,6 +793,7 @@ class Fortune500Cache:
         Returns:
             CachedCompany se trovata, None altrimenti
         """
+        self.refresh()
         return self.cache.get(symbol.upper())
     
     def is_cache_stale(self, max_age_days: int = 30) -> bool:
@@ -156,46 +809,67 @@ class Fortune500Cache:
         if not self.cache:
             return True
         
-        # Controlla l'ultima modifica del file
+        # Controlla l'ultima modifica dello snapshot
         try:
-            file_mtime = os.path.getmtime(self.cache_file)
+            path = self.snapshot_file if os.path.exists(self.snapshot_file) else self.cache_file
+            file_mtime = os.path.getmtime(path)
             file_age = datetime.now() - datetime.fromtimestamp(file_mtime)
             return file_age > timedelta(days=max_age_days)
         except:
             return True
     
-    def get_cache_stats(self) -> Dict:
+    def get_cache_stats(self, wait: bool = True) -> Dict:
         """
         Ottiene statistiche sulla cache
         
-        Returns:
-            Dizionario con statistiche della cache
-        """
-        if not self.cache:
-            return {"total_companies": 0, "exchanges": {}, "sectors": {}}
-        
-        exchanges = {}
-        sectors = {}
+        Alla prima chiamata i contatori sono calcolati dalle colonne intere
+        dello snapshot (senza decodificare le aziende); poi sono aggiornati ad
+        ogni inserimento, quindi il costo non dipende dal numero di aziende
+        (adatto al polling frequente).
         
-        for company in self.cache.values():
-            # Conta solo le aziende con ticker (non le chiavi per nome)
-            if not company.symbol.startswith("name_"):
-                exchanges[company.exchange] = exchanges.get(company.exchange, 0) + 1
-                if company.sector:
-                    sectors[company.sector] = sectors.get(company.sector, 0) + 1
+        Args:
+            wait: Se False le modifiche degli altri processi sono applicate in
+                  background (vedi refresh_in_background) e non si attende il
+                  lock tra processi
         
-        return {
-            "total_companies": len([c for c in self.cache.values() if not c.symbol.startswith("name_")]),
-            "exchanges": exchanges,
-            "sectors": sectors,
-            "last_updated": max([c.last_updated for c in self.cache.values()]) if self.cache else None
-        }
+        Returns:
+            Dizionario con statistiche della cache; last_updated è la data
+            più recente tra le aziende inserite
+        """
+        if wait:
+            self.refresh()
+        else:
+            self.refresh_in_background()
+        with self._lock:
+            if not self.cache:
+                return {"total_companies": 0, "exchanges": {}, "sectors": {}}
+            if self._exchange_counts is None:
+                self._exchange_counts = self.cache.counts("exchange")
+                self._sector_counts = self.cache.counts("sector")
+                self._newest_update = self.cache.newest_update()
+            
+            return {
+                "total_companies": len(self.cache),
+                "exchanges": dict(self._exchange_counts),
+                "sectors": dict(self._sector_counts),
+                "last_updated": from_epoch_micros(self._newest_update)
+            }
     
     def clear_cache(self) -> None:
         """Svuota la cache"""
-        self.cache = {}
-        if os.path.exists(self.cache_file):
-            os.remove(self.cache_file)
+        with self._file_lock:
+            with self._lock:
+                self._reset()
+                self.index.clear()
+                self.prefix_index.clear()
+                self._indexed = True
+                self._pending = []
+            self._journal_entries = 0
+            for path in (self.snapshot_file, self.cache_file, self.journal_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._snapshot_id = None
+            self._journal_offset = 0
         logger.info("Cache svuotata")
 
 
@@ -274,7 +948,7 @@ def initialize_fortune500_cache() -> Fortune500Cache:
             )
             cache.add_company(company)
         
-        cache.save_cache()
+        cache.compact()
         logger.info(f"Cache inizializzata con {len(popular_companies)} aziende Fortune 500")
     
     return cache
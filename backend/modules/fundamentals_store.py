@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Fundamentals Store Module
+Archivio locale e colonnare dello storico dei fondamentali per ticker.
+
+FMP restituisce più esercizi (o trimestri) per ogni statement; l'analisi usa
+il più recente, lo storico viene salvato qui per essere letto in seguito
+senza nuove chiamate. Un file per ticker e periodo:
+
+    {path}/{annual|quarter}/{TICKER}.npy
+
+contiene una matrice float64 (1 + len(COLUMNS), periodi): la riga 0 è la
+data di fine periodo (giorni dall'epoch), le altre un campo FMP ciascuna
+(NaN = assente), con i periodi in ordine di data crescente. Ogni campo è
+quindi un array contiguo.
+
+Le scritture uniscono i nuovi periodi a quelli salvati (un valore mancante
+non cancella quello noto), sotto un lock tra processi, e sostituiscono il
+file in modo atomico solo se qualcosa è cambiato. Le letture mappano il file
+in memoria (np.load con mmap_mode): i worker condividono le stesse pagine e
+chi ha già aperto una versione precedente continua a leggerla fino al
+ricaricamento. Ogni file mappato tiene aperto un descrittore: restano aperti
+solo gli ultimi SERIES_CACHE_SIZE storici letti.
+
+Una scrittura identica all'ultima dello stesso worker (es. statement serviti
+dalla cache delle risposte) su un file non sostituito nel frattempo non legge
+né blocca l'archivio.
+"""
+
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .company_snapshot import FileLock, atomic_write, file_id
+from .fetch_plan import BALANCE_SHEET, INCOME_STATEMENT, RATIOS, FetchPlan
+
+# Percorso predefinito dell'archivio
+DEFAULT_PATH = "cache/fundamentals"
+
+# Periodi degli statement FMP
+PERIODS = ("annual", "quarter")
+
+# Campi salvati per risorsa, nell'ordine delle righe della matrice
+COLUMNS = (
+    (RATIOS, "priceToEarningsRatio"),
+    (RATIOS, "priceEarningsRatio"),
+    (RATIOS, "priceToBookRatio"),
+    (RATIOS, "returnOnEquity"),
+    (INCOME_STATEMENT, "revenue"),
+    (INCOME_STATEMENT, "netIncome"),
+    (INCOME_STATEMENT, "eps"),
+    (INCOME_STATEMENT, "weightedAverageShsOut"),
+    (BALANCE_SHEET, "totalAssets"),
+    (BALANCE_SHEET, "totalLiabilities"),
+    (BALANCE_SHEET, "totalStockholdersEquity"),
+    (BALANCE_SHEET, "commonStock"),
+)
+
+STATEMENTS = (RATIOS, INCOME_STATEMENT, BALANCE_SHEET)
+
+# Storici mappati in memoria tenuti aperti (un descrittore ciascuno)
+SERIES_CACHE_SIZE = 128
+
+# Ultime scritture ricordate per saltare quelle identiche
+APPENDED_CACHE_SIZE = 4096
+
+# Righe della matrice per risorsa: [(riga, campo), ...]
+_RESOURCE_ROWS: Dict[str, List[Tuple[int, str]]] = {resource: [] for resource in STATEMENTS}
+for _row, (_resource, _field) in enumerate(COLUMNS, start=1):
+    _RESOURCE_ROWS[_resource].append((_row, _field))
+
+_ROWS = 1 + len(COLUMNS)
+
+
+def _period_day(record: Dict) -> Optional[int]:
+    """Data di fine periodo di un record FMP in giorni dall'epoch (None se assente)"""
+    try:
+        return int(np.datetime64(str(record["date"])[:10], "D").astype(np.int64))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _number(value: Any) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return np.nan
+    value = float(value)
+    return value if np.isfinite(value) else np.nan
+
+
+def build_block(statements: Dict[str, Optional[List[Dict]]]) -> np.ndarray:
+    """
+    Converte gli statement FMP (tutti i periodi) nella matrice dell'archivio
+
+    Args:
+        statements: Risorsa (RATIOS, INCOME_STATEMENT, BALANCE_SHEET) ->
+            lista di record FMP o None
+
+    Returns:
+        Matrice (1 + len(COLUMNS), periodi) ordinata per data crescente
+    """
+    by_day: Dict[int, np.ndarray] = {}
+    for resource, records in statements.items():
+        rows = _RESOURCE_ROWS.get(resource)
+        if not rows or not records:
+            continue
+        for record in records:
+            if not isinstance(record, dict):
+                continue
+            day = _period_day(record)
+            if day is None:
+                continue
+            column = by_day.get(day)
+            if column is None:
+                column = by_day[day] = np.full(_ROWS, np.nan)
+                column[0] = day
+            for row, field in rows:
+                value = _number(record.get(field))
+                if not np.isnan(value):
+                    column[row] = value
+    if not by_day:
+        return np.empty((_ROWS, 0))
+    return np.stack([by_day[day] for day in sorted(by_day)], axis=1)
+
+
+def merge_blocks(existing: np.ndarray, block: np.ndarray) -> np.ndarray:
+    """
+    Unisce nuovi periodi a quelli salvati
+
+    Per le date già presenti i nuovi valori sostituiscono i vecchi, ma un
+    valore mancante (es. risorsa non scaricata) mantiene quello noto.
+
+    Returns:
+        Nuova matrice ordinata per data
+    """
+    days = np.union1d(existing[0], block[0])
+    merged = np.full((_ROWS, len(days)), np.nan)
+    merged[0] = days
+    merged[1:, np.searchsorted(days, existing[0])] = existing[1:]
+    positions = np.searchsorted(days, block[0])
+    current = merged[1:, positions]
+    merged[1:, positions] = np.where(np.isnan(block[1:]), current, block[1:])
+    return merged
+
+
+class FundamentalsSeries:
+    """Storico di un ticker per un tipo di periodo (viste sulla matrice, senza copie)"""
+
+    def __init__(self, ticker: str, period: str, data: np.ndarray):
+        """
+        Args:
+            ticker: Simbolo ticker
+            period: "annual" o "quarter"
+            data: Matrice dell'archivio (anche mappata in memoria)
+        """
+        self.ticker = ticker
+        self.period = period
+        self.data = data
+
+    @classmethod
+    def from_statements(cls, ticker: str, period: str,
+                        statements: Dict[str, Optional[List[Dict]]]) -> "FundamentalsSeries":
+        """Storico in memoria costruito direttamente dagli statement FMP"""
+        return cls(ticker.upper(), period, build_block(statements))
+
+    def __len__(self) -> int:
+        return self.data.shape[1]
+
+    @property
+    def days(self) -> np.ndarray:
+        """Date di fine periodo in giorni dall'epoch, crescenti"""
+        return self.data[0]
+
+    def dates(self) -> List[str]:
+        """Date di fine periodo (YYYY-MM-DD), dalla più vecchia"""
+        return [str(day) for day in self.days.astype(np.int64).astype("datetime64[D]")]
+
+    def column(self, resource: str, field: str) -> np.ndarray:
+        """
+        Valori di un campo per tutti i periodi (NaN = assente)
+
+        Raises:
+            KeyError: Se il campo non è salvato nell'archivio
+        """
+        try:
+            row = COLUMNS.index((resource, field)) + 1
+        except ValueError:
+            raise KeyError(f"Campo non salvato nell'archivio: {resource}.{field}")
+        return self.data[row]
+
+    def locate(self, date: Optional[str] = None) -> Optional[int]:
+        """
+        Indice dell'ultimo periodo chiuso entro una data
+
+        Args:
+            date: Data YYYY-MM-DD (None = periodo più recente)
+
+        Returns:
+            Indice del periodo o None se non ce ne sono entro la data
+        """
+        if len(self) == 0:
+            return None
+        if date is None:
+            return len(self) - 1
+        day = _period_day({"date": date})
+        if day is None:
+            raise ValueError(f"Data non valida: {date} (formato YYYY-MM-DD)")
+        index = int(np.searchsorted(self.days, day, side="right")) - 1
+        return index if index >= 0 else None
+
+    def statements(self, index: int) -> Dict[str, Optional[Dict]]:
+        """
+        Record di un periodo nel formato FMP
+
+        Args:
+            index: Indice del periodo (anche negativo: -1 = il più recente)
+
+        Returns:
+            Risorsa -> record con "date" e i campi presenti (None se la
+            risorsa non ha valori per il periodo)
+        """
+        values = self.data[:, index].tolist()
+        date = str(np.datetime64(int(values[0]), "D"))
+        result = {}
+        for resource in STATEMENTS:
+            record = {field: values[row] for row, field in _RESOURCE_ROWS[resource]
+                      if values[row] == values[row]}
+            result[resource] = {"date": date, **record} if record else None
+        return result
+
+
+class FundamentalsStore:
+    """Archivio su disco dello storico dei fondamentali, condiviso tra worker"""
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        """
+        Inizializza l'archivio
+
+        Args:
+            path: Cartella dell'archivio (creata se assente)
+        """
+        self.path = path
+        for period in PERIODS:
+            os.makedirs(os.path.join(path, period), exist_ok=True)
+        self._lock = FileLock(os.path.join(path, ".lock"))
+        self._mutex = threading.Lock()
+        # File mappati in memoria, con l'identità del file letto (LRU)
+        self._series: "OrderedDict[Tuple[str, str], Tuple[Any, FundamentalsSeries]]" = OrderedDict()
+        # Ultimo blocco scritto (o già presente) per ticker e periodo, con l'identità del file
+        self._appended: "OrderedDict[Tuple[str, str], Tuple[Any, np.ndarray]]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> Optional["FundamentalsStore"]:
+        """
+        Crea l'archivio leggendo FUNDAMENTALS_STORE_PATH
+
+        Returns:
+            FundamentalsStore o None se disabilitato con FUNDAMENTALS_STORE_ENABLED=false
+        """
+        enabled = os.getenv("FUNDAMENTALS_STORE_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+        if not enabled:
+            return None
+        try:
+            return cls(os.getenv("FUNDAMENTALS_STORE_PATH", DEFAULT_PATH))
+        except OSError as e:
+            print(f"Archivio dei fondamentali non disponibile: {e}")
+            return None
+
+    def _directory(self, period: str) -> str:
+        if period not in PERIODS:
+            raise ValueError(f"Periodo non supportato: {period} (validi: {', '.join(PERIODS)})")
+        return os.path.join(self.path, period)
+
+    def _file(self, ticker: str, period: str) -> str:
+        name = re.sub(r"[^A-Z0-9.\-^]", "_", ticker.upper())
+        return os.path.join(self._directory(period), f"{name}.npy")
+
+    @staticmethod
+    def _read(path: str, mmap_mode: Optional[str] = None) -> Optional[np.ndarray]:
+        """Matrice salvata o None se assente o con un formato diverso"""
+        try:
+            data = np.load(path, mmap_mode=mmap_mode, allow_pickle=False)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Storico non leggibile, verrà ricostruito: {path} ({e})")
+            return None
+        if data.ndim != 2 or data.shape[0] != _ROWS or data.dtype != np.float64:
+            return None
+        return data
+
+    def append(self, ticker: str, period: str, statements: Dict[str, Optional[List[Dict]]]) -> int:
+        """
+        Aggiunge all'archivio i periodi contenuti negli statement FMP
+
+        Args:
+            ticker: Simbolo ticker
+            period: "annual" o "quarter"
+            statements: Risorsa -> lista di record FMP (tutti i periodi) o None
+
+        Returns:
+            Numero di periodi nuovi (0 se l'archivio era già aggiornato)
+        """
+        path = self._file(ticker, period)
+        block = build_block(statements)
+        if block.shape[1] == 0:
+            return 0
+        key = (ticker.upper(), period)
+        with self._mutex:
+            last = self._appended.get(key)
+        if last is not None and last[0] == file_id(path) and np.array_equal(last[1], block, equal_nan=True):
+            return 0
+        with self._lock:
+            existing = self._read(path)
+            if existing is None:
+                merged, added = block, block.shape[1]
+            else:
+                merged = merge_blocks(existing, block)
+                added = merged.shape[1] - existing.shape[1]
+            if existing is None or added or not np.array_equal(merged, existing, equal_nan=True):
+                buffer = io.BytesIO()
+                np.save(buffer, merged, allow_pickle=False)
+                atomic_write(path, buffer.getvalue())
+            identity = file_id(path)
+        with self._mutex:
+            self._appended[key] = (identity, block)
+            self._appended.move_to_end(key)
+            if len(self._appended) > APPENDED_CACHE_SIZE:
+                self._appended.popitem(last=False)
+        return added
+
+    def append_plan(self, plan: FetchPlan) -> int:
+        """Aggiunge all'archivio gli statement già scaricati da un piano di fetch"""
+        return self.append(plan.ticker, plan.period,
+                           {resource: plan.records(resource) for resource in STATEMENTS})
+
+    def series(self, ticker: str, period: str = "annual") -> Optional[FundamentalsSeries]:
+        """
+        Storico di un ticker, mappato in memoria
+
+        Il file viene riaperto solo se è stato sostituito (anche da un altro
+        worker) dall'ultima lettura. Oltre SERIES_CACHE_SIZE storici viene
+        scartato il meno recente: il suo file resta aperto solo finché
+        qualcuno ne usa ancora la serie.
+
+        Returns:
+            FundamentalsSeries o None se il ticker non ha storico per il periodo
+        """
+        ticker = ticker.upper()
+        path = self._file(ticker, period)
+        identity = file_id(path)
+        if identity is None:
+            return None
+        key = (ticker, period)
+        with self._mutex:
+            cached = self._series.get(key)
+            if cached is not None and cached[0] == identity:
+                self._series.move_to_end(key)
+                return cached[1]
+            data = self._read(path, mmap_mode="r")
+            if data is None:
+                return None
+            series = FundamentalsSeries(ticker, period, data)
+            self._series[key] = (identity, series)
+            self._series.move_to_end(key)
+            if len(self._series) > SERIES_CACHE_SIZE:
+                self._series.popitem(last=False)
+            return series
+
+    def tickers(self, period: str = "annual") -> List[str]:
+        """Ticker con storico salvato per il periodo"""
+        return sorted(name[:-4] for name in os.listdir(self._directory(period)) if name.endswith(".npy"))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Ticker salvati per periodo e dimensione dell'archivio"""
+        stats: Dict[str, Any] = {"path": self.path}
+        total = 0
+        for period in PERIODS:
+            files = [entry for entry in os.scandir(self._directory(period)) if entry.name.endswith(".npy")]
+            stats[period] = len(files)
+            total += sum(entry.stat().st_size for entry in files)
+        stats["bytes"] = total
+        return stats
@@ -5,19 +5,24 @@ Scopo: Effettuare chiamate API a Financial Modeling Prep per trovare il ticker
 di un'azienda basandosi sul nome dell'azienda.
 """
 
-import requests
+import asyncio
 import json
 import os
-from typing import Optional, Dict, List
+import sys
+from typing import Optional, Dict, List, Tuple, Union
 from dataclasses import dataclass
+
+import httpx
 from dotenv import load_dotenv
 from .fortune500_cache import Fortune500Cache, CachedCompany, initialize_fortune500_cache
+from .company_index import similarity
+from .http_client import FMPTransport, get_transport
 
 # Carica le variabili d'ambiente dal file .env
 load_dotenv()
 
 
-@dataclass
+@dataclass(slots=True)
 class CompanyInfo:
     """Classe per rappresentare le informazioni di un'azienda"""
     symbol: str
@@ -26,12 +31,20 @@ class CompanyInfo:
     market_cap: Optional[float] = None
     sector: Optional[str] = None
     industry: Optional[str] = None
+    
+    def __post_init__(self):
+        # Exchange, settori e industry si ripetono tra i risultati: una copia per valore
+        for field in ("exchange", "sector", "industry"):
+            value = getattr(self, field)
+            if type(value) is str:
+                setattr(self, field, sys.intern(value))
 
 
 class FinancialModelingPrepClient:
     """Client per interagire con l'API di Financial Modeling Prep"""
     
-    def __init__(self, api_key: Optional[str] = None, use_cache: bool = True):
+    def __init__(self, api_key: Optional[str] = None, use_cache: bool = True,
+                 transport: Optional[FMPTransport] = None):
         """
         Inizializza il client con la chiave API
         
@@ -39,6 +52,7 @@ class FinancialModelingPrepClient:
             api_key: Chiave API di Financial Modeling Prep. Se non fornita,
                      cerca di recuperarla dalla variabile d'ambiente FMP_API_KEY
             use_cache: Se True, utilizza la cache Fortune 500 per evitare chiamate API
+            transport: Trasporto HTTP condiviso (default: get_transport())
         """
         self.api_key = api_key or os.getenv('FMP_API_KEY')
         if not self.api_key:
@@ -48,14 +62,13 @@ class FinancialModelingPrepClient:
             )
         
         self.base_url = "https://financialmodelingprep.com/api/v3"
-        self.session = requests.Session()
-        self.session.params = {'apikey': self.api_key}
+        self.transport = transport or get_transport()
         
         # Inizializza la cache Fortune 500
         self.use_cache = use_cache
         self.cache = initialize_fortune500_cache() if use_cache else None
     
-    def test_api_key(self) -> bool:
+    async def test_api_key_async(self) -> bool:
         """
         Testa se l'API key è valida facendo una chiamata semplice
         
@@ -69,7 +82,7 @@ class FinancialModelingPrepClient:
                 'query': 'AAPL',
                 'apikey': self.api_key
             }
-            response = self.session.get(endpoint, params=params)
+            response = await self.transport.request(endpoint, params)
             
             if response.status_code == 200:
                 print("✓ API key valida")
@@ -85,7 +98,11 @@ class FinancialModelingPrepClient:
             print(f"✗ Errore nel test API key: {e}")
             return False
     
-    def search_company(self, company_name: str, limit: int = 10, exchange_filter: str = None) -> List[CompanyInfo]:
+    def test_api_key(self) -> bool:
+        """Versione sincrona di test_api_key_async"""
+        return self.transport.run(self.test_api_key_async())
+    
+    async def search_company_async(self, company_name: str, limit: int = 10, exchange_filter: str = None) -> List[CompanyInfo]:
         """
         Cerca un'azienda per nome e restituisce una lista di possibili match
         
@@ -97,8 +114,7 @@ class FinancialModelingPrepClient:
         Returns:
             Lista di oggetti CompanyInfo con i risultati della ricerca
             
-        Raises:
-            requests.RequestException: In caso di errore nella chiamata API
+        In caso di errore nella chiamata API restituisce una lista vuota
         """
         # Usa l'endpoint /stable/search-name che funziona con la tua API key
         endpoint = f"https://financialmodelingprep.com/stable/search-name"
@@ -108,7 +124,7 @@ class FinancialModelingPrepClient:
         }
         
         try:
-            response = self.session.get(endpoint, params=params)
+            response = await self.transport.request(endpoint, params)
             
             if response.status_code == 403:
                 print("Errore 403: Accesso negato. Possibili cause:")
@@ -118,9 +134,12 @@ class FinancialModelingPrepClient:
                 print(f"URL tentato: {response.url}")
                 return []
             
-            response.raise_for_status()
+            if response.status_code != 200 or not isinstance(response.data, list):
+                print(f"Errore nella chiamata API: HTTP {response.status_code}")
+                print(f"Response: {response.text}")
+                return []
             
-            data = response.json()
+            data = response.data
             
             companies = []
             for item in data:
@@ -144,14 +163,15 @@ class FinancialModelingPrepClient:
             
             return companies
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Errore nella chiamata API: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Status Code: {e.response.status_code}")
-                print(f"Response: {e.response.text}")
             return []
     
-    def get_company_profile(self, symbol: str) -> Optional[Dict]:
+    def search_company(self, company_name: str, limit: int = 10, exchange_filter: str = None) -> List[CompanyInfo]:
+        """Versione sincrona di search_company_async"""
+        return self.transport.run(self.search_company_async(company_name, limit, exchange_filter))
+    
+    async def get_company_profile_async(self, symbol: str) -> Optional[Dict]:
         """
         Ottiene il profilo completo di un'azienda tramite il suo ticker
         
@@ -166,7 +186,7 @@ class FinancialModelingPrepClient:
         params = {'apikey': self.api_key}
         
         try:
-            response = self.session.get(endpoint, params=params)
+            response = await self.transport.request(endpoint, params)
             
             if response.status_code == 403:
                 print(f"Errore 403 per {symbol}: API key non valida per questo endpoint")
@@ -174,16 +194,21 @@ class FinancialModelingPrepClient:
             elif response.status_code == 404:
                 print(f"Profilo non trovato per {symbol}")
                 return None
+            elif response.status_code != 200:
+                print(f"Errore nel recupero del profilo per {symbol}: HTTP {response.status_code}")
+                return None
             
-            response.raise_for_status()
-            
-            data = response.json()
+            data = response.data
             return data[0] if data else None
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Errore nel recupero del profilo per {symbol}: {e}")
             return None
     
+    def get_company_profile(self, symbol: str) -> Optional[Dict]:
+        """Versione sincrona di get_company_profile_async"""
+        return self.transport.run(self.get_company_profile_async(symbol))
+    
     def search_nasdaq_company(self, company_name: str, limit: int = 10) -> List[CompanyInfo]:
         """
         Cerca un'azienda per nome limitando i risultati solo a NASDAQ
@@ -197,34 +222,37 @@ class FinancialModelingPrepClient:
         """
         return self.search_company(company_name, limit, exchange_filter='NASDAQ')
     
-    def find_ticker_by_name(self, company_name: str, nasdaq_only: bool = False) -> Optional[str]:
+    async def resolve_company_async(self, company_name: str, nasdaq_only: bool = False
+                                    ) -> Tuple[Optional[Union[CachedCompany, CompanyInfo]], Optional[str], float]:
         """
-        Trova il ticker di un'azienda basandosi sul nome.
-        Prima cerca nella cache Fortune 500, poi nell'API se necessario.
+        Trova un'azienda basandosi sul nome (anche con errori di battitura).
+        Prima cerca nella cache Fortune 500 con ricerca fuzzy; l'API viene
+        chiamata solo se il miglior punteggio è sotto FUZZY_MATCH_THRESHOLD.
         
         Args:
             company_name: Nome dell'azienda da cercare
             nasdaq_only: Se True, cerca solo aziende quotate su NASDAQ
             
         Returns:
-            Ticker symbol dell'azienda o None se non trovato
+            Tupla (azienda, fonte, punteggio) con fonte "cache" o "api";
+            (None, None, 0.0) se non trovata
         """
-        # Prima cerca nella cache Fortune 500
+        # Prima cerca nella cache Fortune 500 (fuori dall'event loop: la ricerca
+        # può attendere il lock tra processi durante una compattazione)
         if self.use_cache and self.cache:
-            cached_company = self.cache.search_company(company_name)
-            if cached_company:
-                print(f"✓ Trovata nella cache Fortune 500: {cached_company.name} -> {cached_company.symbol}")
-                return cached_company.symbol
+            match = await asyncio.to_thread(self.cache.match_company, company_name)
+            if match:
+                cached_company, score = match
+                print(f"✓ Trovata nella cache Fortune 500: {cached_company.name} -> {cached_company.symbol} (score {score})")
+                return cached_company, "cache", score
         
         # Se non trovata nella cache, cerca tramite API
         print(f"Ricerca tramite API per: {company_name}")
-        if nasdaq_only:
-            companies = self.search_nasdaq_company(company_name, limit=5)
-        else:
-            companies = self.search_company(company_name, limit=5)
+        exchange_filter = 'NASDAQ' if nasdaq_only else None
+        companies = await self.search_company_async(company_name, limit=5, exchange_filter=exchange_filter)
         
         if not companies:
-            return None
+            return None, None, 0.0
         
         # Restituisce il primo risultato (più probabile match)
         best_match = companies[0]
@@ -240,20 +268,43 @@ class FinancialModelingPrepClient:
                 industry=best_match.industry
             )
             self.cache.add_company(cached_company)
-            self.cache.save_cache()
+            # La scrittura del journal attende il lock tra processi: fuori dall'event loop
+            await asyncio.to_thread(self.cache.save_cache)
             print(f"✓ Aggiunta alla cache: {best_match.name} -> {best_match.symbol}")
         
-        return best_match.symbol
+        return best_match, "api", similarity(company_name, best_match.name)
+    
+    async def find_ticker_by_name_async(self, company_name: str, nasdaq_only: bool = False) -> Optional[str]:
+        """
+        Trova il ticker di un'azienda basandosi sul nome.
+        Prima cerca nella cache Fortune 500, poi nell'API se necessario.
+        
+        Args:
+            company_name: Nome dell'azienda da cercare
+            nasdaq_only: Se True, cerca solo aziende quotate su NASDAQ
+            
+        Returns:
+            Ticker symbol dell'azienda o None se non trovato
+        """
+        company, _, _ = await self.resolve_company_async(company_name, nasdaq_only)
+        return company.symbol if company else None
     
-    def get_cache_stats(self) -> Optional[Dict]:
+    def find_ticker_by_name(self, company_name: str, nasdaq_only: bool = False) -> Optional[str]:
+        """Versione sincrona di find_ticker_by_name_async"""
+        return self.transport.run(self.find_ticker_by_name_async(company_name, nasdaq_only))
+    
+    def get_cache_stats(self, wait: bool = True) -> Optional[Dict]:
         """
         Ottiene statistiche sulla cache Fortune 500
         
+        Args:
+            wait: Se False non attende il lock tra processi (vedi Fortune500Cache.get_cache_stats)
+        
         Returns:
             Dizionario con statistiche della cache o None se la cache non è abilitata
         """
         if self.use_cache and self.cache:
-            return self.cache.get_cache_stats()
+            return self.cache.get_cache_stats(wait)
         return None
     
     def clear_cache(self) -> None:
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+HTTP Transport Module
+Trasporto HTTP asincrono condiviso da tutti i client Financial Modeling Prep.
+
+Tutte le chiamate girano su un unico event loop dedicato (thread in background)
+con un pool di connessioni keep-alive, limiti di connessioni per host e timeout
+configurabili. Le coroutine possono essere attese da qualsiasi event loop (es.
+quello di FastAPI) senza bloccarlo; gli script sincroni usano `run()` come
+semplice wrapper bloccante.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Dict, Optional, Tuple, TypeVar
+
+import httpx
+
+from .concurrency import TokenBucket
+from .disk_cache import DiskCache, DiskEntry
+from .response_cache import DEFAULT_ENDPOINT_TTLS, DEFAULT_TTL, FRESH, ResponseCache, endpoint_name
+from .singleflight import SingleFlight
+
+FMP_BASE_URL = "https://financialmodelingprep.com/stable/"
+
+# Namespace delle risposte FMP nella cache su disco
+DISK_NAMESPACE = "fmp"
+
+# Parametri che non identificano la risorsa richiesta
+_KEY_EXCLUDED_PARAMS = {"apikey"}
+
+T = TypeVar("T")
+
+
+def _get_float_env(var_name: str, default: float) -> float:
+    value = os.getenv(var_name)
+    if value is None or value.strip() == "":
+        return default
+    return float(value)
+
+
+def _get_int_env(var_name: str, default: int) -> int:
+    value = os.getenv(var_name)
+    if value is None or value.strip() == "":
+        return default
+    return int(value)
+
+
+@dataclass
+class TransportSettings:
+    """Configurazione del pool di connessioni"""
+    timeout: float = 10.0
+    connect_timeout: float = 5.0
+    max_connections: int = 50
+    max_keepalive_connections: int = 20
+    max_connections_per_host: int = 10
+    keepalive_expiry: float = 30.0
+    # Quota del piano FMP per processo (0 = nessun limite) e raffica consentita
+    rate_limit_per_minute: int = 300
+    rate_limit_burst: int = 50
+
+    @classmethod
+    def from_env(cls) -> "TransportSettings":
+        """Legge la configurazione dalle variabili d'ambiente FMP_HTTP_*"""
+        return cls(
+            timeout=_get_float_env("FMP_HTTP_TIMEOUT", cls.timeout),
+            connect_timeout=_get_float_env("FMP_HTTP_CONNECT_TIMEOUT", cls.connect_timeout),
+            max_connections=_get_int_env("FMP_HTTP_MAX_CONNECTIONS", cls.max_connections),
+            max_keepalive_connections=_get_int_env("FMP_HTTP_MAX_KEEPALIVE", cls.max_keepalive_connections),
+            max_connections_per_host=_get_int_env("FMP_HTTP_MAX_PER_HOST", cls.max_connections_per_host),
+            keepalive_expiry=_get_float_env("FMP_HTTP_KEEPALIVE_EXPIRY", cls.keepalive_expiry),
+            rate_limit_per_minute=_get_int_env("FMP_RATE_LIMIT_PER_MINUTE", cls.rate_limit_per_minute),
+            rate_limit_burst=_get_int_env("FMP_RATE_LIMIT_BURST", cls.rate_limit_burst),
+        )
+
+
+def request_key(url: httpx.URL, params: Optional[Dict[str, Any]]) -> Tuple:
+    """
+    Chiave normalizzata di una richiesta: host, percorso e parametri ordinati
+
+    La API key è esclusa e il simbolo è reso maiuscolo, così le stesse
+    risorse richieste da client diversi producono la stessa chiave.
+    """
+    normalized = []
+    for name, value in (params or {}).items():
+        name = name.lower()
+        if name in _KEY_EXCLUDED_PARAMS or value is None:
+            continue
+        value = str(value).strip()
+        if name == "symbol":
+            value = value.upper()
+        normalized.append((name, value))
+    return (url.host, url.path.rstrip("/").lower(), tuple(sorted(normalized)))
+
+
+def _retry_after(response: httpx.Response, default: float = 1.0) -> float:
+    """Secondi indicati dall'header Retry-After (solo formato numerico)"""
+    try:
+        return max(0.0, float(response.headers.get("retry-after", default)))
+    except ValueError:
+        return default
+
+
+@dataclass
+class FMPResponse:
+    """
+    Risposta HTTP già decodificata
+
+    La stessa istanza può essere condivisa da più chiamanti: va trattata
+    come di sola lettura.
+    """
+    status_code: int
+    data: Any = None
+    url: str = ""
+    text: str = ""
+    size: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code == 200
+
+
+class FMPTransport:
+    """Trasporto HTTP asincrono con pool keep-alive condiviso"""
+
+    def __init__(self, settings: Optional[TransportSettings] = None,
+                 base_url: str = FMP_BASE_URL,
+                 http_transport: Optional[httpx.AsyncBaseTransport] = None,
+                 cache: Optional[ResponseCache] = None,
+                 use_cache: bool = True,
+                 disk_cache: Optional[DiskCache] = None):
+        """
+        Inizializza il trasporto
+
+        Args:
+            settings: Configurazione del pool (default: da variabili d'ambiente)
+            base_url: URL base per i percorsi relativi
+            http_transport: Trasporto httpx alternativo (es. httpx.MockTransport nei test)
+            cache: Cache delle risposte (default: ResponseCache.from_env())
+            use_cache: Se False, ogni richiesta raggiunge la rete
+            disk_cache: Cache persistente di secondo livello (opzionale)
+        """
+        self.settings = settings or TransportSettings.from_env()
+        self.base_url = base_url
+        self._http_transport = http_transport
+
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        # Token bucket sulle sole chiamate upstream (le risposte in cache non consumano quota)
+        self.rate_limiter = (
+            TokenBucket.per_minute(self.settings.rate_limit_per_minute, self.settings.rate_limit_burst)
+            if self.settings.rate_limit_per_minute > 0 else None
+        )
+        self._singleflight = SingleFlight()
+        self._base = httpx.URL(base_url)
+        self.cache = (cache if cache is not None else ResponseCache.from_env()) if use_cache else None
+        self.disk_cache = disk_cache if use_cache else None
+        self._revalidations: set = set()
+
+    # ------------------------------------------------------------------
+    # Event loop dedicato
+    # ------------------------------------------------------------------
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Avvia (una sola volta) il thread con l'event loop del trasporto"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                thread = threading.Thread(
+                    target=self._run_loop, args=(loop, ready),
+                    name="fmp-transport", daemon=True
+                )
+                thread.start()
+                ready.wait()
+                self._loop = loop
+                self._thread = thread
+            return self._loop
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop, ready: threading.Event) -> None:
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+        loop.close()
+
+    async def submit(self, coro: Awaitable[T]) -> T:
+        """
+        Esegue una coroutine sul loop del trasporto e ne attende il risultato
+        dal loop chiamante, senza bloccarlo
+        """
+        loop = self._ensure_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    def run(self, coro: Awaitable[T]) -> T:
+        """
+        Wrapper sincrono: esegue la coroutine sul loop del trasporto e blocca
+        il thread chiamante fino al risultato
+        """
+        loop = self._ensure_loop()
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("run() non può essere chiamato dal loop del trasporto")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Crea il client httpx sul loop del trasporto (lazy)"""
+        if self._client is None:
+            settings = self.settings
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(settings.timeout, connect=settings.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=settings.max_connections,
+                    max_keepalive_connections=settings.max_keepalive_connections,
+                    keepalive_expiry=settings.keepalive_expiry,
+                ),
+                transport=self._http_transport,
+            )
+        return self._client
+
+    def _host_semaphore(self, host: str) -> asyncio.Semaphore:
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.settings.max_connections_per_host)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def _fetch(self, path: str, params: Optional[Dict[str, Any]]) -> FMPResponse:
+        client = self._get_client()
+        url = client.base_url.join(path)
+        for attempt in range(2):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            async with self._host_semaphore(url.host):
+                response = await client.get(url, params=params)
+            if response.status_code != 429 or self.rate_limiter is None or attempt:
+                break
+            # Quota superata (es. condivisa con altri worker): pausa per tutti, poi un nuovo tentativo
+            self.rate_limiter.pause(_retry_after(response))
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+
+        return FMPResponse(
+            status_code=response.status_code,
+            data=data,
+            url=str(response.url),
+            text=response.text,
+            size=len(response.content),
+        )
+
+    def _ttls(self, endpoint: str) -> Tuple[float, float]:
+        """TTL e finestra stale per un endpoint"""
+        if self.cache is not None:
+            ttl = self.cache.ttl_for(endpoint)
+            return ttl, ttl * self.cache.stale_factor
+        ttl = DEFAULT_ENDPOINT_TTLS.get(endpoint, DEFAULT_TTL)
+        return ttl, ttl
+
+    async def _disk_load(self, key: Tuple) -> Optional[DiskEntry]:
+        try:
+            return await asyncio.to_thread(self.disk_cache.get, DISK_NAMESPACE, json.dumps(key))
+        except Exception as e:
+            print(f"Errore nella lettura della cache su disco: {e}")
+            return None
+
+    async def _disk_store(self, key: Tuple, response: FMPResponse, endpoint: str) -> None:
+        ttl, stale_ttl = self._ttls(endpoint)
+        value = {"status_code": response.status_code, "data": response.data}
+        try:
+            await asyncio.to_thread(
+                self.disk_cache.set, DISK_NAMESPACE, json.dumps(key), value,
+                ttl, stale_ttl, response.size
+            )
+        except Exception as e:
+            print(f"Errore nella scrittura della cache su disco: {e}")
+
+    async def _fetch_and_store(self, key: Tuple, path: str,
+                               params: Optional[Dict[str, Any]]) -> FMPResponse:
+        response = await self._fetch(path, params)
+        if response.ok and response.data is not None:
+            endpoint = endpoint_name(key[1])
+            if self.cache is not None:
+                self.cache.set(key, response, response.size, endpoint)
+            if self.disk_cache is not None:
+                await self._disk_store(key, response, endpoint)
+        return response
+
+    async def _load_or_fetch(self, key: Tuple, path: str,
+                             params: Optional[Dict[str, Any]]) -> FMPResponse:
+        """Cache su disco (condivisa tra worker e riavvii) -> rete"""
+        if self.disk_cache is not None:
+            entry = await self._disk_load(key)
+            if entry is not None:
+                response = FMPResponse(
+                    status_code=entry.value["status_code"],
+                    data=entry.value["data"],
+                    size=entry.size,
+                )
+                now = time.time()
+                if self.cache is not None:
+                    self.cache.set(
+                        key, response, entry.size, endpoint_name(key[1]),
+                        ttl=max(0.0, entry.expires_at - now),
+                        stale_ttl=max(0.0, entry.stale_until - max(entry.expires_at, now))
+                    )
+                if not entry.is_fresh(now):
+                    self._revalidate(key, path, params)
+                return response
+
+        return await self._fetch_and_store(key, path, params)
+
+    def _revalidate(self, key: Tuple, path: str, params: Optional[Dict[str, Any]]) -> None:
+        """Aggiorna in background una voce stale (una sola volta per chiave)"""
+        task = asyncio.ensure_future(
+            self._singleflight.do(("refresh", key), lambda: self._fetch_and_store(key, path, params))
+        )
+        self._revalidations.add(task)
+        task.add_done_callback(self._revalidation_done)
+
+    def _revalidation_done(self, task: asyncio.Future) -> None:
+        self._revalidations.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Errore nella rivalidazione in background: {task.exception()}")
+
+    async def _cached_fetch(self, path: str, params: Optional[Dict[str, Any]]) -> FMPResponse:
+        """
+        Cache in memoria -> single-flight -> cache su disco -> rete
+
+        Le voci fresche sono servite dalla cache; quelle stale sono servite
+        subito e aggiornate in background; le richieste identiche in volo
+        condividono un'unica lettura da disco o chiamata upstream.
+        """
+        key = request_key(self._base.join(path), params)
+
+        if self.cache is not None:
+            entry, state = self.cache.get(key)
+            if entry is not None:
+                if state != FRESH:
+                    self._revalidate(key, path, params)
+                return entry.value
+
+        return await self._singleflight.do(key, lambda: self._load_or_fetch(key, path, params))
+
+    async def request(self, path: str, params: Optional[Dict[str, Any]] = None) -> FMPResponse:
+        """
+        Esegue una GET passando per cache e single-flight
+
+        Args:
+            path: Percorso relativo a base_url (es. "ratios") o URL assoluto
+            params: Parametri della query string (inclusa apikey)
+
+        Returns:
+            FMPResponse con status code e JSON decodificato
+
+        Raises:
+            httpx.HTTPError: In caso di errore di rete o timeout
+        """
+        return await self.submit(self._cached_fetch(path, params))
+
+    def request_sync(self, path: str, params: Optional[Dict[str, Any]] = None) -> FMPResponse:
+        """Versione bloccante di request()"""
+        return self.run(self._cached_fetch(path, params))
+
+    def _memory_stats(self) -> Dict[str, Any]:
+        """Contatori dello stato posseduto dal loop del trasporto (da leggere su quel loop)"""
+        return {
+            "singleflight": self._singleflight.get_stats(),
+            "rate_limiter": self.rate_limiter.get_stats() if self.rate_limiter is not None else None,
+            "cache": self.cache.get_stats() if self.cache is not None else None
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Contatori del trasporto (richieste coalescenti, cache in memoria e su disco)
+
+        Bloccante: lo stato in memoria è letto sul loop del trasporto e la
+        cache su disco con una query SQLite. Da un event loop usare
+        get_stats_async().
+        """
+        with self._lock:
+            loop, thread = self._loop, self._thread
+        if (loop is not None and loop.is_running()
+                and threading.current_thread() is not thread):
+            async def snapshot() -> Dict[str, Any]:
+                return self._memory_stats()
+            stats = asyncio.run_coroutine_threadsafe(snapshot(), loop).result()
+        else:
+            stats = self._memory_stats()
+        stats["disk_cache"] = self.disk_cache.get_stats() if self.disk_cache is not None else None
+        return stats
+
+    async def get_stats_async(self) -> Dict[str, Any]:
+        """get_stats() eseguito in un thread, senza bloccare il loop chiamante"""
+        return await asyncio.to_thread(self.get_stats)
+
+    async def aclose(self) -> None:
+        """Chiude il pool di connessioni e ferma il loop del trasporto"""
+        with self._lock:
+            loop = self._loop
+            thread = self._thread
+            self._loop = None
+            self._thread = None
+        if loop is None or loop.is_closed():
+            return
+
+        async def _close_client():
+            for task in list(self._revalidations):
+                task.cancel()
+            if self._client is not None:
+                await self._client.aclose()
+                self._client = None
+            self._host_semaphores.clear()
+
+        await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_close_client(), loop))
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            await asyncio.to_thread(thread.join)
+
+
+_shared_transport: Optional[FMPTransport] = None
+_shared_lock = threading.Lock()
+
+
+def get_transport() -> FMPTransport:
+    """Restituisce il trasporto condiviso dal processo (creato al primo uso)"""
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None:
+            _shared_transport = FMPTransport(disk_cache=DiskCache.from_env())
+        return _shared_transport
+
+
+def set_transport(transport: Optional[FMPTransport]) -> None:
+    """Sostituisce il trasporto condiviso (utile nei test)"""
+    global _shared_transport
+    with _shared_lock:
+        _shared_transport = transport
+
+
+async def close_transport() -> None:
+    """Chiude il trasporto condiviso, se creato"""
+    global _shared_transport
+    with _shared_lock:
+        transport = _shared_transport
+        _shared_transport = None
+    if transport is not None:
+        await transport.aclose()
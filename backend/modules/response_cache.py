@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Response Cache Module
+Cache in-memory delle risposte FMP con TTL per endpoint, eviction LRU
+(per numero di voci e per dimensione in byte) e stale-while-revalidate.
+
+I bilanci annuali cambiano poche volte l'anno, i ratios qualche volta al
+giorno: ogni endpoint ha quindi il proprio TTL. Scaduto il TTL la voce resta
+servibile come "stale" per un'ulteriore finestra, durante la quale il
+chiamante la riceve subito mentre il trasporto la aggiorna in background.
+
+Non è thread-safe: va usata dal solo event loop del trasporto HTTP.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# TTL (secondi) per endpoint FMP
+DEFAULT_ENDPOINT_TTLS: Dict[str, float] = {
+    "ratios": 6 * HOUR,
+    "income-statement": 3 * DAY,
+    "balance-sheet-statement": 3 * DAY,
+    "cash-flow-statement": 3 * DAY,
+    "profile": DAY,
+    "company-profile": DAY,
+    "grades-consensus": 6 * HOUR,
+    "search-name": 7 * DAY,
+    "stock-screener": DAY,
+}
+DEFAULT_TTL = 15 * 60
+
+FRESH = "fresh"
+STALE = "stale"
+
+
+def endpoint_name(path: str) -> str:
+    """
+    Estrae il nome dell'endpoint FMP da un percorso URL
+
+    Es. "/stable/ratios" -> "ratios", "/stable/company-profile/AAPL" -> "company-profile"
+    """
+    segments = [segment for segment in path.lower().split("/") if segment]
+    for segment in segments:
+        if segment in DEFAULT_ENDPOINT_TTLS:
+            return segment
+    return segments[-1] if segments else ""
+
+
+@dataclass
+class CacheEntry:
+    """Voce della cache con metadati di scadenza"""
+    value: Any
+    size: int
+    endpoint: str
+    stored_at: float
+    expires_at: float
+    stale_until: float
+
+
+class ResponseCache:
+    """Cache LRU con TTL per endpoint e stale-while-revalidate"""
+
+    def __init__(self, max_entries: int = 2048, max_bytes: int = 64 * 1024 * 1024,
+                 ttls: Optional[Dict[str, float]] = None, default_ttl: float = DEFAULT_TTL,
+                 stale_factor: float = 1.0, clock: Callable[[], float] = time.time):
+        """
+        Inizializza la cache
+
+        Args:
+            max_entries: Numero massimo di voci
+            max_bytes: Dimensione massima complessiva (byte del payload)
+            ttls: TTL per endpoint (default: DEFAULT_ENDPOINT_TTLS)
+            default_ttl: TTL per gli endpoint non configurati
+            stale_factor: Finestra stale-while-revalidate come multiplo del TTL (0 = disattiva)
+            clock: Sorgente del tempo (iniettabile nei test)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_ENDPOINT_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.stale_factor = stale_factor
+        self._clock = clock
+
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        """Crea la cache leggendo i limiti da FMP_CACHE_MAX_ENTRIES e FMP_CACHE_MAX_BYTES"""
+        return cls(
+            max_entries=int(os.getenv("FMP_CACHE_MAX_ENTRIES", 2048)),
+            max_bytes=int(os.getenv("FMP_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+        )
+
+    def ttl_for(self, endpoint: str) -> float:
+        """TTL configurato per un endpoint"""
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def get(self, key: Hashable) -> Tuple[Optional[CacheEntry], Optional[str]]:
+        """
+        Cerca una voce
+
+        Returns:
+            Tupla (voce, stato) con stato FRESH o STALE, oppure (None, None)
+            se assente o oltre la finestra stale
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, None
+
+        now = self._clock()
+        if now >= entry.stale_until:
+            self._remove(key)
+            self.misses += 1
+            return None, None
+
+        self._entries.move_to_end(key)
+        if now < entry.expires_at:
+            self.hits += 1
+            return entry, FRESH
+
+        self.stale_hits += 1
+        return entry, STALE
+
+    def set(self, key: Hashable, value: Any, size: int, endpoint: str,
+            ttl: Optional[float] = None, stale_ttl: Optional[float] = None) -> None:
+        """
+        Inserisce o sostituisce una voce ed applica l'eviction LRU
+
+        Args:
+            key: Chiave normalizzata della richiesta
+            value: Valore da memorizzare
+            size: Dimensione stimata in byte
+            endpoint: Nome dell'endpoint (per il TTL)
+            ttl: TTL esplicito (default: quello dell'endpoint)
+            stale_ttl: Finestra stale esplicita (default: ttl * stale_factor)
+        """
+        if size > self.max_bytes:
+            return
+
+        ttl = self.ttl_for(endpoint) if ttl is None else ttl
+        stale_ttl = ttl * self.stale_factor if stale_ttl is None else stale_ttl
+        now = self._clock()
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = CacheEntry(
+            value=value,
+            size=size,
+            endpoint=endpoint,
+            stored_at=now,
+            expires_at=now + ttl,
+            stale_until=now + ttl + stale_ttl,
+        )
+        self.total_bytes += size
+        self._evict()
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or
+                                 self.total_bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry.size
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Rimuove una voce; restituisce True se era presente"""
+        if key in self._entries:
+            self._remove(key)
+            return True
+        return False
+
+    def clear(self) -> None:
+        """Svuota la cache"""
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Restituisce le statistiche della cache"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0
+        }
@@ -2,12 +2,31 @@
 """
 Scoring System Module
 Sistema di scoring aggregato per indicatori finanziari con pesi configurabili
+
+Pesi e soglie sono raccolti in profili immutabili (ScoringProfile), passati per
+chiamata o scelti per nome (PROFILES): il sistema non ha stato condiviso da
+modificare tra una richiesta e l'altra. La valutazione scalare di ogni profilo
+è compilata una sola volta (compile_profile) e riusata.
+
+analyze_company valuta un'azienda alla volta; analyze_many applica le stesse
+regole a colonne NumPy di migliaia di aziende in un solo passaggio, con NaN
+per i valori mancanti e risultati identici al percorso scalare.
 """
 
 from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
 import math
 
+import numpy as np
+
+# Indicatori valutati, nell'ordine di accumulo del punteggio pesato
+INDICATORS = ("PE", "PB", "ROE")
+
+# Etichette per codice: classificazione = punteggio + 2 (0 = N/A)
+CLASSIFICATION_LABELS = np.array(["N/A", "Overvalued", "Fair", "Undervalued"], dtype=object)
+SIGNAL_LABELS = np.array(["Overvalued", "Fairly valued", "Undervalued"], dtype=object)
+
 
 @dataclass
 class IndicatorWeight:
@@ -17,36 +36,286 @@ class IndicatorWeight:
     description: str
 
 
+@dataclass(frozen=True)
+class ScoringProfile:
+    """
+    Configurazione immutabile dello scoring (pesi e soglie)
+
+    I valori sono tuple di coppie (chiave, valore), quindi il profilo è
+    hashable: profili con la stessa configurazione sono uguali (il nome non
+    conta) e condividono la funzione compilata da compile_profile.
+    """
+    weights: Tuple[Tuple[str, float], ...] = (
+        ("PE", 0.5),    # Price-to-Earnings: 50% del peso
+        ("PB", 0.3),    # Price-to-Book: 30% del peso
+        ("ROE", 0.2)    # Return on Equity: 20% del peso
+    )
+    # Soglie per la classificazione (percentuali)
+    thresholds: Tuple[Tuple[str, float], ...] = (
+        ("overvalued_threshold", 20.0),    # >20% sopra media = overvalued
+        ("fair_range", 20.0),              # ±20% dalla media = fair
+        ("undervalued_threshold", 20.0)    # >20% sotto media = undervalued
+    )
+    # Soglie per il punteggio finale
+    score_thresholds: Tuple[Tuple[str, float], ...] = (
+        ("overvalued", -0.2),
+        ("fairly_valued_low", -0.2),
+        ("fairly_valued_high", 0.2),
+        ("undervalued", 0.2)
+    )
+    name: str = field(default="default", compare=False)
+
+    @classmethod
+    def create(cls, weights: Optional[Dict[str, float]] = None,
+               thresholds: Optional[Dict[str, float]] = None,
+               score_thresholds: Optional[Dict[str, float]] = None,
+               name: str = "custom", base: Optional["ScoringProfile"] = None) -> "ScoringProfile":
+        """
+        Crea un profilo modificando quello di partenza
+
+        Args:
+            weights: Pesi da sostituire (indicatore -> peso)
+            thresholds: Soglie percentuali da sostituire
+            score_thresholds: Soglie del punteggio finale da sostituire
+            name: Nome del nuovo profilo
+            base: Profilo di partenza (default: DEFAULT_PROFILE)
+
+        Returns:
+            Nuovo profilo validato
+
+        Raises:
+            ValueError: Se chiavi o valori non sono validi
+        """
+        base = base or DEFAULT_PROFILE
+        merged_weights = _merge(base.weights, weights, "peso", minimum=0.0)
+        # La somma dei pesi deve essere ragionevole (tra 0.9 e 1.1)
+        total_weight = sum(merged_weights.values())
+        if total_weight < 0.9 or total_weight > 1.1:
+            raise ValueError(f"La somma dei pesi deve essere tra 0.9 e 1.1 (attuale: {round(total_weight, 4)})")
+        merged_thresholds = _merge(base.thresholds, thresholds, "soglia", minimum=0.0)
+        merged_scores = _merge(base.score_thresholds, score_thresholds, "soglia del punteggio")
+        if merged_scores["fairly_valued_low"] > merged_scores["fairly_valued_high"]:
+            raise ValueError("fairly_valued_low non può superare fairly_valued_high")
+        return cls(tuple(merged_weights.items()), tuple(merged_thresholds.items()),
+                   tuple(merged_scores.items()), name)
+
+    def weight_map(self) -> Dict[str, float]:
+        """Pesi come dizionario (copia)"""
+        return dict(self.weights)
+
+    def threshold_map(self) -> Dict[str, float]:
+        """Soglie percentuali come dizionario (copia)"""
+        return dict(self.thresholds)
+
+    def score_threshold_map(self) -> Dict[str, float]:
+        """Soglie del punteggio finale come dizionario (copia)"""
+        return dict(self.score_thresholds)
+
+    def to_dict(self) -> Dict:
+        """Profilo in formato JSON"""
+        return {
+            "name": self.name,
+            "weights": self.weight_map(),
+            "thresholds": self.threshold_map(),
+            "score_thresholds": self.score_threshold_map()
+        }
+
+
+def _missing(value: Optional[float]) -> bool:
+    """Valore assente: None o NaN (come nello scoring vettorizzato)"""
+    return value is None or value != value
+
+
+def _merge(current: Tuple[Tuple[str, float], ...], changes: Optional[Dict[str, float]],
+           kind: str, minimum: Optional[float] = None) -> Dict[str, float]:
+    """Applica le modifiche a una tabella del profilo validando chiavi e valori"""
+    merged = dict(current)
+    if changes is None:
+        return merged
+    if not isinstance(changes, dict):
+        raise ValueError(f"Valori non validi per {kind}: atteso un dizionario")
+    for key, value in changes.items():
+        if key not in merged:
+            raise ValueError(f"Chiave non supportata per {kind}: {key} (valide: {', '.join(merged)})")
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"Valore non numerico per {kind} {key}: {value}")
+        if minimum is not None and value < minimum:
+            raise ValueError(f"Valore negativo per {kind} {key}: {value}")
+        merged[key] = float(value)
+    return merged
+
+
+# Profilo predefinito e profili selezionabili per nome
+DEFAULT_PROFILE = ScoringProfile()
+
+PROFILES = {
+    "default": DEFAULT_PROFILE,
+    "value": ScoringProfile.create(weights={"PE": 0.6, "PB": 0.4, "ROE": 0.0}, name="value"),
+    "quality": ScoringProfile.create(weights={"PE": 0.3, "PB": 0.2, "ROE": 0.5}, name="quality"),
+}
+
+
+def parse_weights(text: str) -> Dict[str, float]:
+    """
+    Interpreta i pesi nel formato "PE:0.4,PB:0.3,ROE:0.3"
+
+    Raises:
+        ValueError: Se il formato non è valido
+    """
+    weights = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        indicator, separator, value = item.partition(":")
+        if not separator:
+            raise ValueError(f"Peso non valido: {item} (formato: PE:0.4,PB:0.3,ROE:0.3)")
+        try:
+            weights[indicator.strip().upper()] = float(value)
+        except ValueError:
+            raise ValueError(f"Peso non numerico per {indicator.strip()}: {value}")
+    return weights
+
+
+def resolve_profile(name: Optional[str] = None, weights: Optional[Dict[str, float]] = None,
+                    threshold: Optional[float] = None) -> ScoringProfile:
+    """
+    Profilo di una richiesta: un profilo per nome, eventualmente modificato
+
+    Args:
+        name: Nome in PROFILES (default: "default")
+        weights: Pesi da sostituire a quelli del profilo
+        threshold: Soglia percentuale di classificazione dei singoli indicatori
+
+    Returns:
+        Profilo risultante (quello registrato se non ci sono modifiche)
+
+    Raises:
+        ValueError: Se il profilo non esiste o le modifiche non sono valide
+    """
+    base = PROFILES.get(name or "default")
+    if base is None:
+        raise ValueError(f"Profilo di scoring sconosciuto: {name} (validi: {', '.join(PROFILES)})")
+    if weights is None and threshold is None:
+        return base
+    thresholds = None
+    if threshold is not None:
+        thresholds = {key: threshold for key, _ in base.thresholds}
+    return ScoringProfile.create(weights=weights, thresholds=thresholds, name=f"{base.name} (custom)", base=base)
+
+
+@lru_cache(maxsize=128)
+def compile_profile(profile: ScoringProfile):
+    """
+    Compila la valutazione scalare di un profilo (una volta per configurazione)
+
+    Pesi e soglie sono letti una sola volta: la funzione restituita applica le
+    stesse regole, nello stesso ordine di accumulo, di calculate_individual_score,
+    calculate_weighted_score e classify_final_signal.
+
+    Args:
+        profile: Profilo di scoring
+
+    Returns:
+        Funzione (company_fundamentals, sector_benchmark) -> analisi nel
+        formato di analyze_company
+    """
+    threshold = profile.threshold_map()["overvalued_threshold"]
+    weights = profile.weight_map()
+    score_thresholds = profile.score_threshold_map()
+    overvalued = score_thresholds["overvalued"]
+    fair_low = score_thresholds["fairly_valued_low"]
+    fair_high = score_thresholds["fairly_valued_high"]
+
+    # Per ROE valori più alti sono meglio, per PE e PB valori più bassi
+    steps = tuple(
+        (indicator, (1.0, -1.0) if indicator == "ROE" else (-1.0, 1.0), weights.get(indicator))
+        for indicator in INDICATORS
+    )
+    total_weight = 0.0
+    for _, _, weight in steps:
+        if weight is not None:
+            total_weight += weight
+    labels = {1.0: "Undervalued", -1.0: "Overvalued", 0.0: "Fair"}
+
+    def analyze(company_fundamentals: Dict, sector_benchmark: Dict) -> Dict:
+        individual_scores = {}
+        indicators = {}
+        weighted_sum = 0.0
+        for indicator, (above, below), weight in steps:
+            company_value = company_fundamentals.get(indicator)
+            benchmark_value = sector_benchmark.get(indicator)
+            if _missing(company_value) or _missing(benchmark_value) or benchmark_value == 0:
+                score, classification = 0.0, "N/A"
+            else:
+                deviation_percent = ((company_value - benchmark_value) / benchmark_value) * 100
+                if deviation_percent > threshold:
+                    score = above
+                elif deviation_percent < -threshold:
+                    score = below
+                else:
+                    score = 0.0
+                classification = labels[score]
+            individual_scores[indicator] = score
+            indicators[indicator] = classification
+            if weight is not None:
+                weighted_sum += score * weight
+
+        final_score = weighted_sum / total_weight if total_weight > 0 else 0.0
+        if final_score <= overvalued:
+            final_signal = "Overvalued"
+        elif fair_low < final_score < fair_high:
+            final_signal = "Fairly valued"
+        else:
+            final_signal = "Undervalued"
+
+        return {
+            "indicators": indicators,
+            "individual_scores": individual_scores,
+            "score": round(final_score, 3),
+            "final_signal": final_signal
+        }
+
+    return analyze
+
+
 class ScoringSystem:
     """Sistema di scoring aggregato per analisi finanziaria"""
     
-    def __init__(self):
-        """Inizializza il sistema di scoring con pesi predefiniti"""
-        # Pesi per gli indicatori (devono sommare a 1.0)
-        self.weights = {
-            "PE": 0.5,   # Price-to-Earnings: 50% del peso
-            "PB": 0.3,   # Price-to-Book: 30% del peso  
-            "ROE": 0.2   # Return on Equity: 20% del peso
-        }
+    def __init__(self, profile: Optional[ScoringProfile] = None):
+        """
+        Inizializza il sistema di scoring
         
-        # Soglie per la classificazione (percentuali)
-        self.thresholds = {
-            "overvalued_threshold": 20,    # >20% sopra media = overvalued
-            "fair_range": 20,              # ±20% dalla media = fair
-            "undervalued_threshold": 20    # >20% sotto media = undervalued
-        }
+        Args:
+            profile: Profilo predefinito (default: DEFAULT_PROFILE); ogni
+                metodo di analisi accetta un profilo diverso per chiamata
+        """
+        self.profile = profile or DEFAULT_PROFILE
+    
+    @property
+    def weights(self) -> Dict[str, float]:
+        """
+        Pesi per gli indicatori del profilo predefinito
         
-        # Soglie per il punteggio finale
-        self.score_thresholds = {
-            "overvalued": -0.2,
-            "fairly_valued_low": -0.2,
-            "fairly_valued_high": 0.2,
-            "undervalued": 0.2
-        }
+        È una copia: modificarla non ha effetto sullo scoring (in precedenza
+        era il dizionario usato dal sistema). Per cambiare i pesi usare
+        update_weights, o un profilo per chiamata.
+        """
+        return self.profile.weight_map()
+    
+    @property
+    def thresholds(self) -> Dict[str, float]:
+        """Soglie per la classificazione del profilo predefinito (copia)"""
+        return self.profile.threshold_map()
+    
+    @property
+    def score_thresholds(self) -> Dict[str, float]:
+        """Soglie per il punteggio finale del profilo predefinito (copia)"""
+        return self.profile.score_threshold_map()
     
     def calculate_individual_score(self, company_value: Optional[float], 
                                  benchmark_value: Optional[float], 
-                                 indicator_type: str) -> Tuple[float, str]:
+                                 indicator_type: str,
+                                 profile: Optional[ScoringProfile] = None) -> Tuple[float, str]:
         """
         Calcola il punteggio individuale per un indicatore
         
@@ -54,12 +323,15 @@ class ScoringSystem:
             company_value: Valore dell'azienda
             benchmark_value: Valore benchmark del settore
             indicator_type: Tipo di indicatore (PE, PB, ROE)
+            profile: Profilo di scoring (default: quello del sistema)
             
         Returns:
             Tupla (score, classification)
         """
-        # Gestisce valori None
-        if company_value is None or benchmark_value is None or benchmark_value == 0:
+        threshold = (profile or self.profile).threshold_map()["overvalued_threshold"]
+        
+        # Gestisce valori None o NaN
+        if _missing(company_value) or _missing(benchmark_value) or benchmark_value == 0:
             return 0.0, "N/A"
         
         # Calcola la deviazione percentuale
@@ -67,38 +339,41 @@ class ScoringSystem:
         
         # Per ROE, logica inversa: valori più alti sono meglio
         if indicator_type == "ROE":
-            if deviation_percent > self.thresholds["overvalued_threshold"]:
+            if deviation_percent > threshold:
                 return 1.0, "Undervalued"  # ROE alto = buono
-            elif deviation_percent < -self.thresholds["overvalued_threshold"]:
+            elif deviation_percent < -threshold:
                 return -1.0, "Overvalued"  # ROE basso = cattivo
             else:
                 return 0.0, "Fair"
         
         # Per PE e PB, logica normale: valori più bassi sono meglio
         else:
-            if deviation_percent > self.thresholds["overvalued_threshold"]:
+            if deviation_percent > threshold:
                 return -1.0, "Overvalued"  # Valore alto = cattivo
-            elif deviation_percent < -self.thresholds["overvalued_threshold"]:
+            elif deviation_percent < -threshold:
                 return 1.0, "Undervalued"  # Valore basso = buono
             else:
                 return 0.0, "Fair"
     
-    def calculate_weighted_score(self, individual_scores: Dict[str, float]) -> float:
+    def calculate_weighted_score(self, individual_scores: Dict[str, float],
+                                 profile: Optional[ScoringProfile] = None) -> float:
         """
         Calcola il punteggio pesato aggregato
         
         Args:
             individual_scores: Dizionario con punteggi individuali
+            profile: Profilo di scoring (default: quello del sistema)
             
         Returns:
             Punteggio pesato finale
         """
+        weights = (profile or self.profile).weight_map()
         weighted_sum = 0.0
         total_weight = 0.0
         
         for indicator, score in individual_scores.items():
-            if indicator in self.weights:
-                weight = self.weights[indicator]
+            if indicator in weights:
+                weight = weights[indicator]
                 weighted_sum += score * weight
                 total_weight += weight
         
@@ -108,68 +383,148 @@ class ScoringSystem:
         
         return 0.0
     
-    def classify_final_signal(self, final_score: float) -> str:
+    def classify_final_signal(self, final_score: float,
+                              profile: Optional[ScoringProfile] = None) -> str:
         """
         Classifica il segnale finale basato sul punteggio
         
         Args:
             final_score: Punteggio finale pesato
+            profile: Profilo di scoring (default: quello del sistema)
             
         Returns:
             Classificazione del segnale
         """
-        if final_score <= self.score_thresholds["overvalued"]:
+        score_thresholds = (profile or self.profile).score_threshold_map()
+        if final_score <= score_thresholds["overvalued"]:
             return "Overvalued"
-        elif (final_score > self.score_thresholds["fairly_valued_low"] and 
-              final_score < self.score_thresholds["fairly_valued_high"]):
+        elif (final_score > score_thresholds["fairly_valued_low"] and 
+              final_score < score_thresholds["fairly_valued_high"]):
             return "Fairly valued"
         else:
             return "Undervalued"
     
     def analyze_company(self, company_fundamentals: Dict, 
-                       sector_benchmark: Dict) -> Dict:
+                       sector_benchmark: Dict,
+                       profile: Optional[ScoringProfile] = None) -> Dict:
         """
         Esegue l'analisi completa di un'azienda
         
         Args:
             company_fundamentals: Dizionario con fondamentali aziendali
             sector_benchmark: Dizionario con benchmark settoriale
+            profile: Profilo di scoring (default: quello del sistema)
             
         Returns:
             Dizionario con analisi completa
         """
+        return compile_profile(profile or self.profile)(company_fundamentals, sector_benchmark)
+    
+    def analyze_many(self, fundamentals: Dict[str, "np.ndarray"],
+                     benchmarks: Dict[str, "np.ndarray"],
+                     profile: Optional[ScoringProfile] = None) -> Dict[str, "np.ndarray"]:
+        """
+        Analisi vettorizzata di molte aziende (stesse regole di analyze_company)
+        
+        Args:
+            fundamentals: Colonne per indicatore (PE, PB, ROE), una riga per
+                azienda; None o NaN per i valori mancanti
+            benchmarks: Colonne dei benchmark per indicatore, allineate alle
+                aziende o scalari (stesso settore per tutte)
+            profile: Profilo di scoring (default: quello del sistema)
+            
+        Returns:
+            Dizionario di array: individual_scores e indicators (per
+            indicatore), weighted_score (non arrotondato), score (3 decimali),
+            final_signal e codes (indici in CLASSIFICATION_LABELS e
+            SIGNAL_LABELS, per indicatore e per final_signal)
+        """
+        profile = profile or self.profile
+        threshold = profile.threshold_map()["overvalued_threshold"]
+        weights = profile.weight_map()
+        score_thresholds = profile.score_threshold_map()
+        columns = [np.asarray(fundamentals.get(indicator), dtype=np.float64) for indicator in INDICATORS]
+        size = np.broadcast(*columns).shape
+        
         individual_scores = {}
         indicators = {}
-        
-        # Analizza ogni indicatore
-        for indicator in ["PE", "PB", "ROE"]:
-            company_value = company_fundamentals.get(indicator)
-            benchmark_value = sector_benchmark.get(indicator)
+        codes = {}
+        weighted_sum = np.zeros(size)
+        total_weight = 0.0
+        for indicator, company_values in zip(INDICATORS, columns):
+            benchmark_values = np.asarray(benchmarks.get(indicator), dtype=np.float64)
+            valid = ~np.isnan(company_values) & ~np.isnan(benchmark_values) & (benchmark_values != 0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                deviation_percent = ((company_values - benchmark_values) / benchmark_values) * 100
             
-            score, classification = self.calculate_individual_score(
-                company_value, benchmark_value, indicator
-            )
+            # Per ROE valori più alti sono meglio, per PE e PB valori più bassi
+            above, below = (1.0, -1.0) if indicator == "ROE" else (-1.0, 1.0)
+            scores = np.where(deviation_percent > threshold, above,
+                              np.where(deviation_percent < -threshold, below, 0.0))
+            scores = np.broadcast_to(np.where(valid, scores, 0.0), size)
             
-            individual_scores[indicator] = score
-            indicators[indicator] = classification
+            individual_scores[indicator] = scores
+            codes[indicator] = np.where(valid, scores + 2, 0).astype(np.int8)
+            indicators[indicator] = CLASSIFICATION_LABELS[codes[indicator]]
+            
+            # Stesso ordine di accumulo di calculate_weighted_score
+            if indicator in weights:
+                weight = weights[indicator]
+                weighted_sum = weighted_sum + scores * weight
+                total_weight += weight
         
-        # Calcola punteggio pesato finale
-        final_score = self.calculate_weighted_score(individual_scores)
+        weighted_score = weighted_sum / total_weight if total_weight > 0 else np.zeros(size)
         
-        # Classifica il segnale finale
-        final_signal = self.classify_final_signal(final_score)
+        fair = ((weighted_score > score_thresholds["fairly_valued_low"]) &
+                (weighted_score < score_thresholds["fairly_valued_high"]))
+        signal = np.where(weighted_score <= score_thresholds["overvalued"], 0, np.where(fair, 1, 2))
+        codes["final_signal"] = signal.astype(np.int8)
         
         return {
             "indicators": indicators,
             "individual_scores": individual_scores,
-            "score": round(final_score, 3),
-            "final_signal": final_signal
+            "weighted_score": weighted_score,
+            "score": np.round(weighted_score, 3),
+            "final_signal": SIGNAL_LABELS[signal],
+            "codes": codes
         }
     
+    @staticmethod
+    def unpack_many(result: Dict[str, "np.ndarray"]) -> List[Dict]:
+        """
+        Converte il risultato di analyze_many in un dizionario per azienda
+        
+        Args:
+            result: Risultato di analyze_many
+            
+        Returns:
+            Lista nel formato di analyze_company, nell'ordine delle righe
+        """
+        indicators = {name: values.tolist() for name, values in result["indicators"].items()}
+        scores = {name: values.tolist() for name, values in result["individual_scores"].items()}
+        weighted = result["weighted_score"].tolist()
+        signals = result["final_signal"].tolist()
+        return [
+            {
+                "indicators": {name: values[i] for name, values in indicators.items()},
+                "individual_scores": {name: values[i] for name, values in scores.items()},
+                "score": round(weighted[i], 3),
+                "final_signal": signals[i]
+            }
+            for i in range(len(weighted))
+        ]
+    
     def update_weights(self, new_weights: Dict[str, float]) -> bool:
         """
         Aggiorna i pesi degli indicatori
         
+        Validazione e semantica sono quelle originali: i nuovi pesi devono
+        essere numeri non negativi con somma tra 0.9 e 1.1 e vengono uniti a
+        quelli attuali. I pesi aggiornati formano un nuovo profilo predefinito:
+        quello precedente non viene modificato e le analisi già avviate con
+        esso non vedono il cambiamento. Per pesi validati sull'insieme
+        completo usare ScoringProfile.create o resolve_profile.
+        
         Args:
             new_weights: Nuovo dizionario dei pesi
             
@@ -191,39 +546,43 @@ class ScoringSystem:
             return False
         
         # Aggiorna i pesi
-        self.weights.update(new_weights)
+        weights = {**self.profile.weight_map(), **new_weights}
+        self.profile = replace(self.profile, weights=tuple(weights.items()), name="custom")
         return True
     
-    def get_configuration(self) -> Dict:
+    def get_configuration(self, profile: Optional[ScoringProfile] = None) -> Dict:
         """
-        Restituisce la configurazione attuale del sistema
+        Restituisce la configurazione di un profilo
+        
+        Args:
+            profile: Profilo di scoring (default: quello del sistema)
         
         Returns:
             Dizionario con configurazione
         """
-        return {
-            "weights": self.weights,
-            "thresholds": self.thresholds,
-            "score_thresholds": self.score_thresholds
-        }
+        return (profile or self.profile).to_dict()
     
     def explain_score(self, company_fundamentals: Dict, 
-                     sector_benchmark: Dict) -> Dict:
+                     sector_benchmark: Dict,
+                     profile: Optional[ScoringProfile] = None) -> Dict:
         """
         Fornisce una spiegazione dettagliata del calcolo del punteggio
         
         Args:
             company_fundamentals: Dizionario con fondamentali aziendali
             sector_benchmark: Dizionario con benchmark settoriale
+            profile: Profilo di scoring (default: quello del sistema)
             
         Returns:
             Dizionario con spiegazione dettagliata
         """
+        profile = profile or self.profile
+        weights = profile.weight_map()
         explanation = {
             "company_values": company_fundamentals,
             "benchmark_values": sector_benchmark,
             "calculation_details": {},
-            "weights_used": self.weights
+            "weights_used": weights
         }
         
         for indicator in ["PE", "PB", "ROE"]:
@@ -233,7 +592,7 @@ class ScoringSystem:
             if company_value and benchmark_value and benchmark_value != 0:
                 deviation_percent = ((company_value - benchmark_value) / benchmark_value) * 100
                 score, classification = self.calculate_individual_score(
-                    company_value, benchmark_value, indicator
+                    company_value, benchmark_value, indicator, profile
                 )
                 
                 explanation["calculation_details"][indicator] = {
@@ -242,7 +601,7 @@ class ScoringSystem:
                     "deviation_percent": round(deviation_percent, 2),
                     "individual_score": score,
                     "classification": classification,
-                    "weight": self.weights.get(indicator, 0)
+                    "weight": weights.get(indicator, 0)
                 }
             else:
                 explanation["calculation_details"][indicator] = {
@@ -251,7 +610,7 @@ class ScoringSystem:
                     "deviation_percent": "N/A",
                     "individual_score": 0,
                     "classification": "N/A",
-                    "weight": self.weights.get(indicator, 0)
+                    "weight": weights.get(indicator, 0)
                 }
         
         return explanation
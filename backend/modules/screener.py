@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Screener Module
+Tabella dei punteggi precalcolati dell'intero universo in cache, interrogabile
+per segnale, punteggio, settore, classificazione dei singoli indicatori e
+market cap senza chiamate a FMP.
+
+La tabella è colonnare (array NumPy, una riga per ticker) e viene aggiornata in
+modo incrementale:
+- le aziende arrivano dalla cache aziende (solo quando cambia);
+- i fondamentali sono registrati ad ogni analisi e rivalutano la sola riga;
+- un benchmark di settore nuovo rivaluta le sole righe del settore.
+All'avvio la tabella è popolata con i fondamentali già salvati nello storico
+(load_fundamentals), così i punteggi non si perdono al riavvio del worker.
+I settori sono sempre nel formato del stock-screener FMP (normalize_sector),
+lo stesso dei benchmark: un'azienda con settore GICS in cache (es. "Health
+Care") ricade nelle righe del benchmark "Healthcare".
+Gli ordinamenti per punteggio e market cap sono ricostruiti solo dopo una
+modifica, alla prima interrogazione successiva.
+
+Le colonne dei punteggi usano il profilo del sistema di scoring; una query con
+un profilo diverso valuta l'intera tabella in un solo passaggio vettorizzato e
+tiene il risultato finché la tabella non cambia.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .scoring_system import CLASSIFICATION_LABELS, INDICATORS, SIGNAL_LABELS, ScoringProfile, ScoringSystem
+from .sector_analysis import normalize_sector
+
+# Chiavi di ordinamento disponibili
+SORT_KEYS = ("score", "market_cap")
+
+# Codice del segnale per le righe senza punteggio
+UNSCORED = -1
+
+# Profili non predefiniti i cui punteggi restano in memoria
+PROFILE_CACHE_SIZE = 8
+
+
+class ScoreTable:
+    """Tabella colonnare dei punteggi dell'universo"""
+
+    def __init__(self, scoring_system: ScoringSystem, capacity: int = 1024):
+        """
+        Inizializza una tabella vuota
+
+        Args:
+            scoring_system: Sistema di scoring usato per i punteggi
+            capacity: Righe preallocate (la tabella cresce raddoppiando)
+        """
+        self.scoring_system = scoring_system
+        self.size = 0
+        self._rows: Dict[str, int] = {}
+        self.symbols: List[str] = []
+        self.names: List[str] = []
+        self.exchanges: List[Optional[str]] = []
+
+        self._sectors: List[str] = []
+        self._sector_codes: Dict[str, int] = {}
+        self._benchmarks = np.empty((0, len(INDICATORS)))
+        self._benchmark_versions: Dict[str, Any] = {}
+
+        self.sector = np.empty(capacity, dtype=np.int32)
+        self.market_cap = np.empty(capacity)
+        self.fundamentals = np.empty((capacity, len(INDICATORS)))
+        self.score = np.empty(capacity)
+        self.signal = np.empty(capacity, dtype=np.int8)
+        self.classification = np.empty((capacity, len(INDICATORS)), dtype=np.int8)
+
+        self._orders: Dict[Tuple[str, bool, Optional[ScoringProfile]], np.ndarray] = {}
+        self._profile_columns: Dict[ScoringProfile, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self.universe_version: Any = None
+
+    # ------------------------------------------------------------------ righe
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self.market_cap)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("sector", "market_cap", "fundamentals", "score", "signal", "classification"):
+            current = getattr(self, name)
+            grown = np.empty((capacity,) + current.shape[1:], dtype=current.dtype)
+            grown[:self.size] = current[:self.size]
+            setattr(self, name, grown)
+
+    def _sector_code(self, sector: Optional[str]) -> int:
+        sector = normalize_sector(sector) or "N/A"
+        code = self._sector_codes.get(sector)
+        if code is None:
+            code = len(self._sectors)
+            self._sectors.append(sector)
+            self._sector_codes[sector] = code
+            self._benchmarks = np.vstack([self._benchmarks, np.full((1, len(INDICATORS)), np.nan)])
+        return code
+
+    def _row(self, symbol: str) -> int:
+        """Indice della riga del ticker, creandola vuota se assente"""
+        row = self._rows.get(symbol)
+        if row is None:
+            row = self.size
+            self._grow(row + 1)
+            self._rows[symbol] = row
+            self.symbols.append(symbol)
+            self.names.append(symbol)
+            self.exchanges.append(None)
+            self.sector[row] = self._sector_code(None)
+            self.market_cap[row] = np.nan
+            self.fundamentals[row] = np.nan
+            self.score[row] = np.nan
+            self.signal[row] = UNSCORED
+            self.classification[row] = 0
+            self.size += 1
+        return row
+
+    # ------------------------------------------------------- aggiornamenti
+
+    def sync_universe(self, companies: Iterable, version: Any = None) -> int:
+        """
+        Aggiunge o aggiorna le aziende della cache (nome, exchange, settore, cap)
+
+        Il settore di un'azienda già analizzata non viene sovrascritto: resta
+        quello usato per il suo punteggio (è impostato comunque se ancora
+        sconosciuto). La market cap della cache aggiorna sempre quella nota.
+
+        Args:
+            companies: Oggetti con symbol, name, exchange, sector e market_cap
+            version: Identificativo dello stato della cache; se uguale a quello
+                dell'ultima sincronizzazione non si fa nulla
+
+        Returns:
+            Numero di aziende lette (0 se la cache non è cambiata)
+        """
+        if version is not None and version == self.universe_version:
+            return 0
+        count = 0
+        unknown = self._sector_code(None)
+        assigned: List[int] = []
+        for company in companies:
+            count += 1
+            row = self._row(company.symbol)
+            self.names[row] = company.name
+            self.exchanges[row] = company.exchange
+            if company.market_cap is not None:
+                self.market_cap[row] = company.market_cap
+            if np.isnan(self.fundamentals[row]).all():
+                self.sector[row] = self._sector_code(company.sector)
+            elif self.sector[row] == unknown and normalize_sector(company.sector):
+                self.sector[row] = self._sector_code(company.sector)
+                assigned.append(row)
+        self.universe_version = version
+        # Le nuove righe non hanno fondamentali: cambiano solo gli ordinamenti,
+        # tranne per le aziende analizzate che ricevono ora un settore
+        self._rescore(np.array(assigned, dtype=np.intp))
+        self._invalidate()
+        return count
+
+    def update_fundamentals(self, symbol: str, fundamentals: Dict[str, Optional[float]],
+                            sector: Optional[str] = None, market_cap: Optional[float] = None,
+                            name: Optional[str] = None) -> None:
+        """
+        Registra i fondamentali di un'azienda e ne ricalcola il punteggio
+
+        Args:
+            symbol: Ticker
+            fundamentals: Valori PE, PB, ROE (None se mancanti)
+            sector: Settore usato per il benchmark (mantiene quello noto se None)
+            market_cap: Capitalizzazione di mercato, come quella della cache (es.
+                dal profilo FMP; mantiene quella nota se None)
+            name: Nome dell'azienda (mantiene quello noto se None)
+        """
+        row = self._set_fundamentals(symbol.upper(), fundamentals, sector, market_cap, name)
+        self._rescore(np.array([row]))
+
+    def load_fundamentals(self, records: Iterable[Tuple[str, Dict[str, Optional[float]], Optional[str],
+                                                        Optional[float], Optional[str]]]) -> int:
+        """
+        Registra i fondamentali di più aziende con un solo ricalcolo (es. all'avvio)
+
+        Le righe che hanno già fondamentali non vengono toccate: quelli
+        registrati da un'analisi sono più recenti.
+
+        Args:
+            records: Tuple (ticker, fondamentali, settore, market_cap, nome)
+                come gli argomenti di update_fundamentals
+
+        Returns:
+            Numero di aziende registrate
+        """
+        rows = []
+        for symbol, fundamentals, sector, market_cap, name in records:
+            row = self._rows.get(symbol.upper())
+            if row is not None and not np.isnan(self.fundamentals[row]).all():
+                continue
+            rows.append(self._set_fundamentals(symbol.upper(), fundamentals, sector, market_cap, name))
+        self._rescore(np.array(rows, dtype=np.intp))
+        return len(rows)
+
+    def _set_fundamentals(self, symbol: str, fundamentals: Dict[str, Optional[float]],
+                          sector: Optional[str], market_cap: Optional[float], name: Optional[str]) -> int:
+        """Scrive fondamentali, settore, market cap e nome di una riga senza ricalcolarla"""
+        row = self._row(symbol)
+        self.fundamentals[row] = [np.nan if fundamentals.get(indicator) is None else fundamentals[indicator]
+                                  for indicator in INDICATORS]
+        if normalize_sector(sector):
+            self.sector[row] = self._sector_code(sector)
+        if market_cap is not None:
+            self.market_cap[row] = market_cap
+        if name and self.names[row] == self.symbols[row]:
+            self.names[row] = name
+        return row
+
+    def update_benchmark(self, sector: str, benchmark: Dict[str, Optional[float]],
+                         version: Any = None) -> bool:
+        """
+        Registra il benchmark di un settore e rivaluta le sue aziende
+
+        Args:
+            sector: Nome del settore
+            benchmark: Valori PE, PB, ROE del benchmark
+            version: Identificativo del calcolo (es. timestamp); se uguale
+                all'ultimo registrato non si fa nulla
+
+        Returns:
+            True se il benchmark è cambiato
+        """
+        sector = normalize_sector(sector) or "N/A"
+        if version is not None and self._benchmark_versions.get(sector) == version:
+            return False
+        code = self._sector_code(sector)
+        self._benchmarks[code] = [np.nan if benchmark.get(name) is None else benchmark[name]
+                                  for name in INDICATORS]
+        self._benchmark_versions[sector] = version
+        self._rescore(np.flatnonzero(self.sector[:self.size] == code))
+        return True
+
+    def rescore(self) -> None:
+        """Ricalcola tutti i punteggi (es. dopo una modifica dei pesi)"""
+        self._rescore(np.arange(self.size))
+
+    def _rescore(self, rows: np.ndarray) -> None:
+        """Ricalcola i punteggi delle righe indicate con lo scoring vettorizzato"""
+        if len(rows) == 0:
+            return
+        score, signal, classification = self._evaluate(rows)
+        self.score[rows] = score
+        self.signal[rows] = signal
+        self.classification[rows] = classification
+        self._invalidate()
+
+    def _evaluate(self, rows: np.ndarray, profile: Optional[ScoringProfile] = None
+                  ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Valuta le righe indicate con un profilo
+
+        Returns:
+            Tupla (score, signal, classification) allineata alle righe
+        """
+        values = self.fundamentals[rows]
+        benchmarks = self._benchmarks[self.sector[rows]]
+        result = self.scoring_system.analyze_many(
+            {name: values[:, i] for i, name in enumerate(INDICATORS)},
+            {name: benchmarks[:, i] for i, name in enumerate(INDICATORS)},
+            profile
+        )
+        # Punteggio solo con almeno un fondamentale e il benchmark del settore
+        scored = ~np.isnan(values).all(axis=1) & ~np.isnan(benchmarks).all(axis=1)
+        score = np.where(scored, result["weighted_score"], np.nan)
+        signal = np.where(scored, result["codes"]["final_signal"], UNSCORED).astype(np.int8)
+        classification = np.stack([result["codes"][name] for name in INDICATORS], axis=1)
+        return score, signal, classification
+
+    def _invalidate(self) -> None:
+        """Scarta ordinamenti e punteggi per profilo dopo una modifica"""
+        self._orders.clear()
+        self._profile_columns.clear()
+
+    def _columns(self, profile: Optional[ScoringProfile] = None
+                 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Colonne (score, signal, classification) della tabella per un profilo"""
+        if profile is None or profile == self.scoring_system.profile:
+            size = self.size
+            return self.score[:size], self.signal[:size], self.classification[:size]
+        columns = self._profile_columns.get(profile)
+        if columns is None:
+            if len(self._profile_columns) >= PROFILE_CACHE_SIZE:
+                self._profile_columns.pop(next(iter(self._profile_columns)))
+            columns = self._evaluate(np.arange(self.size), profile)
+            self._profile_columns[profile] = columns
+        return columns
+
+    # ------------------------------------------------------------ query
+
+    def _order(self, key: str, descending: bool, profile: Optional[ScoringProfile] = None) -> np.ndarray:
+        """Permutazione delle righe ordinate per chiave (valori mancanti in fondo)"""
+        profile = None if key != "score" or profile == self.scoring_system.profile else profile
+        cache_key = (key, descending, profile)
+        order = self._orders.get(cache_key)
+        if order is None:
+            values = self._columns(profile)[0] if key == "score" else getattr(self, key)[:self.size]
+            ascending = np.argsort(values, kind="stable")
+            valid = int(np.count_nonzero(~np.isnan(values)))
+            order = np.concatenate([ascending[:valid][::-1], ascending[valid:]]) if descending else ascending
+            self._orders[cache_key] = order
+        return order
+
+    def query(self, signals: Optional[Sequence[str]] = None, sector: Optional[str] = None,
+              min_score: Optional[float] = None, max_score: Optional[float] = None,
+              classifications: Optional[Dict[str, str]] = None,
+              min_market_cap: Optional[float] = None, max_market_cap: Optional[float] = None,
+              sort: str = "score", descending: bool = True,
+              offset: int = 0, limit: int = 50,
+              profile: Optional[ScoringProfile] = None) -> Dict[str, Any]:
+        """
+        Filtra e ordina l'universo
+
+        Args:
+            signals: Segnali finali ammessi (es. ["Undervalued"])
+            sector: Settore (nome FMP o GICS)
+            min_score, max_score: Intervallo del punteggio pesato
+            classifications: Indicatore -> classificazione richiesta (es. {"PE": "Undervalued"})
+            min_market_cap, max_market_cap: Intervallo di market cap
+            sort: Una di SORT_KEYS
+            descending: Ordine decrescente
+            offset, limit: Paginazione
+            profile: Profilo di scoring (default: quello del sistema)
+
+        Returns:
+            Dizionario con total (righe che soddisfano i filtri) e results
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Ordinamento non supportato: {sort} (validi: {', '.join(SORT_KEYS)})")
+
+        size = self.size
+        score, signal, classification = self._columns(profile)
+        mask = np.ones(size, dtype=bool)
+        if signals:
+            codes = [_label_code(label, SIGNAL_LABELS, "segnale") for label in signals]
+            mask &= np.isin(signal, codes)
+        if sector is not None:
+            code = self._sector_codes.get(normalize_sector(sector) or "N/A")
+            if code is None:
+                return {"total": 0, "results": []}
+            mask &= self.sector[:size] == code
+        with np.errstate(invalid="ignore"):
+            # Confronto sul punteggio arrotondato, come restituito nelle risposte
+            if min_score is not None:
+                mask &= np.round(score, 3) >= min_score
+            if max_score is not None:
+                mask &= np.round(score, 3) <= max_score
+            if min_market_cap is not None:
+                mask &= self.market_cap[:size] >= min_market_cap
+            if max_market_cap is not None:
+                mask &= self.market_cap[:size] <= max_market_cap
+        if classifications:
+            mask &= signal != UNSCORED
+        for indicator, label in (classifications or {}).items():
+            if indicator not in INDICATORS:
+                raise ValueError(f"Indicatore non supportato: {indicator}")
+            code = _label_code(label, CLASSIFICATION_LABELS, indicator)
+            mask &= classification[:, INDICATORS.index(indicator)] == code
+
+        order = self._order(sort, descending, profile)
+        matches = order[mask[order]]
+        page = matches[offset:offset + limit]
+        return {"total": int(len(matches)),
+                "results": [self.describe_row(row, profile) for row in page.tolist()]}
+
+    def describe_row(self, row: int, profile: Optional[ScoringProfile] = None) -> Dict[str, Any]:
+        """Riga della tabella in formato JSON (punteggi del profilo indicato)"""
+        score, signal, classification = self._columns(profile)
+        scored = signal[row] != UNSCORED
+        return {
+            "ticker": self.symbols[row],
+            "name": self.names[row],
+            "exchange": self.exchanges[row],
+            "sector": self._sectors[self.sector[row]],
+            "market_cap": _optional(self.market_cap[row]),
+            "fundamentals": {name: _optional(self.fundamentals[row, i]) for i, name in enumerate(INDICATORS)},
+            "indicators": ({name: CLASSIFICATION_LABELS[classification[row, i]]
+                            for i, name in enumerate(INDICATORS)} if scored else None),
+            "score": round(float(score[row]), 3) if scored else None,
+            "final_signal": SIGNAL_LABELS[signal[row]] if scored else None
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Righe totali, righe con punteggio e settori con benchmark"""
+        return {
+            "companies": self.size,
+            "scored": int(np.count_nonzero(self.signal[:self.size] != UNSCORED)),
+            "sectors_with_benchmark": sorted(self._benchmark_versions)
+        }
+
+
+def _label_code(label: str, vocabulary: np.ndarray, kind: str) -> int:
+    for code, value in enumerate(vocabulary):
+        if value.lower() == label.lower():
+            return code
+    raise ValueError(f"Valore non valido per {kind}: {label} (validi: {', '.join(vocabulary)})")
+
+
+def _optional(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
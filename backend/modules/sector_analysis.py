@@ -1,15 +1,82 @@
 #!/usr/bin/env python3
 """
 Sector Analysis Module
-Calcola benchmark dinamici per settore usando le prime 10 aziende per market cap
+Calcola benchmark dinamici per settore usando le prime aziende per market cap
+(10 per default, oppure l'intero settore)
+
+I benchmark sono serviti con stale-while-revalidate: l'ultimo valore calcolato
+(in memoria o nella cache su disco) viene restituito subito e, se ha superato
+BENCHMARK_TTL, ricalcolato in background. I ricalcoli concorrenti dello stesso
+settore sono coalescenti.
+
+Ogni benchmark conserva i ratios dei singoli peer e le statistiche robuste
+calcolate da sector_statistics: la statistica (media, mediana, media troncata
+o winsorizzata) e il numero di peer possono essere scelti per richiesta senza
+ricalcolare nulla verso FMP.
 """
 
-import requests
+import asyncio
 import json
 import time
+from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from modules.financial_ratios import FinancialRatios
+from modules.singleflight import SingleFlight
+from modules.sector_statistics import (DEFAULT_STATISTIC, DEFAULT_TRIM, STATISTICS,
+                                       benchmark_from_summary, summarize_peers, top_peers)
+
+# Validità dei benchmark settoriali (secondi)
+BENCHMARK_TTL = 86400
+
+# Finestra oltre la validità in cui un benchmark scaduto resta servibile
+# mentre viene ricalcolato (secondi)
+BENCHMARK_STALE_TTL = 7 * 86400
+
+# Peer usati per default (prime N aziende per market cap; 0 = intero settore)
+DEFAULT_PEER_COUNT = 10
+
+# Aziende richieste allo screener quando si usa l'intero settore
+SECTOR_SCREENER_LIMIT = 1000
+
+# Namespace dei benchmark nella cache su disco
+BENCHMARK_NAMESPACE = "sector_benchmark"
+
+# Nomi GICS (usati ad es. nella cache aziende) -> nomi del stock-screener FMP
+SECTOR_ALIASES = {
+    "Information Technology": "Technology",
+    "Health Care": "Healthcare",
+    "Financials": "Financial Services",
+    "Consumer Discretionary": "Consumer Cyclical",
+    "Consumer Staples": "Consumer Defensive",
+    "Materials": "Basic Materials",
+    "Telecommunication Services": "Communication Services",
+}
+_SECTOR_ALIASES = {name.lower(): target for name, target in SECTOR_ALIASES.items()}
+
+
+class NoCompaniesError(ValueError):
+    """Il stock-screener FMP ha risposto senza aziende valide per il settore"""
+
+
+class ScreenerUnavailableError(RuntimeError):
+    """Il stock-screener FMP non ha risposto (rete, timeout o HTTP diverso da 200)"""
+
+
+def normalize_sector(sector: Optional[str]) -> Optional[str]:
+    """
+    Nome del settore come lo conosce il stock-screener FMP
+
+    Args:
+        sector: Nome GICS o FMP (maiuscole e spazi esterni ignorati per i nomi GICS)
+
+    Returns:
+        Nome FMP, il nome invariato se non è un alias noto, None se vuoto
+    """
+    if not sector or not sector.strip():
+        return None
+    sector = sector.strip()
+    return _SECTOR_ALIASES.get(sector.lower(), sector)
 
 
 @dataclass
@@ -26,64 +93,90 @@ class SectorCompany:
 class SectorAnalyzer:
     """Analizzatore di settore per calcolare benchmark dinamici"""
     
-    def __init__(self, fmp_client):
+    def __init__(self, fmp_client, peer_count: int = DEFAULT_PEER_COUNT, trim: float = DEFAULT_TRIM):
         """
         Inizializza l'analizzatore di settore
         
         Args:
             fmp_client: Istanza di FinancialModelingPrepClient
+            peer_count: Prime N aziende per market cap usate come peer (0 = intero settore)
+            trim: Quota per coda esclusa dalla media troncata e limitata dalla winsorizzata
         """
         self.fmp_client = fmp_client
         self.api_key = fmp_client.api_key
         self.base_url = "https://financialmodelingprep.com/api/v3"
-        self.session = requests.Session()
-        self.session.params = {'apikey': self.api_key}
+        self.transport = fmp_client.transport
+        self.peer_count = peer_count
+        self.trim = trim
         
-        # Cache per i benchmark settoriali (24h)
+        # Cache per i benchmark settoriali (24h), persistita su disco se disponibile
         self._benchmark_cache = {}
         self._cache_timestamps = {}
+        self.disk_cache = getattr(self.transport, "disk_cache", None)
+        
+        # Ricalcoli in corso (uno per settore) e quelli avviati in background
+        self._refresh = SingleFlight()
+        self._background: Dict[str, asyncio.Future] = {}
+        self._clock = time.time
         
-    def get_companies_by_sector(self, sector: str, limit: int = 20) -> List[Dict]:
+    async def get_companies_by_sector_async(self, sector: str, limit: Optional[int] = None) -> List[Dict]:
         """
         Ottiene le aziende di un settore specifico
         
         Args:
             sector: Nome del settore
-            limit: Numero massimo di aziende da recuperare
+            limit: Numero massimo di aziende da recuperare (default: dal numero di peer)
             
         Returns:
-            Lista di dizionari con informazioni aziendali
+            Lista di dizionari con informazioni aziendali, le prime peer_count
+            per market cap (tutte se peer_count è 0); vuota se il settore non
+            ha aziende
+
+        Raises:
+            ScreenerUnavailableError: se FMP non risponde o risponde con un errore
+                (es. 429, 5xx, API key non valida): il settore non va
+                considerato vuoto
         """
+        if limit is None:
+            limit = max(20, 2 * self.peer_count) if self.peer_count else SECTOR_SCREENER_LIMIT
         endpoint = f"{self.base_url}/stock-screener"
         params = {
             'sector': sector,
             'limit': limit,
-            'exchange': 'NASDAQ,NYSE,AMEX'
+            'exchange': 'NASDAQ,NYSE,AMEX',
+            'apikey': self.api_key
         }
         
         try:
-            response = self.session.get(endpoint, params=params)
-            response.raise_for_status()
-            
-            companies = response.json()
-            
-            # Filtra e ordina per market cap
-            valid_companies = []
-            for company in companies:
-                market_cap = company.get('marketCap')
-                if market_cap and market_cap > 0:
-                    valid_companies.append(company)
-            
-            # Ordina per market cap (decrescente)
-            valid_companies.sort(key=lambda x: x.get('marketCap', 0), reverse=True)
-            
-            return valid_companies[:10]  # Top 10
-            
+            response = await self.transport.request(endpoint, params)
         except Exception as e:
             print(f"Errore nel recupero aziende settore {sector}: {e}")
-            return []
+            raise ScreenerUnavailableError(f"Screener FMP non raggiungibile per il settore {sector}: {e}") from e
+        if response.status_code != 200:
+            print(f"Errore nel recupero aziende settore {sector}: HTTP {response.status_code}")
+            raise ScreenerUnavailableError(
+                f"Screener FMP non disponibile per il settore {sector}: HTTP {response.status_code}"
+            )
+        
+        companies = response.data if isinstance(response.data, list) else []
+        
+        # Filtra e ordina per market cap
+        valid_companies = []
+        for company in companies:
+            market_cap = company.get('marketCap') if isinstance(company, dict) else None
+            if isinstance(market_cap, (int, float)) and market_cap > 0:
+                valid_companies.append(company)
+        
+        # Ordina per market cap (decrescente)
+        valid_companies.sort(key=lambda x: x.get('marketCap', 0), reverse=True)
+        
+        return valid_companies[:self.peer_count] if self.peer_count else valid_companies
     
-    def get_company_ratios(self, symbol: str) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+    def get_companies_by_sector(self, sector: str, limit: Optional[int] = None) -> List[Dict]:
+        """Versione sincrona di get_companies_by_sector_async"""
+        return self.transport.run(self.get_companies_by_sector_async(sector, limit))
+    
+    async def get_company_ratios_async(self, symbol: str) -> Tuple[Optional[float], Optional[float], Optional[float]]:
         """
         Ottiene i ratios finanziari per un'azienda
         
@@ -94,8 +187,8 @@ class SectorAnalyzer:
             Tupla con (PE, PB, ROE)
         """
         try:
-            ratios_calculator = FinancialRatios(symbol)
-            ratios = ratios_calculator.get_all_ratios()
+            ratios_calculator = FinancialRatios(symbol, api_key=self.api_key, transport=self.transport)
+            ratios = await ratios_calculator.get_all_ratios_async()
             
             return (
                 ratios.get('pe_ratio'),
@@ -106,32 +199,153 @@ class SectorAnalyzer:
             print(f"Errore nel calcolo ratios per {symbol}: {e}")
             return (None, None, None)
     
-    def calculate_sector_averages(self, companies: List[SectorCompany]) -> Dict[str, float]:
+    def get_company_ratios(self, symbol: str) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+        """Versione sincrona di get_company_ratios_async"""
+        return self.transport.run(self.get_company_ratios_async(symbol))
+    
+    def calculate_sector_averages(self, companies: List[SectorCompany],
+                                  statistic: str = "mean") -> Dict[str, float]:
         """
         Calcola le medie settoriali per i ratios
         
         Args:
             companies: Lista di aziende del settore
+            statistic: Statistica da usare (una di STATISTICS)
             
         Returns:
             Dizionario con medie calcolate
         """
-        # Raccoglie tutti i valori validi
-        pe_values = [c.pe_ratio for c in companies if c.pe_ratio is not None and c.pe_ratio > 0]
-        pb_values = [c.pb_ratio for c in companies if c.pb_ratio is not None and c.pb_ratio > 0]
-        roe_values = [c.roe_percent for c in companies if c.roe_percent is not None]
+        summary = summarize_peers([self._peer(company) for company in companies], self.trim)
+        return benchmark_from_summary(summary, statistic)
+    
+    @staticmethod
+    def _peer(company: SectorCompany) -> Dict:
+        """Ratios di un peer nel formato salvato con il benchmark"""
+        return {
+            "symbol": company.symbol,
+            "market_cap": company.market_cap,
+            "PE": company.pe_ratio,
+            "PB": company.pb_ratio,
+            "ROE": company.roe_percent
+        }
+    
+    def select_benchmark(self, result: Dict, statistic: Optional[str] = None,
+                         top: Optional[int] = None) -> Dict:
+        """
+        Adatta un benchmark calcolato alla statistica e al numero di peer richiesti
+        
+        Args:
+            result: Benchmark salvato (con peers e statistics)
+            statistic: Una di STATISTICS (default: quella del benchmark)
+            top: Usa solo le prime N aziende per market cap
+            
+        Returns:
+            Benchmark con valori, statistiche e aziende corrispondenti
+            
+        Raises:
+            ValueError: se la statistica non è supportata
+        """
+        statistic = statistic or result.get("statistic", DEFAULT_STATISTIC)
+        if statistic not in STATISTICS:
+            raise ValueError(f"Statistica non supportata: {statistic} (valide: {', '.join(STATISTICS)})")
+        
+        peers = result.get("peers")
+        if peers is None:
+            # Benchmark salvato prima delle statistiche per peer
+            return result
+        
+        summary = result["statistics"]
+        if top and top < len(peers):
+            peers = top_peers(peers, top)
+            summary = summarize_peers(peers, self.trim)
+        elif statistic == result["statistic"]:
+            return result
+        
+        return {
+            **result,
+            "companies_used": [peer["symbol"] for peer in peers],
+            "benchmark": benchmark_from_summary(summary, statistic),
+            "statistic": statistic,
+            "statistics": summary,
+            "peers": peers
+        }
+    
+    async def get_benchmark(self, sector: str, refresh: bool = True,
+                            statistic: Optional[str] = None, top: Optional[int] = None) -> Dict:
+        """
+        Benchmark settoriale con stale-while-revalidate
+        
+        Restituisce subito l'ultimo benchmark calcolato; se ha superato
+        BENCHMARK_TTL ne avvia il ricalcolo in background. Solo se non esiste
+        un benchmark precedente (o è oltre BENCHMARK_STALE_TTL) il calcolo
+        avviene durante la richiesta.
+        
+        Args:
+            sector: Nome del settore (FMP o GICS, vedi normalize_sector)
+            refresh: Se False legge soltanto i benchmark già calcolati, senza
+                avviare ricalcoli (quando se ne occupa lo scheduler)
+            statistic: Statistica del benchmark (una di STATISTICS)
+            top: Usa solo le prime N aziende per market cap
+            
+        Returns:
+            Dizionario con benchmark e aziende utilizzate, più computed_at
+            (data del calcolo) e stale (True se oltre la validità)
+            
+        Raises:
+            NoCompaniesError: se il settore non ha aziende (è un ValueError)
+            ValueError: se la statistica non è supportata
+            ScreenerUnavailableError: se FMP non risponde durante il calcolo
+            LookupError: se refresh è False e il benchmark non è ancora disponibile
+        """
+        sector = normalize_sector(sector)
+        cache_key = f"sector_{sector}"
+        now = self._clock()
+        result, computed_at = await self._lookup_benchmark(cache_key, now)
+        
+        if result is None:
+            if not refresh:
+                raise LookupError(f"Benchmark non ancora calcolato per il settore: {sector}")
+            result = await self.refresh_benchmark(sector)
+            computed_at = self._cache_timestamps[cache_key]
         
-        # Calcola medie
-        avg_pe = sum(pe_values) / len(pe_values) if pe_values else None
-        avg_pb = sum(pb_values) / len(pb_values) if pb_values else None
-        avg_roe = sum(roe_values) / len(roe_values) if roe_values else None
+        stale = now - computed_at >= BENCHMARK_TTL
+        if stale and refresh:
+            self._refresh_in_background(sector)
         
         return {
-            "PE": round(avg_pe, 2) if avg_pe else None,
-            "PB": round(avg_pb, 2) if avg_pb else None,
-            "ROE": round(avg_roe, 2) if avg_roe else None
+            **self.select_benchmark(result, statistic, top),
+            "computed_at": datetime.fromtimestamp(computed_at).isoformat(),
+            "stale": stale
         }
     
+    async def refresh_benchmark(self, sector: str) -> Dict:
+        """
+        Ricalcola il benchmark di un settore, coalescendo i ricalcoli concorrenti
+        
+        Args:
+            sector: Nome del settore
+            
+        Returns:
+            Dizionario con benchmark e aziende utilizzate
+        """
+        sector = normalize_sector(sector)
+        cache_key = f"sector_{sector}"
+        return await self._refresh.do(cache_key, lambda: self._compute_benchmark(sector))
+    
+    async def get_benchmark_age(self, sector: str) -> Optional[float]:
+        """
+        Secondi trascorsi dall'ultimo calcolo del benchmark (memoria o disco)
+        
+        Args:
+            sector: Nome del settore
+            
+        Returns:
+            Età in secondi, o None se non esiste un benchmark servibile
+        """
+        now = self._clock()
+        _, computed_at = await self._lookup_benchmark(f"sector_{normalize_sector(sector)}", now)
+        return now - computed_at if computed_at is not None else None
+    
     async def calculate_sector_benchmark(self, sector: str) -> Dict:
         """
         Calcola il benchmark settoriale dinamico
@@ -143,41 +357,93 @@ class SectorAnalyzer:
             Dizionario con benchmark e aziende utilizzate
         """
         # Controlla cache (24h)
+        sector = normalize_sector(sector)
+        cache_key = f"sector_{sector}"
+        current_time = self._clock()
+        
+        result, computed_at = await self._lookup_benchmark(cache_key, current_time)
+        if result is not None and current_time - computed_at < BENCHMARK_TTL:
+            return result
+        
+        return await self.refresh_benchmark(sector)
+    
+    async def _lookup_benchmark(self, cache_key: str, now: float) -> Tuple[Optional[Dict], Optional[float]]:
+        """
+        Cerca l'ultimo benchmark calcolato, prima in memoria poi su disco
+        
+        Returns:
+            Tupla (benchmark, timestamp del calcolo), o (None, None) se assente
+            o oltre la finestra stale
+        """
+        result = self._benchmark_cache.get(cache_key)
+        computed_at = self._cache_timestamps.get(cache_key)
+        
+        if result is None or now - computed_at >= BENCHMARK_TTL:
+            # Benchmark calcolato da un altro worker o prima di un riavvio
+            stored = await self._load_stored_benchmark(cache_key)
+            if stored is not None and (computed_at is None or stored.stored_at > computed_at):
+                result, computed_at = stored.value, stored.stored_at
+                self._benchmark_cache[cache_key] = result
+                self._cache_timestamps[cache_key] = computed_at
+        
+        if result is None or now - computed_at >= BENCHMARK_TTL + BENCHMARK_STALE_TTL:
+            return None, None
+        return result, computed_at
+    
+    def _refresh_in_background(self, sector: str) -> None:
+        """Avvia il ricalcolo di un benchmark scaduto, se non è già in corso"""
         cache_key = f"sector_{sector}"
-        current_time = time.time()
+        if cache_key in self._background:
+            return
         
-        if (cache_key in self._benchmark_cache and 
-            cache_key in self._cache_timestamps and
-            current_time - self._cache_timestamps[cache_key] < 86400):  # 24h
-            return self._benchmark_cache[cache_key]
+        future = asyncio.ensure_future(self.refresh_benchmark(sector))
+        self._background[cache_key] = future
+        
+        def done(future: asyncio.Future) -> None:
+            self._background.pop(cache_key, None)
+            if not future.cancelled() and future.exception() is not None:
+                # Si continua a servire il valore precedente fino al prossimo tentativo
+                print(f"Errore nel ricalcolo del benchmark {sector}: {future.exception()}")
+        
+        future.add_done_callback(done)
+    
+    async def _compute_benchmark(self, sector: str) -> Dict:
+        """
+        Calcola il benchmark interrogando FMP e lo salva in memoria e su disco
+        
+        Args:
+            sector: Nome del settore
+            
+        Returns:
+            Dizionario con benchmark e aziende utilizzate
+        """
+        cache_key = f"sector_{sector}"
+        current_time = self._clock()
         
         print(f"Calcolando benchmark per settore: {sector}")
         
         # Ottieni aziende del settore
-        sector_companies = self.get_companies_by_sector(sector)
+        sector_companies = await self.get_companies_by_sector_async(sector)
         
         if not sector_companies:
-            raise ValueError(f"Nessuna azienda trovata per il settore: {sector}")
+            raise NoCompaniesError(f"Nessuna azienda trovata per il settore: {sector}")
+        
+        # Processa i peer in parallelo: la frequenza delle chiamate è regolata
+        # dal token bucket del trasporto (quota del piano FMP)
+        selected = [c for c in sector_companies if c.get('symbol')]
+        ratios = await asyncio.gather(*(
+            self.get_company_ratios_async(company_data['symbol']) for company_data in selected
+        ))
         
-        # Processa le prime 10 aziende
         processed_companies = []
         companies_used = []
         
-        for company_data in sector_companies[:10]:
-            symbol = company_data.get('symbol')
-            name = company_data.get('companyName', 'N/A')
-            market_cap = company_data.get('marketCap', 0)
-            
-            if not symbol:
-                continue
-            
-            # Ottieni ratios finanziari
-            pe, pb, roe = self.get_company_ratios(symbol)
-            
+        for company_data, (pe, pb, roe) in zip(selected, ratios):
+            symbol = company_data['symbol']
             company = SectorCompany(
                 symbol=symbol,
-                name=name,
-                market_cap=market_cap,
+                name=company_data.get('companyName', 'N/A'),
+                market_cap=company_data.get('marketCap', 0),
                 pe_ratio=pe,
                 pb_ratio=pb,
                 roe_percent=roe
@@ -185,36 +451,76 @@ class SectorAnalyzer:
             
             processed_companies.append(company)
             companies_used.append(symbol)
-            
-            # Pausa per evitare rate limiting
-            time.sleep(0.1)
         
-        # Calcola benchmark
-        benchmark = self.calculate_sector_averages(processed_companies)
+        # Calcola benchmark e statistiche robuste
+        peers = [self._peer(company) for company in processed_companies]
+        statistics = summarize_peers(peers, self.trim)
+        benchmark = benchmark_from_summary(statistics, DEFAULT_STATISTIC)
         
         # Prepara risultato
         result = {
             "sector": sector,
             "companies_used": companies_used,
-            "benchmark": benchmark
+            "benchmark": benchmark,
+            "statistic": DEFAULT_STATISTIC,
+            "statistics": statistics,
+            "peers": peers
         }
         
         # Aggiorna cache
         self._benchmark_cache[cache_key] = result
         self._cache_timestamps[cache_key] = current_time
+        await self._store_benchmark(cache_key, result)
         
         print(f"Benchmark calcolato per {sector}: {benchmark}")
         
         return result
     
+    async def _load_stored_benchmark(self, cache_key: str):
+        """Legge un benchmark dalla cache su disco (None se assente o non disponibile)"""
+        if self.disk_cache is None:
+            return None
+        try:
+            return await asyncio.to_thread(self.disk_cache.get, BENCHMARK_NAMESPACE, cache_key)
+        except Exception as e:
+            print(f"Errore nella lettura del benchmark {cache_key} da disco: {e}")
+            return None
+    
+    async def _store_benchmark(self, cache_key: str, result: Dict) -> None:
+        """Salva un benchmark nella cache su disco"""
+        if self.disk_cache is None:
+            return
+        try:
+            await asyncio.to_thread(
+                self.disk_cache.set, BENCHMARK_NAMESPACE, cache_key, result,
+                BENCHMARK_TTL, BENCHMARK_STALE_TTL
+            )
+        except Exception as e:
+            print(f"Errore nel salvataggio del benchmark {cache_key} su disco: {e}")
+    
+    def cached_benchmarks(self) -> List[Tuple[str, Dict, float]]:
+        """
+        Benchmark presenti in memoria
+        
+        Returns:
+            Lista di tuple (settore, benchmark, timestamp del calcolo)
+        """
+        return [
+            (result["sector"], result, self._cache_timestamps[cache_key])
+            for cache_key, result in list(self._benchmark_cache.items())
+        ]
+    
     def get_cache_status(self) -> Dict:
         """Restituisce lo stato della cache"""
         return {
             "cached_sectors": list(self._benchmark_cache.keys()),
-            "cache_timestamps": self._cache_timestamps
+            "cache_timestamps": self._cache_timestamps,
+            "refreshing": [key for key in self._background]
         }
     
     def clear_cache(self):
-        """Pulisce la cache"""
+        """Pulisce la cache (anche quella su disco)"""
         self._benchmark_cache.clear()
         self._cache_timestamps.clear()
+        if self.disk_cache is not None:
+            self.disk_cache.clear(BENCHMARK_NAMESPACE)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Sector Statistics Module
+Statistiche robuste e vettorizzate (NumPy) dei ratios di un insieme di peer.
+
+Con pochi peer una media aritmetica è dominata dai valori estremi (es. un P/E
+di 300 di una megacap con utili bassi); mediana, media troncata e media
+winsorizzata non lo sono. Tutte le statistiche di tutti i ratios sono
+calcolate con un solo ordinamento della matrice peer x ratio: i valori non
+validi sono NaN, finiscono in fondo all'ordinamento e vengono esclusi dai
+conteggi per colonna.
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# Statistiche selezionabili come benchmark
+STATISTICS = ("mean", "median", "trimmed_mean", "winsorized_mean")
+
+# Statistica usata quando la richiesta non ne indica una
+DEFAULT_STATISTIC = "median"
+
+# Quota di valori esclusi (troncata) o limitati (winsorizzata) per ciascuna coda
+DEFAULT_TRIM = 0.1
+
+# Percentili riportati per ogni ratio
+PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+
+# Ratios del benchmark e relativi filtri di validità (come nelle medie storiche:
+# PE e PB negativi non sono confrontabili, il ROE negativo sì)
+RATIOS = ("PE", "PB", "ROE")
+POSITIVE_ONLY = {"PE": True, "PB": True, "ROE": False}
+
+
+def peer_matrix(peers: Sequence[Dict], ratios: Sequence[str] = RATIOS) -> np.ndarray:
+    """
+    Costruisce la matrice peer x ratio, con NaN per i valori mancanti o non validi
+
+    Args:
+        peers: Dizionari con una chiave per ratio (es. {"PE": 25.1, "PB": None, ...})
+        ratios: Ratios da estrarre, nell'ordine delle colonne
+
+    Returns:
+        Array float64 di forma (len(peers), len(ratios))
+    """
+    matrix = np.array(
+        [[np.nan if peer.get(ratio) is None else peer[ratio] for ratio in ratios] for peer in peers],
+        dtype=np.float64
+    ).reshape(len(peers), len(ratios))
+    positive = np.array([POSITIVE_ONLY.get(ratio, False) for ratio in ratios])
+    with np.errstate(invalid="ignore"):
+        matrix[:, positive] = np.where(matrix[:, positive] > 0, matrix[:, positive], np.nan)
+    matrix[~np.isfinite(matrix)] = np.nan
+    return matrix
+
+
+def describe_matrix(matrix: np.ndarray, trim: float = DEFAULT_TRIM,
+                    percentiles: Sequence[float] = PERCENTILES) -> Dict[str, np.ndarray]:
+    """
+    Calcola tutte le statistiche per colonna ignorando i NaN
+
+    Args:
+        matrix: Array (peer, colonne); i NaN sono valori mancanti
+        trim: Quota esclusa/limitata per coda (0 <= trim < 0.5)
+        percentiles: Percentili richiesti (0-100, interpolazione lineare)
+
+    Returns:
+        Dizionario statistica -> array per colonna (NaN se la colonna non ha
+        valori); "percentiles" ha forma (len(percentiles), colonne)
+    """
+    if not 0 <= trim < 0.5:
+        raise ValueError("trim deve essere compreso tra 0 e 0.5")
+
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if matrix.ndim == 1:
+        matrix = matrix[:, None]
+    rows, columns = matrix.shape
+    if rows == 0:
+        missing = np.full(columns, np.nan)
+        return {
+            "count": np.zeros(columns, dtype=np.int64),
+            **{name: missing.copy() for name in STATISTICS},
+            "percentiles": np.full((len(percentiles), columns), np.nan),
+        }
+
+    ordered = np.sort(matrix, axis=0)               # NaN in fondo
+    count = rows - np.isnan(ordered).sum(axis=0)
+    empty = count == 0
+    column = np.arange(columns)
+
+    # Somme prefisse: la somma di ordered[a:b] è prefix[b] - prefix[a]; i NaN
+    # stanno dopo la posizione count, quindi non entrano nelle somme usate
+    prefix = np.zeros((rows + 1, columns))
+    np.cumsum(ordered, axis=0, out=prefix[1:])
+
+    # Percentili con interpolazione lineare tra i due valori ordinati adiacenti
+    last = np.maximum(count - 1, 0)
+    position = np.asarray(percentiles, dtype=np.float64)[:, None] / 100.0 * last
+    low = position.astype(np.int64)
+    low_values = ordered[low, column]
+    high_values = ordered[np.minimum(low + 1, last), column]
+    percentile_values = low_values + (high_values - low_values) * (position - low)
+
+    median = (ordered[last // 2, column] + ordered[(count // 2) * (count > 0), column]) / 2.0
+
+    # Coda esclusa per lato, mai tale da svuotare la colonna
+    cut = np.minimum((count * trim).astype(np.int64), last // 2)
+    kept = count - 2 * cut
+    inner_sum = prefix[count - cut, column] - prefix[cut, column]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = prefix[count, column] / count
+        trimmed_mean = inner_sum / kept
+        winsorized_mean = (inner_sum + cut * (ordered[cut, column] + ordered[last - cut, column])) / count
+
+    result = {
+        "count": count,
+        "mean": mean,
+        "median": median,
+        "trimmed_mean": trimmed_mean,
+        "winsorized_mean": winsorized_mean,
+        "percentiles": percentile_values,
+    }
+    for name, values in result.items():
+        if name != "count":
+            values[..., empty] = np.nan
+    return result
+
+
+def _rounded(value: float) -> Optional[float]:
+    return round(float(value), 2) if np.isfinite(value) else None
+
+
+def summarize_peers(peers: Sequence[Dict], trim: float = DEFAULT_TRIM,
+                    ratios: Sequence[str] = RATIOS) -> Dict[str, Dict]:
+    """
+    Statistiche complete per ratio di un insieme di peer
+
+    Args:
+        peers: Dizionari con una chiave per ratio
+        trim: Quota esclusa/limitata per coda
+        ratios: Ratios da descrivere
+
+    Returns:
+        Dizionario ratio -> {count, mean, median, trimmed_mean,
+        winsorized_mean, percentiles: {livello: valore}} con valori arrotondati
+    """
+    stats = describe_matrix(peer_matrix(peers, ratios), trim)
+    summary = {}
+    for i, ratio in enumerate(ratios):
+        entry = {"count": int(stats["count"][i])}
+        for name in STATISTICS:
+            entry[name] = _rounded(stats[name][i])
+        entry["percentiles"] = {
+            str(level): _rounded(value) for level, value in zip(PERCENTILES, stats["percentiles"][:, i])
+        }
+        summary[ratio] = entry
+    return summary
+
+
+def benchmark_from_summary(summary: Dict[str, Dict], statistic: str = DEFAULT_STATISTIC) -> Dict[str, Optional[float]]:
+    """
+    Estrae il benchmark (un valore per ratio) dalla statistica scelta
+
+    Args:
+        summary: Risultato di summarize_peers
+        statistic: Una di STATISTICS
+
+    Returns:
+        Dizionario ratio -> valore (None se il ratio non ha valori validi)
+    """
+    if statistic not in STATISTICS:
+        raise ValueError(f"Statistica non supportata: {statistic} (valide: {', '.join(STATISTICS)})")
+    return {ratio: entry[statistic] for ratio, entry in summary.items()}
+
+
+def top_peers(peers: Iterable[Dict], top: Optional[int]) -> List[Dict]:
+    """
+    Prime `top` aziende per market cap (tutte se top è None o 0)
+
+    Args:
+        peers: Dizionari con chiave market_cap
+        top: Numero di peer da mantenere
+
+    Returns:
+        Lista ordinata per market cap decrescente
+    """
+    ordered = sorted(peers, key=lambda peer: peer.get("market_cap") or 0, reverse=True)
+    return ordered[:top] if top else ordered
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Single-flight Module
+Coalescenza delle richieste identiche in volo: i chiamanti concorrenti con la
+stessa chiave attendono un'unica esecuzione invece di avviarne una ciascuno.
+
+Non è thread-safe: va usato da un solo event loop (quello del trasporto HTTP).
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Gruppo di chiamate coalescenti indicizzate per chiave"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        Esegue factory() una sola volta per tutte le chiamate concorrenti con la stessa chiave
+
+        La cancellazione di un chiamante non interrompe l'esecuzione condivisa,
+        che resta disponibile per gli altri in attesa.
+
+        Args:
+            key: Chiave normalizzata della richiesta
+            factory: Funzione che crea la coroutine da eseguire
+
+        Returns:
+            Il risultato condiviso (lo stesso oggetto per tutti i chiamanti)
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.executions += 1
+        future = asyncio.ensure_future(factory())
+        self._inflight[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # Evita il warning "exception was never retrieved" se tutti i chiamanti sono stati cancellati
+        if not future.cancelled():
+            future.exception()
+
+    def in_flight(self) -> int:
+        """Numero di esecuzioni attualmente in corso"""
+        return len(self._inflight)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Restituisce i contatori di coalescenza"""
+        total = self.executions + self.coalesced
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+            "coalesced_ratio": round(self.coalesced / total, 4) if total else 0.0
+        }
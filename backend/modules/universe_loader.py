@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Universe Loader Module
+Precaricamento in blocco della directory dei simboli quotati nella cache aziende.
+
+La lista completa (una chiamata FMP stock-list, oppure un file CSV, JSON o
+NDJSON locale) viene letta in un solo passaggio e confrontata con la cache:
+solo le aziende nuove o modificate vengono inserite e accodate al journal,
+poi gli indici di ricerca vengono costruiti. Un aggiornamento successivo
+costa quindi quanto le differenze, non quanto l'intero universo: lo
+snapshot viene riscritto solo dalla compattazione, quando il journal supera
+JOURNAL_COMPACT_THRESHOLD voci.
+
+Le aziende assenti dalla lista non vengono rimosse: la cache contiene anche
+quelle trovate tramite search-name, che una lista parziale non comprende.
+
+Uso (dalla cartella backend):
+    python -m modules.universe_loader                # lista da FMP (richiede FMP_API_KEY)
+    python -m modules.universe_loader simboli.csv    # file locale
+"""
+
+import csv
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from .fortune500_cache import CachedCompany, Fortune500Cache
+from .http_client import FMPTransport, get_transport
+
+logger = logging.getLogger(__name__)
+
+# Endpoint FMP con l'elenco completo dei simboli quotati
+UNIVERSE_ENDPOINT = "stock-list"
+
+# Nomi dei campi accettati, nell'ordine di preferenza (FMP stock-list,
+# stock-screener/company-screener e formato della cache)
+_FIELDS = {
+    "symbol": ("symbol", "ticker"),
+    "name": ("companyName", "name"),
+    "exchange": ("exchangeShortName", "exchange"),
+    "market_cap": ("marketCap", "mktCap", "market_cap"),
+    "sector": ("sector",),
+    "industry": ("industry",),
+}
+_COMPARED = ("name", "exchange", "market_cap", "sector", "industry")
+
+
+def _first(row: Dict[str, Any], names: tuple) -> Any:
+    for name in names:
+        value = row.get(name)
+        if isinstance(value, str):
+            value = value.strip()
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def normalize_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Estrae i campi della cache da una riga della lista simboli
+
+    Args:
+        row: Riga FMP o del file locale
+
+    Returns:
+        Dizionario con symbol, name, exchange, market_cap, sector e industry,
+        o None se mancano ticker o nome
+    """
+    fields = {field: _first(row, names) for field, names in _FIELDS.items()}
+    if not fields["symbol"] or not fields["name"]:
+        return None
+    fields["symbol"] = str(fields["symbol"]).upper()
+    try:
+        fields["market_cap"] = float(fields["market_cap"]) if fields["market_cap"] is not None else None
+    except (TypeError, ValueError):
+        fields["market_cap"] = None
+    return fields
+
+
+def _iter_json_array(f: TextIO, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """Decodifica un array JSON un elemento alla volta, senza caricarlo tutto in memoria"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started:
+            if buffer:
+                if buffer[0] != "[":
+                    raise ValueError("Il file JSON deve contenere un array")
+                buffer = buffer[1:]
+                started = True
+                continue
+        elif buffer.startswith("]"):
+            return
+        elif buffer.startswith(","):
+            buffer = buffer[1:]
+            continue
+        elif buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except ValueError:
+                if eof:
+                    raise
+            else:
+                yield item
+                buffer = buffer[end:]
+                continue
+        if eof:
+            if started:
+                raise ValueError("Array JSON incompleto")
+            return
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def iter_universe_file(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Legge in streaming una lista simboli da file
+
+    Args:
+        path: File .csv (con intestazione), .json (array) o .ndjson/.jsonl
+
+    Returns:
+        Iteratore sulle righe del file
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if extension == ".csv":
+            yield from csv.DictReader(f)
+        elif extension in (".ndjson", ".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_array(f)
+
+
+def fetch_universe(api_key: Optional[str] = None,
+                   transport: Optional[FMPTransport] = None) -> List[Dict[str, Any]]:
+    """
+    Scarica la lista completa dei simboli con una sola chiamata FMP
+
+    Args:
+        api_key: Chiave API (default: variabile d'ambiente FMP_API_KEY)
+        transport: Trasporto HTTP condiviso (default: get_transport())
+
+    Returns:
+        Righe della lista; lista vuota in caso di errore
+    """
+    transport = transport or get_transport()
+    params = {"apikey": api_key or os.getenv("FMP_API_KEY")}
+    try:
+        response = transport.request_sync(UNIVERSE_ENDPOINT, params)
+    except Exception as e:
+        logger.error(f"Errore nel download della lista simboli: {e}")
+        return []
+    if response.status_code != 200 or not isinstance(response.data, list):
+        logger.error(f"Errore nel download della lista simboli: HTTP {response.status_code}")
+        return []
+    return response.data
+
+
+def preload_universe(cache: Fortune500Cache, rows: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Applica alla cache le differenze rispetto a una lista simboli
+
+    I campi assenti dalla lista (es. settore nella stock-list) mantengono il
+    valore già in cache. Le aziende nuove o modificate sono inserite in
+    blocco e accodate al journal; segue la costruzione degli indici.
+
+    Args:
+        cache: Cache aziende da aggiornare
+        rows: Righe della lista (da fetch_universe o iter_universe_file)
+
+    Returns:
+        Conteggi: rows, added, updated, unchanged, skipped
+    """
+    counts = {"rows": 0, "added": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+    changed = []
+    seen = set()
+    cache.refresh()
+    for row in rows:
+        counts["rows"] += 1
+        fields = normalize_row(row)
+        if fields is None or fields["symbol"] in seen:
+            counts["skipped"] += 1
+            continue
+        seen.add(fields["symbol"])
+
+        current = cache.cache.get(fields["symbol"])
+        if current is not None:
+            for field in _COMPARED:
+                if fields[field] is None:
+                    fields[field] = getattr(current, field)
+            if all(fields[field] == getattr(current, field) for field in _COMPARED):
+                counts["unchanged"] += 1
+                continue
+        counts["updated" if current is not None else "added"] += 1
+        changed.append(CachedCompany(**fields))
+
+    if changed:
+        cache.add_companies(changed)
+        cache.save_cache()
+    cache.build_index()
+    logger.info(f"Universo precaricato: {counts}")
+    return counts
+
+
+def main():
+    """Precarica l'universo da FMP o dal file indicato"""
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1:
+        rows = iter_universe_file(sys.argv[1])
+    else:
+        rows = fetch_universe()
+    cache = Fortune500Cache()
+    counts = preload_universe(cache, rows)
+    # Un precaricamento ampio avvia la compattazione: va completata prima di uscire
+    cache.wait_for_compaction()
+    print(f"✓ Righe lette: {counts['rows']}")
+    print(f"✓ Nuove: {counts['added']}, aggiornate: {counts['updated']}, "
+          f"invariate: {counts['unchanged']}, scartate: {counts['skipped']}")
+
+
+if __name__ == "__main__":
+    main()
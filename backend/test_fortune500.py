@@ -5,6 +5,10 @@ Test del sistema di cache Fortune 500
 
 import sys
 import os
+import json
+import random
+import tempfile
+import time
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from modules.fortune500_cache import Fortune500Cache, initialize_fortune500_cache
@@ -90,6 +94,442 @@ def test_cache_management():
     stats_after_clear = cache.get_cache_stats()
     print(f"📊 Dopo svuotamento: {stats_after_clear['total_companies']} aziende")
 
+def linear_search(cache, company_name):
+    """Ricerca di riferimento: scansione lineare della cache"""
+    company_name_lower = company_name.lower().strip()
+    for company in cache.cache.values():
+        if company.name.lower() == company_name_lower:
+            return company
+    for company in cache.cache.values():
+        if company_name_lower in company.name.lower() or company.name.lower() in company_name_lower:
+            return company
+    return cache.cache.get(company_name_lower.upper())
+
+def linear_stats(cache):
+    """Statistiche di riferimento: scansione lineare della cache"""
+    exchanges, sectors = {}, {}
+    for company in cache.cache.values():
+        exchanges[company.exchange] = exchanges.get(company.exchange, 0) + 1
+        if company.sector:
+            sectors[company.sector] = sectors.get(company.sector, 0) + 1
+    return {"total_companies": len(cache.cache), "exchanges": exchanges, "sectors": sectors,
+            "last_updated": max(c.last_updated for c in cache.cache.values())}
+
+def test_indexed_search():
+    """La ricerca indicizzata restituisce gli stessi risultati della scansione lineare"""
+    print("\n🔎 Test Ricerca Indicizzata")
+    print("=" * 50)
+    
+    from modules.fortune500_cache import CachedCompany
+    random.seed(42)
+    words = ["Global", "Tech", "Bio", "Energy", "Capital", "Systems", "Foods", "Motors", "Holdings", "Pharma"]
+    suffixes = ["Inc.", "Corporation", "Co.", "plc", "Group"]
+    
+    with tempfile.TemporaryDirectory() as directory:
+        # Universo sintetico grande, scritto nel formato del file di cache
+        data = {}
+        for i in range(25000):
+            name = f"{random.choice(words)} {random.choice(words)} {i} {random.choice(suffixes)}"
+            company = {"symbol": f"S{i}", "name": name, "exchange": "NYSE", "sector": "Technology"}
+            data[f"S{i}"] = company
+            data[f"name_{name.lower().replace(' ', '_')}"] = company
+        cache_file = os.path.join(directory, "cache.json")
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        
+        cache = Fortune500Cache(cache_file=cache_file)
+        # Aggiornamenti dopo il caricamento: nuova voce e ticker sovrascritto con altro nome
+        cache.add_company(CachedCompany(symbol="APPL", name="Apple Inc.", exchange="NASDAQ"))
+        cache.add_company(CachedCompany(symbol="S7", name="Renamed Motors Inc.", exchange="NYSE"))
+        
+        queries = ["apple", "Apple Inc.", "  APPLE INC.  ", "renamed", "Global Tech 7 Inc.", "s7",
+                   "tech 123", "motors", "x", "", "Inc", "Energy Bio 24999 Group and more",
+                   "Global", "Azienda Inesistente", "Capital Pharma 999 plc",
+                   data["S7"]["name"], data["S8"]["name"][:12]]
+        queries += [random.choice(words) + " " + str(random.randint(0, 30000)) for _ in range(60)]
+        
+        start = time.perf_counter()
+        indexed = [cache.search_company(q) for q in queries]
+        elapsed = (time.perf_counter() - start) / len(queries)
+        expected = [linear_search(cache, q) for q in queries]
+        
+        assert indexed == expected
+        print(f"✓ {len(queries)} query identiche alla scansione lineare")
+        print(f"✓ Tempo medio per ricerca su {len(cache.cache)} voci: {elapsed * 1000:.3f} ms")
+        
+        # Statistiche incrementali: una voce per ticker, sostituzioni non contate due volte
+        cache.add_company(CachedCompany(symbol="S9", name="Moved Holdings Inc.", exchange="NASDAQ", sector="Energy"))
+        stats = cache.get_cache_stats()
+        assert stats == linear_stats(cache)
+        assert stats["total_companies"] == 25001 and stats["exchanges"]["NASDAQ"] == 2
+        cache.clear_cache()
+        assert cache.get_cache_stats() == {"total_companies": 0, "exchanges": {}, "sectors": {}}
+        print(f"✓ Statistiche incrementali coerenti: {stats['exchanges']}")
+
+def test_prefix_suggestions():
+    """I suggerimenti per prefisso sono distinti e ordinati per market cap"""
+    print("\n💡 Test Suggerimenti per Prefisso")
+    print("=" * 50)
+    
+    from modules.fortune500_cache import CachedCompany
+    random.seed(7)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        companies = {}
+        for i in range(2000):
+            name = f"{random.choice(['Alpha', 'Alps', 'Beta', 'Bank', 'Apex'])} {i} Inc."
+            company = CachedCompany(symbol=f"A{i}", name=name, exchange="NYSE",
+                                    market_cap=random.choice([None, random.uniform(1e6, 1e12)]))
+            companies[company.symbol] = company
+        # Caricamento in blocco, poi aggiornamenti incrementali (incluso un ticker sovrascritto)
+        cache_file = os.path.join(directory, "cache.json")
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump({symbol: c.to_dict() for symbol, c in companies.items()}, f)
+        cache = Fortune500Cache(cache_file=cache_file)
+        for company in [CachedCompany(symbol="A5", name="Bank Renamed Inc.", exchange="NYSE", market_cap=5e12),
+                        CachedCompany(symbol="NEW", name="Alpine Corp", exchange="NYSE", market_cap=2e12)]:
+            cache.add_company(company)
+            companies[company.symbol] = company
+        
+        def expected(prefix, limit=10):
+            matches = [c for c in companies.values()
+                       if c.name.lower().startswith(prefix) or c.symbol.lower().startswith(prefix)]
+            matches.sort(key=lambda c: (-(c.market_cap if c.market_cap is not None else float("-inf")),
+                                        c.name.lower(), c.symbol))
+            return matches[:limit]
+        
+        for prefix in ["a", "al", "alp", "alph", "alpha 1", "b", "bank", "a1", "A19", "x", "Bank Renamed"]:
+            result = cache.suggest(prefix)
+            assert result == expected(prefix.lower()), prefix
+            assert len({c.symbol for c in result}) == len(result)
+        assert cache.suggest("a", limit=50) == expected("a", 50)
+        assert cache.suggest("alp")[0].symbol == "NEW"
+        print(f"✓ Suggerimenti coerenti con il riferimento: {[c.symbol for c in cache.suggest('ba', 3)]}")
+        
+        # Aggiornamenti ripetuti delle aziende in classifica (nuova market cap)
+        for _ in range(300):
+            leader = random.choice(cache.suggest(random.choice(["a", "b"]), limit=20))
+            company = CachedCompany(symbol=leader.symbol, name=leader.name, exchange="NYSE",
+                                    market_cap=random.choice([None, random.uniform(1e6, 1e13)]))
+            cache.add_company(company)
+            companies[company.symbol] = company
+        for prefix in ["a", "al", "alp", "b", "ban", "a1", "bank 1"]:
+            assert cache.suggest(prefix) == expected(prefix), prefix
+    
+    # Aggiornare un'azienda in cima a un prefisso molto ampio non rilegge l'intervallo
+    from modules.company_index import PrefixIndex
+    index = PrefixIndex()
+    index.rebuild(CachedCompany(symbol=f"X{i}", name=f"Acme {i}", exchange="NYSE", market_cap=float(i))
+                  for i in range(100000))
+    start = time.perf_counter()
+    for i in range(2000):
+        top = index.suggest("a", limit=1)[0]
+        index.add(CachedCompany(symbol=top.symbol, name=top.name, exchange="NYSE",
+                                market_cap=top.market_cap - 1e6))
+    elapsed = (time.perf_counter() - start) / 2000
+    assert index.suggest("a", limit=1)[0].symbol == "X97999"
+    assert [c.symbol for c in index.suggest("acme", limit=3)] == ["X97999", "X97998", "X97997"]
+    print(f"✓ Aggiornamento di un'azienda in classifica su 100000: {elapsed * 1e6:.0f}µs")
+    assert elapsed < 0.002
+
+    # Prefisso lungo con un intervallo ampio: ordinato alla prima ricerca, poi O(k)
+    index.suggest("acme 1", limit=1)
+    start = time.perf_counter()
+    for i in range(2000):
+        top = index.suggest("acme 1", limit=1)[0]
+        index.add(CachedCompany(symbol=top.symbol, name=top.name, exchange="NYSE",
+                                market_cap=top.market_cap - 1e6))
+    elapsed = (time.perf_counter() - start) / 2000
+    matches = sorted((c for c in (index._companies[s] for s in index._keys) if c.name.lower().startswith("acme 1")),
+                     key=lambda c: (-c.market_cap, c.name.lower(), c.symbol))
+    assert index.suggest("acme 1", limit=5) == matches[:5]
+    print(f"✓ Prefisso lungo su {len(matches)} aziende: {elapsed * 1e6:.0f}µs per ricerca e aggiornamento")
+    assert elapsed < 0.002
+
+def test_fuzzy_search():
+    """La ricerca fuzzy tollera errori di battitura e scarta le corrispondenze deboli"""
+    print("\n🔤 Test Ricerca Fuzzy")
+    print("=" * 50)
+    
+    from modules.fortune500_cache import FUZZY_MATCH_THRESHOLD
+    cache = initialize_fortune500_cache()
+    
+    for query, symbol in [("Microsft", "MSFT"), ("Jonson & Jonson", "JNJ"), ("procter and gamble", "PG"),
+                          ("International Business Machine", "IBM"), ("nvidia", "NVDA"), ("msft", "MSFT")]:
+        company, score = cache.match_company(query)
+        print(f"✓ {query} -> {company.symbol} ({score})")
+        assert company.symbol == symbol and score >= FUZZY_MATCH_THRESHOLD
+    
+    # Query troppo corte o sconosciute: nessuna corrispondenza affidabile (si passa all'API)
+    for query in ["a", "Azienda Inesistente", "Google"]:
+        assert cache.match_company(query) is None, query
+    
+    results = cache.fuzzy_search("Intel", limit=5)
+    scores = [score for _, score in results]
+    assert results[0][0].symbol == "INTC"
+    assert scores == sorted(scores, reverse=True)
+    assert len({company.symbol for company, _ in results}) == len(results)
+    print(f"✓ Candidati per 'Intel': {[(c.symbol, s) for c, s in results]}")
+
+def test_journal_and_compaction():
+    """Le aggiunte vanno nel journal; la compattazione produce uno snapshot atomico"""
+    print("\n📝 Test Journal e Compattazione")
+    print("=" * 50)
+    
+    from modules import fortune500_cache
+    from modules.fortune500_cache import CachedCompany
+    
+    with tempfile.TemporaryDirectory() as directory:
+        cache_file = os.path.join(directory, "cache.json")
+        cache = Fortune500Cache(cache_file=cache_file)
+        for i in range(3):
+            cache.add_company(CachedCompany(symbol=f"J{i}", name=f"Journal {i} Inc.", exchange="NYSE"))
+        cache.save_cache()
+        
+        # Solo il journal è stato scritto, una riga per azienda
+        assert not os.path.exists(cache_file)
+        with open(cache.journal_file, encoding="utf-8") as f:
+            assert len(f.readlines()) == 3
+        
+        # Crash simulato a metà di un'aggiunta: riga finale troncata
+        with open(cache.journal_file, "a", encoding="utf-8") as f:
+            f.write('{"symbol": "BROKEN", "na')
+        reloaded = Fortune500Cache(cache_file=cache_file)
+        assert reloaded.get_company_by_symbol("J2").name == "Journal 2 Inc."
+        assert reloaded.get_company_by_symbol("BROKEN") is None
+        reloaded.add_company(CachedCompany(symbol="J3", name="Journal 3 Inc.", exchange="NYSE"))
+        reloaded.save_cache()
+        assert Fortune500Cache(cache_file=cache_file).get_company_by_symbol("J3") is not None
+        print("✓ Journal riapplicato, riga troncata scartata")
+        
+        # Compattazione: snapshot completo, journal svuotato
+        reloaded.compact()
+        assert os.path.exists(reloaded.snapshot_file) and not os.path.exists(reloaded.journal_file)
+        assert not [name for name in os.listdir(directory) if name.startswith(".tmp-")]
+        compacted = Fortune500Cache(cache_file=cache_file)
+        assert compacted.cache == reloaded.cache
+        print(f"✓ Snapshot compattato: {len(compacted.cache)} voci")
+        
+        # Oltre la soglia la compattazione parte in background
+        threshold = fortune500_cache.JOURNAL_COMPACT_THRESHOLD
+        fortune500_cache.JOURNAL_COMPACT_THRESHOLD = 2
+        try:
+            for i in range(4, 6):
+                compacted.add_company(CachedCompany(symbol=f"J{i}", name=f"Journal {i} Inc.", exchange="NYSE"))
+                compacted.save_cache()
+            compacted._compaction.join(timeout=5)
+        finally:
+            fortune500_cache.JOURNAL_COMPACT_THRESHOLD = threshold
+        assert not os.path.exists(compacted.journal_file)
+        assert Fortune500Cache(cache_file=cache_file).get_company_by_symbol("J5") is not None
+        print("✓ Compattazione in background completata")
+
+def test_binary_snapshot_and_migration():
+    """Lo snapshot binario conserva i dati; import/export JSON per la migrazione"""
+    print("\n💾 Test Snapshot Binario")
+    print("=" * 50)
+    
+    from modules.fortune500_cache import CachedCompany
+    from modules.company_snapshot import CompanySnapshot
+    
+    with tempfile.TemporaryDirectory() as directory:
+        # File JSON legacy: viene migrato automaticamente allo snapshot binario
+        legacy = Fortune500Cache(cache_file=os.path.join(directory, "legacy.json"))
+        legacy.add_company(CachedCompany(symbol="AAPL", name="Apple Inc.", exchange="NASDAQ",
+                                         market_cap=3.4e12, sector="Technology", industry="Consumer Electronics",
+                                         last_updated="2025-01-02T03:04:05.123456"))
+        legacy.add_company(CachedCompany(symbol="NSTL", name="Nestlé S.A.", exchange="OTC"))
+        legacy.export_json()
+        json_size = os.path.getsize(legacy.cache_file)
+        
+        migrated = Fortune500Cache(cache_file=legacy.cache_file)
+        assert os.path.exists(migrated.snapshot_file)
+        assert migrated.cache == legacy.cache
+        assert migrated.get_company_by_symbol("AAPL").last_updated == "2025-01-02T03:04:05.123456"
+        assert migrated.search_company("nestlé").symbol == "NSTL"
+        
+        # In memoria: una voce per ticker, record senza __dict__, data come intero
+        apple = migrated.get_company_by_symbol("AAPL")
+        assert list(migrated.cache) == ["AAPL", "NSTL"]
+        assert not hasattr(apple, "__dict__") and isinstance(apple.updated_at, int)
+        
+        # Un solo record per azienda, stringhe ripetute internate
+        with CompanySnapshot(migrated.snapshot_file) as snapshot:
+            assert len(snapshot) == 2
+            assert snapshot.row(1)["market_cap"] is None
+        print(f"✓ JSON {json_size} byte -> snapshot {os.path.getsize(migrated.snapshot_file)} byte")
+        
+        # Snapshot grande: il caricamento non decodifica le aziende, lette su richiesta
+        from modules.company_snapshot import write_snapshot
+        large_file = os.path.join(directory, "large.json")
+        write_snapshot(os.path.splitext(large_file)[0] + ".bin",
+                       (CachedCompany(symbol=f"L{i}", name=f"Large {i} Corp", exchange="NYSE" if i % 2 else "NASDAQ",
+                                      market_cap=float(i), sector="Energy", updated_at=i)
+                        for i in range(100000)))
+        start = time.perf_counter()
+        large = Fortune500Cache(cache_file=large_file)
+        elapsed = time.perf_counter() - start
+        assert len(large.cache) == 100000 and not large.cache._overlay
+        assert large.get_company_by_symbol("l4242").name == "Large 4242 Corp"
+        assert large.get_company_by_symbol("L100000") is None
+        # Il journal è un overlay: una sostituzione mantiene la posizione
+        large.add_company(CachedCompany(symbol="L7", name="Renamed Seven", exchange="NYSE", sector="Utilities"))
+        large.add_company(CachedCompany(symbol="NEWCO", name="New Co", exchange="NYSE"))
+        assert len(large.cache) == 100001 and list(large.cache)[7] == "L7" and list(large.cache)[-1] == "NEWCO"
+        stats = large.get_cache_stats()
+        assert stats["exchanges"] == {"NYSE": 50001, "NASDAQ": 50000}
+        assert stats["sectors"] == {"Energy": 99999, "Utilities": 1}
+        assert large.suggest("renamed")[0].symbol == "L7"
+        print(f"✓ Snapshot di 100000 aziende aperto in {elapsed * 1000:.1f} ms")
+        assert elapsed < 0.5
+        
+        # Export e import nei due sensi
+        exported = os.path.join(directory, "exported.json")
+        migrated.export_json(exported)
+        target = Fortune500Cache(cache_file=os.path.join(directory, "target.json"))
+        assert target.import_json(exported) == 2
+        assert Fortune500Cache(cache_file=target.cache_file).cache == migrated.cache
+        print("✓ Import/export JSON coerenti con lo snapshot")
+        
+        # Snapshot danneggiato: si riparte dal JSON legacy, o da una cache vuota
+        with open(migrated.snapshot_file, "r+b") as f:
+            f.write(b"garbage!")
+        assert Fortune500Cache(cache_file=legacy.cache_file).cache == legacy.cache
+        with open(migrated.snapshot_file, "r+b") as f:
+            f.write(b"garbage!")
+        os.remove(legacy.cache_file)
+        assert Fortune500Cache(cache_file=legacy.cache_file).cache == {}
+
+def test_universe_preload():
+    """Precaricamento in blocco di una lista simboli e aggiornamento incrementale"""
+    print("\n🌐 Test Precaricamento Universo")
+    print("=" * 50)
+    
+    import csv
+    from modules.company_snapshot import file_id
+    from modules.universe_loader import iter_universe_file, preload_universe
+    random.seed(3)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        rows = [{"symbol": f"U{i}", "name": f"Universe {i} {random.choice(['Inc.', 'Corp', 'plc'])}",
+                 "exchangeShortName": random.choice(["NYSE", "NASDAQ"]),
+                 "marketCap": str(random.randint(10**6, 10**12))} for i in range(30000)]
+        rows.append({"symbol": "", "name": "Senza ticker"})
+        universe_file = os.path.join(directory, "universe.csv")
+        with open(universe_file, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["symbol", "name", "exchangeShortName", "marketCap"])
+            writer.writeheader()
+            writer.writerows(rows)
+        
+        cache = Fortune500Cache(cache_file=os.path.join(directory, "cache.json"))
+        start = time.perf_counter()
+        counts = preload_universe(cache, iter_universe_file(universe_file))
+        elapsed = time.perf_counter() - start
+        assert counts == {"rows": 30001, "added": 30000, "updated": 0, "unchanged": 0, "skipped": 1}
+        assert cache.search_company("Universe 12345").symbol == "U12345"
+        top = max(rows[:-1], key=lambda row: int(row["marketCap"]))
+        assert cache.suggest("u", limit=1)[0].symbol == top["symbol"]
+        print(f"✓ {counts['added']} aziende precaricate e indicizzate in {elapsed:.2f}s")
+        # Oltre la soglia del journal lo snapshot è scritto dalla compattazione in background
+        cache.wait_for_compaction(timeout=30)
+        assert os.path.exists(cache.snapshot_file) and not os.path.exists(cache.journal_file)
+        snapshot_id = file_id(cache.snapshot_file)
+        
+        # Aggiornamento: lista JSON con un nome cambiato e due nuovi ticker, senza market cap
+        changed = [dict(row, marketCap=None) for row in rows[:-1]]
+        changed[7]["name"] = "Universe Seven Holdings"
+        changed += [{"symbol": "NEW1", "companyName": "Brand New Inc."}, {"symbol": "NEW2", "name": "Other New Co"}]
+        json_file = os.path.join(directory, "universe.json")
+        with open(json_file, "w", encoding="utf-8") as f:
+            json.dump(changed, f)
+        counts = preload_universe(cache, iter_universe_file(json_file))
+        assert counts["added"] == 2 and counts["updated"] == 1 and counts["unchanged"] == 29999
+        # Solo le differenze nel journal, snapshot non riscritto
+        assert file_id(cache.snapshot_file) == snapshot_id
+        with open(cache.journal_file, encoding="utf-8") as f:
+            assert len(f.readlines()) == 3
+        # Pochi cambiamenti: indici aggiornati in place, market cap esistente conservata
+        assert cache._indexed
+        assert cache.search_company("seven holdings").symbol == "U7"
+        assert cache.get_company_by_symbol("U7").market_cap == float(rows[7]["marketCap"])
+        assert Fortune500Cache(cache_file=cache.cache_file).cache == cache.cache
+        print(f"✓ Aggiornamento incrementale: {counts}")
+
+def _worker_add_companies(cache_file, worker, count):
+    """Processo worker: aggiunge aziende e salva (compattazioni frequenti)"""
+    from modules import fortune500_cache
+    from modules.fortune500_cache import CachedCompany
+    fortune500_cache.JOURNAL_COMPACT_THRESHOLD = 7
+    cache = Fortune500Cache(cache_file=cache_file)
+    for i in range(count):
+        cache.add_company(CachedCompany(symbol=f"W{worker}X{i}", name=f"Worker {worker} Company {i}",
+                                        exchange="NYSE"))
+        cache.save_cache()
+        # Legge anche le aziende degli altri worker mentre scrivono
+        cache.search_company(f"Worker {(worker + 1) % 3} Company")
+    cache.compact()
+
+def test_multi_process_cache():
+    """Aziende aggiunte da più processi e thread sono visibili a tutti senza riavvio"""
+    print("\n🔀 Test Cache Multi-Processo")
+    print("=" * 50)
+    
+    import multiprocessing
+    import threading
+    from modules.fortune500_cache import CachedCompany
+    
+    with tempfile.TemporaryDirectory() as directory:
+        cache_file = os.path.join(directory, "cache.json")
+        observer = Fortune500Cache(cache_file=cache_file)
+        assert observer.search_company("Worker 0 Company 1") is None
+        
+        context = multiprocessing.get_context("spawn")
+        workers = [context.Process(target=_worker_add_companies, args=(cache_file, worker, 20))
+                   for worker in range(3)]
+        for process in workers:
+            process.start()
+        
+        # Nel frattempo, thread dello stesso processo aggiungono e cercano
+        def local_writer(offset):
+            for i in range(50):
+                observer.add_company(CachedCompany(symbol=f"T{offset + i}", name=f"Thread Company {offset + i}",
+                                                   exchange="NASDAQ"))
+                observer.search_company(f"Thread Company {i}")
+                observer.suggest("thr")
+        threads = [threading.Thread(target=local_writer, args=(offset,)) for offset in (0, 50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for process in workers:
+            process.join(timeout=60)
+            assert process.exitcode == 0
+        
+        # L'istanza già aperta vede le aziende degli altri processi
+        assert observer.search_company("Worker 2 Company 19").symbol == "W2X19"
+        observer.save_cache()
+        stats = observer.get_cache_stats()
+        assert stats["total_companies"] == 160
+        assert stats["exchanges"] == {"NYSE": 60, "NASDAQ": 100}
+        
+        # Un nuovo processo ritrova tutto dai file
+        reopened = Fortune500Cache(cache_file=cache_file)
+        assert reopened.cache == observer.cache
+        print(f"✓ {stats['total_companies']} aziende da 3 processi e 2 thread, visibili a tutti")
+        
+        # Lock tra processi tenuto a lungo (es. compattazione di un altro worker):
+        # le statistiche senza attesa non si bloccano, l'allineamento avviene dopo
+        from modules.company_snapshot import FileLock
+        reopened.add_company(CachedCompany(symbol="LATE", name="Late Company", exchange="AMEX"))
+        reopened.save_cache()
+        with FileLock(f"{cache_file}.lock"):
+            start = time.perf_counter()
+            assert observer.get_cache_stats(wait=False)["total_companies"] == 160
+            assert time.perf_counter() - start < 0.5
+        observer._refreshing.join(timeout=5)
+        assert observer.get_cache_stats(wait=False)["exchanges"]["AMEX"] == 1
+        print("✓ Statistiche senza attesa del lock tra processi")
+
 def main():
     """Funzione principale di test"""
     print("🚀 Test Sistema Cache Fortune 500")
@@ -101,6 +541,27 @@ def main():
     # Test 2: Gestione cache
     test_cache_management()
     
+    # Test 3: Ricerca indicizzata
+    test_indexed_search()
+    
+    # Test 4: Suggerimenti per prefisso
+    test_prefix_suggestions()
+    
+    # Test 5: Ricerca fuzzy
+    test_fuzzy_search()
+    
+    # Test 6: Journal e compattazione
+    test_journal_and_compaction()
+    
+    # Test 7: Snapshot binario e migrazione JSON
+    test_binary_snapshot_and_migration()
+    
+    # Test 8: Cache condivisa tra processi e thread
+    test_multi_process_cache()
+    
+    # Test 9: Precaricamento dell'universo dei simboli
+    test_universe_preload()
+    
     print(f"\n🎉 Test completati!")
     print(f"\n💡 Per testare il sistema completo con API, imposta FMP_API_KEY")
     print(f"   export FMP_API_KEY='your_api_key_here'")
@@ -0,0 +1,1038 @@
+#!/usr/bin/env python3
+"""
+Test del trasporto HTTP condiviso verso Financial Modeling Prep
+Usa httpx.MockTransport, quindi non richiede API key né rete
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+import threading
+import time
+import types
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from modules.http_client import FMPTransport, TransportSettings
+from modules.response_cache import FRESH, STALE, ResponseCache
+from modules.disk_cache import DiskCache
+from modules.fetch_plan import FetchPlan, RATIOS, INCOME_STATEMENT, BALANCE_SHEET
+from modules.financial_ratios import FinancialRatios
+from modules.concurrency import (TokenBucket, bounded_as_completed, deadline_scope, gather_with_deadline,
+                                 remaining_time)
+from modules.sector_analysis import BENCHMARK_TTL, SectorAnalyzer
+from modules.benchmark_scheduler import BenchmarkScheduler
+from modules.company_snapshot import file_id
+from modules.fundamentals_store import SERIES_CACHE_SIZE, FundamentalsStore
+
+import numpy as np
+
+
+def make_handler(calls):
+    """Handler fittizio che risponde con payload FMP minimali"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        endpoint = request.url.path.rsplit("/", 1)[-1]
+        symbol = request.url.params.get("symbol")
+        if endpoint == "ratios":
+            return httpx.Response(200, json=[{"symbol": symbol, "priceToBookRatio": 40.0, "returnOnEquity": 1.5}])
+        if endpoint == "profile":
+            return httpx.Response(200, json=[{"symbol": symbol, "price": 200.0, "pe": 30.0}])
+        if endpoint in ("income-statement", "balance-sheet-statement"):
+            return httpx.Response(200, json=[{"symbol": symbol, "netIncome": 100, "totalStockholdersEquity": 50}])
+        return httpx.Response(404, json={"error": "not found"})
+    return handler
+
+
+def test_sync_wrapper():
+    """Le API bloccanti funzionano fuori da un event loop"""
+    calls = []
+    transport = FMPTransport(http_transport=httpx.MockTransport(make_handler(calls)))
+
+    response = transport.request_sync("ratios", {"symbol": "AAPL", "apikey": "test"})
+    assert response.status_code == 200
+    assert response.data[0]["symbol"] == "AAPL"
+    assert calls[0].url.params["apikey"] == "test"
+
+    ratios = FinancialRatios("AAPL", api_key="test", transport=transport)
+    result = ratios.get_all_ratios()
+    print(f"✓ Ratios sincroni: {result}")
+    assert result == {"ticker": "AAPL", "pe_ratio": 30.0, "pb_ratio": 40.0, "roe_percent": 150.0}
+
+    asyncio.run(transport.aclose())
+
+
+def test_async_from_foreign_loop():
+    """Le coroutine possono essere attese da un altro event loop"""
+    calls = []
+    transport = FMPTransport(http_transport=httpx.MockTransport(make_handler(calls)))
+
+    async def scenario():
+        responses = await asyncio.gather(*(
+            transport.request("profile", {"symbol": symbol}) for symbol in ["AAPL", "MSFT", "NVDA"]
+        ))
+        await transport.aclose()
+        return responses
+
+    responses = asyncio.run(scenario())
+    assert [r.data[0]["symbol"] for r in responses] == ["AAPL", "MSFT", "NVDA"]
+    assert all(r.ok for r in responses)
+    print(f"✓ {len(responses)} richieste concorrenti completate")
+
+
+def test_per_host_limit():
+    """Il numero di richieste in volo per host non supera il limite"""
+    state = {"in_flight": 0, "peak": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        await asyncio.sleep(0.01)
+        state["in_flight"] -= 1
+        return httpx.Response(200, json=[])
+
+    settings = TransportSettings(max_connections_per_host=2)
+    transport = FMPTransport(settings=settings, http_transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        await asyncio.gather(*(transport.request("ratios", {"symbol": str(i)}) for i in range(10)))
+        await transport.aclose()
+
+    asyncio.run(scenario())
+    print(f"✓ Picco richieste per host: {state['peak']}")
+    assert state["peak"] <= 2
+
+
+def test_single_flight():
+    """Richieste concorrenti identiche producono una sola chiamata upstream"""
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, json=[{"symbol": request.url.params["symbol"]}])
+
+    transport = FMPTransport(http_transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        same = [transport.request("ratios", {"symbol": "aapl", "period": "annual", "apikey": f"k{i}"})
+                for i in range(20)]
+        other = transport.request("ratios", {"symbol": "MSFT", "period": "annual"})
+        responses = await asyncio.gather(*same, other)
+        await transport.aclose()
+        return responses
+
+    responses = asyncio.run(scenario())
+    stats = transport.get_stats()["singleflight"]
+    print(f"✓ Single-flight: {stats}")
+    assert len(calls) == 2
+    assert all(r is responses[0] for r in responses[:20])
+    assert stats["executions"] == 2
+    assert stats["coalesced"] == 19
+
+
+def test_response_cache_ttl_and_lru():
+    """TTL per endpoint, finestra stale ed eviction LRU per voci e byte"""
+    now = [1000.0]
+    cache = ResponseCache(max_entries=3, max_bytes=100, ttls={"ratios": 10, "income-statement": 100},
+                          clock=lambda: now[0])
+
+    cache.set("r", "ratios", 10, "ratios")
+    cache.set("i", "income", 10, "income-statement")
+    assert cache.get("r")[1] == FRESH
+
+    now[0] += 15
+    assert cache.get("r")[1] == STALE
+    assert cache.get("i")[1] == FRESH
+    now[0] += 10
+    assert cache.get("r") == (None, None)
+
+    # LRU per numero di voci: "i" è la più usata di recente e sopravvive
+    cache.set("a", 1, 10, "ratios")
+    cache.set("b", 2, 10, "ratios")
+    cache.get("i")
+    cache.set("c", 3, 10, "ratios")
+    assert cache.get("a") == (None, None)
+    assert cache.get("i")[0] is not None
+
+    # LRU per byte
+    cache.set("big", 4, 80, "ratios")
+    assert cache.total_bytes <= 100
+    assert cache.get("big")[0] is not None
+    print(f"✓ Response cache: {cache.get_stats()}")
+
+
+def test_transport_cache():
+    """Le richieste ripetute sono servite dalla cache; le stale vengono rivalidate"""
+    calls = []
+    now = [1000.0]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(200, json=[{"symbol": "AAPL", "version": len(calls)}])
+
+    cache = ResponseCache(ttls={"ratios": 60}, clock=lambda: now[0])
+    transport = FMPTransport(http_transport=httpx.MockTransport(handler), cache=cache)
+
+    async def scenario():
+        first = await transport.request("ratios", {"symbol": "AAPL"})
+        second = await transport.request("ratios", {"symbol": "aapl", "apikey": "other"})
+        assert first is second and len(calls) == 1
+
+        now[0] += 90
+        stale = await transport.request("ratios", {"symbol": "AAPL"})
+        assert stale.data[0]["version"] == 1
+        await asyncio.sleep(0.05)
+        refreshed = await transport.request("ratios", {"symbol": "AAPL"})
+        assert refreshed.data[0]["version"] == 2 and len(calls) == 2
+
+        # Statistiche lette sul loop del trasporto, fuori dal loop chiamante
+        stats = await transport.get_stats_async()
+        assert stats["cache"]["hits"] >= 1 and stats["disk_cache"] is None
+        await transport.aclose()
+
+    asyncio.run(scenario())
+    print(f"✓ Cache trasporto: {transport.get_stats()['cache']}")
+
+
+def test_disk_cache_survives_restart():
+    """Una risposta salvata su disco è riutilizzata da un nuovo processo/worker"""
+    calls = []
+    handler = make_handler(calls)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "fmp_cache.sqlite3")
+
+        first = FMPTransport(http_transport=httpx.MockTransport(handler), disk_cache=DiskCache(path))
+        response = first.request_sync("ratios", {"symbol": "AAPL", "apikey": "secret"})
+        asyncio.run(first.aclose())
+        assert response.ok and len(calls) == 1
+
+        # Nuovo trasporto (es. dopo un deploy): memoria vuota, stesso file
+        second = FMPTransport(http_transport=httpx.MockTransport(handler), disk_cache=DiskCache(path))
+        restored = second.request_sync("ratios", {"symbol": "AAPL", "apikey": "secret"})
+        stats = second.get_stats()
+        asyncio.run(second.aclose())
+
+        assert len(calls) == 1
+        assert restored.data == response.data
+        print(f"✓ Cache su disco: {stats['disk_cache']['entries']} voci, {stats['disk_cache']['bytes']} byte")
+
+        # Eviction per dimensione
+        small = DiskCache(os.path.join(directory, "small.sqlite3"), max_bytes=2000)
+        for i in range(100):
+            small.set("fmp", str(i), [{"symbol": f"S{i}", "value": i * 1.5}] * 10, ttl=60)
+        assert small.total_bytes() <= 2000
+        assert small.get("fmp", "99") is not None
+
+
+def test_fetch_plan_shared():
+    """Un piano condiviso scarica ogni risorsa una sola volta per tutti i consumatori"""
+    calls = []
+    transport = FMPTransport(http_transport=httpx.MockTransport(make_handler(calls)), use_cache=False)
+
+    plan = FetchPlan("aapl", api_key="test", transport=transport)
+    plan.require(RATIOS, INCOME_STATEMENT, BALANCE_SHEET).fetch_sync()
+    assert len(calls) == 3
+    assert plan.latest(BALANCE_SHEET)["totalStockholdersEquity"] == 50
+
+    # FinancialRatios riusa il piano e scarica solo il profilo mancante
+    ratios = FinancialRatios("AAPL", api_key="test", transport=transport, plan=plan)
+    assert ratios.get_roe() == 150.0
+    endpoints = sorted(c.url.path.rsplit("/", 1)[-1] for c in calls)
+    assert endpoints == ["balance-sheet-statement", "income-statement", "profile", "ratios"]
+    print(f"✓ Fetch plan condiviso: {len(calls)} chiamate")
+    asyncio.run(transport.aclose())
+
+
+def test_bounded_as_completed():
+    """I risultati escono in ordine di completamento; chiudere lo stream cancella i worker"""
+    state = {"running": 0, "peak": 0, "cancelled": 0}
+
+    async def work(delay):
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        try:
+            await asyncio.sleep(delay)
+            return delay
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+        finally:
+            state["running"] -= 1
+
+    async def scenario():
+        # Il primo risultato arriva dopo l'elemento più veloce, non dopo l'intero batch
+        results = bounded_as_completed([0.2, 0.01, 0.2, 0.2], work, concurrency=2)
+        first = await results.__anext__()
+        assert first == 0.01
+        # Il consumatore abbandona lo stream (es. client disconnesso)
+        await results.aclose()
+        assert state["running"] == 0
+
+    asyncio.run(scenario())
+    print(f"✓ Stream limitato: picco {state['peak']}, cancellati {state['cancelled']}")
+    assert state["peak"] <= 2
+    assert state["cancelled"] >= 1
+
+
+def quota_handler(window, quota, latency, state):
+    """Handler che risponde 429 oltre `quota` richieste in `window` secondi (finestra mobile)"""
+    async def handler(request: httpx.Request) -> httpx.Response:
+        now = time.monotonic()
+        state["times"] = [t for t in state["times"] if now - t < window] + [now]
+        if len(state["times"]) > quota:
+            state["rejected"] += 1
+            return httpx.Response(429, headers={"Retry-After": "0.05"}, json={"error": "limit"})
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        await asyncio.sleep(latency)
+        state["in_flight"] -= 1
+        endpoint = request.url.path.rsplit("/", 1)[-1]
+        if endpoint == "stock-screener":
+            return httpx.Response(200, json=[{"symbol": f"S{i}", "companyName": f"Company {i}",
+                                              "marketCap": 1e9 * (i + 1)} for i in range(12)])
+        return make_handler([])(request)
+    return handler
+
+
+def test_token_bucket():
+    """Raffica iniziale, poi una richiesta ogni 1/rate secondi; quota mai superata"""
+    assert TokenBucket.per_minute(300, 50).rate == 250 / 60
+    # Quota minima: un token in raffica e uno ricaricato nel minuto
+    assert TokenBucket.per_minute(2, 50).rate == 1 / 60
+    for quota in (1, -5):
+        try:
+            TokenBucket.per_minute(quota, 50)
+            assert False, quota
+        except ValueError as e:
+            assert "FMP_RATE_LIMIT_PER_MINUTE" in str(e)
+
+    async def scenario():
+        bucket = TokenBucket(rate=100, capacity=5)
+        start = time.monotonic()
+        waits = await asyncio.gather(*(bucket.acquire() for _ in range(25)))
+        return time.monotonic() - start, waits, bucket.get_stats()
+
+    elapsed, waits, stats = asyncio.run(scenario())
+    assert waits[:5] == [0.0] * 5 and all(w > 0 for w in waits[5:])
+    assert 0.18 <= elapsed < 0.5
+    assert stats["delayed"] == 20
+    print(f"✓ Token bucket: 25 richieste in {elapsed:.2f}s ({stats})")
+
+    # Un 429 inatteso mette in pausa il bucket e la richiesta viene ritentata una volta
+    state = {"times": [], "rejected": 0, "in_flight": 0, "peak": 0}
+    transport = FMPTransport(http_transport=httpx.MockTransport(quota_handler(10, 1, 0, state)), use_cache=False)
+    assert transport.request_sync("ratios", {"symbol": "AAPL"}).ok
+    second = transport.request_sync("ratios", {"symbol": "MSFT"})
+    assert second.status_code == 429 and state["rejected"] == 2
+    asyncio.run(transport.aclose())
+    print("✓ HTTP 429: pausa e un solo nuovo tentativo")
+
+
+def test_sector_benchmark_concurrent():
+    """Il benchmark di settore scarica le aziende in parallelo senza superare la quota"""
+    state = {"times": [], "rejected": 0, "in_flight": 0, "peak": 0}
+    transport = FMPTransport(http_transport=httpx.MockTransport(quota_handler(0.5, 60, 0.05, state)),
+                             use_cache=False)
+    # Quota di prova: 60 richieste ogni 0.5 secondi -> raffica 30, ricarica 60/s
+    transport.rate_limiter = TokenBucket(rate=60, capacity=30)
+    client = types.SimpleNamespace(api_key="test", transport=transport)
+    analyzer = SectorAnalyzer(client)
+
+    async def scenario():
+        start = time.monotonic()
+        result = await analyzer.calculate_sector_benchmark("Technology")
+        elapsed = time.monotonic() - start
+        await transport.aclose()
+        return result, elapsed
+
+    result, elapsed = asyncio.run(scenario())
+    print(f"✓ Benchmark a freddo in {elapsed:.2f}s, picco {state['peak']} richieste in volo")
+    assert result["companies_used"] == [f"S{i}" for i in range(11, 1, -1)]
+    assert result["benchmark"]["PB"] == 40.0
+    assert state["rejected"] == 0
+    assert state["peak"] > 4
+    # In serie: 10 aziende x (4 chiamate + pausa) supererebbero 1.5 secondi
+    assert elapsed < 0.8
+
+
+def test_sector_benchmark_stale_while_revalidate():
+    """Il benchmark scaduto è servito subito e ricalcolato una sola volta in background"""
+    state = {"times": [], "rejected": 0, "in_flight": 0, "peak": 0}
+    screener_calls = []
+    base_handler = quota_handler(1, 1000, 0.02, state)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("stock-screener"):
+            screener_calls.append(request)
+        return await base_handler(request)
+
+    with tempfile.TemporaryDirectory() as directory:
+        disk_cache = DiskCache(os.path.join(directory, "fmp_cache.sqlite3"))
+        transport = FMPTransport(http_transport=httpx.MockTransport(handler), use_cache=False)
+        client = types.SimpleNamespace(api_key="test", transport=transport)
+        # Cache delle risposte disattivata: su disco restano solo i benchmark
+        analyzer = SectorAnalyzer(client)
+        analyzer.disk_cache = disk_cache
+        now = [time.time()]
+        analyzer._clock = lambda: now[0]
+
+        async def scenario():
+            # A freddo: richieste concorrenti coalescenti in un solo calcolo
+            cold = await asyncio.gather(*(analyzer.get_benchmark("Technology") for _ in range(5)))
+            assert len(screener_calls) == 1
+            assert not any(result["stale"] for result in cold)
+
+            # Oltre la validità: risposta immediata con il valore precedente
+            now[0] += BENCHMARK_TTL + 1
+            start = time.monotonic()
+            stale = await asyncio.gather(*(analyzer.get_benchmark("Technology") for _ in range(5)))
+            elapsed = time.monotonic() - start
+            assert all(result["stale"] for result in stale)
+            assert stale[0]["benchmark"] == cold[0]["benchmark"]
+            assert list(analyzer.get_cache_status()["refreshing"]) == ["sector_Technology"]
+            await asyncio.gather(*analyzer._background.values())
+            assert len(screener_calls) == 2
+
+            fresh = await analyzer.get_benchmark("Technology")
+            assert not fresh["stale"] and len(screener_calls) == 2
+
+            # Nuovo worker: il benchmark è letto dal disco senza ricalcolo
+            restarted = SectorAnalyzer(client)
+            restarted.disk_cache = disk_cache
+            restored = await restarted.get_benchmark("Technology")
+            assert restored["benchmark"] == fresh["benchmark"] and len(screener_calls) == 2
+            await transport.aclose()
+            return elapsed
+
+        elapsed = asyncio.run(scenario())
+        print(f"✓ Benchmark scaduto servito in {elapsed * 1000:.1f}ms, ricalcoli: {len(screener_calls)}")
+        assert elapsed < 0.05
+
+
+def test_benchmark_scheduler():
+    """Lo scheduler precalcola i settori distanziandoli e anticipa quelli richiesti"""
+    state = {"times": [], "rejected": 0, "in_flight": 0, "peak": 0}
+    base_handler = quota_handler(1, 1000, 0.01, state)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.params.get("sector") == "Empty":
+            return httpx.Response(200, json=[])
+        return await base_handler(request)
+
+    transport = FMPTransport(http_transport=httpx.MockTransport(handler), use_cache=False)
+    transport.rate_limiter = TokenBucket(rate=1000, capacity=1000)
+    analyzer = SectorAnalyzer(types.SimpleNamespace(api_key="test", transport=transport))
+    sectors = ["Technology", "Energy", "Empty"]
+    scheduler = BenchmarkScheduler(analyzer, lambda: sectors, interval=30, stagger=0.1)
+
+    async def scenario():
+        scheduler.start()
+        while scheduler.last_run is None:
+            await asyncio.sleep(0.01)
+        status = scheduler.get_status()
+        assert status["running"] and status["next_run"] is not None
+        assert status["last_run"]["computed"] == 2 and status["last_run"]["failed"] == 1
+        assert scheduler.has_no_companies("Empty")
+
+        # Lettura dei soli valori precalcolati
+        benchmark = await analyzer.get_benchmark("Technology", refresh=False)
+        assert benchmark["benchmark"]["PB"] == 40.0
+        try:
+            await analyzer.get_benchmark("Utilities", refresh=False)
+            assert False, "benchmark non calcolato"
+        except LookupError:
+            pass
+
+        # Settore sconosciuto rifiutato, settore noto anticipato senza attendere il ciclo
+        assert not scheduler.request("Utilities")
+        sectors.append("Utilities")
+        assert scheduler.request("Utilities")
+        while scheduler.get_status()["sector_status"].get("Utilities") is None:
+            await asyncio.sleep(0.01)
+        await analyzer.get_benchmark("Utilities", refresh=False)
+
+        await scheduler.stop()
+        await transport.aclose()
+        return status
+
+    status = asyncio.run(scenario())
+    last_runs = [datetime.fromisoformat(status["sector_status"][sector]["last_run"])
+                 for sector in sectors[:3]]
+    gaps = [(b - a).total_seconds() for a, b in zip(last_runs, last_runs[1:])]
+    print(f"✓ Ciclo scheduler: {status['last_run']}, intervalli tra settori {gaps}")
+    assert all(gap >= 0.1 for gap in gaps)
+    assert not scheduler.running
+
+
+def test_benchmark_scheduler_leader_and_backoff():
+    """Un solo scheduler attivo tra i worker; i settori senza aziende non consumano quota"""
+    from modules.company_snapshot import FileLock
+    empty_calls = []
+    base_handler = quota_handler(1, 1000, 0, {"times": [], "rejected": 0, "in_flight": 0, "peak": 0})
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.params.get("sector") == "Empty":
+            empty_calls.append(request)
+            return httpx.Response(200, json=[])
+        return await base_handler(request)
+
+    transport = FMPTransport(http_transport=httpx.MockTransport(handler), use_cache=False)
+    transport.rate_limiter = TokenBucket(rate=1000, capacity=1000)
+    analyzer = SectorAnalyzer(types.SimpleNamespace(api_key="test", transport=transport))
+
+    with tempfile.TemporaryDirectory() as directory:
+        lock_path = os.path.join(directory, "scheduler.lock")
+        # Due worker: stesso file di lock, istanze (e descrittori) distinte
+        first = BenchmarkScheduler(analyzer, lambda: ["Technology", "Empty"], interval=30, stagger=0,
+                                   lock=FileLock(lock_path), standby_retry=0.01)
+        second = BenchmarkScheduler(analyzer, lambda: ["Technology", "Empty"], interval=30, stagger=0,
+                                    lock=FileLock(lock_path), standby_retry=0.01)
+
+        async def scenario():
+            first.start()
+            while first.last_run is None:
+                await asyncio.sleep(0.01)
+            second.start()
+            await asyncio.sleep(0.05)
+            assert first.running and not second.running and second.get_status()["standby"]
+            assert len(empty_calls) == 1
+
+            # Settore vuoto: non anticipato a ogni richiesta mancata
+            assert first.request("Empty") and not first._priority
+            # Nei cicli successivi ritentato sempre più di rado
+            for _ in range(4):
+                await first._run_cycle()
+            assert len(empty_calls) == 3 and first.sector_status["Empty"]["empty_runs"] == 3
+            calls = len(empty_calls)
+
+            # Il worker attivo si ferma: l'altro subentra
+            await first.stop()
+            while not second.running:
+                await asyncio.sleep(0.01)
+            await second.stop()
+            await transport.aclose()
+            return calls
+
+        calls = asyncio.run(scenario())
+    print(f"✓ Scheduler attivo in un solo worker, settore vuoto interrogato {calls} volte in 5 cicli")
+
+
+def test_fundamentals_store():
+    """Tutti i periodi scaricati restano in un archivio locale letto con mmap"""
+    calls = []
+    years = [2024, 2023, 2022]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        endpoint = request.url.path.rsplit("/", 1)[-1]
+        quarter = request.url.params.get("period") == "quarter"
+        dates = ["2024-06-30", "2024-03-31"] if quarter else [f"{year}-09-30" for year in years]
+        if endpoint == "ratios":
+            return httpx.Response(200, json=[{"date": date, "priceToEarningsRatio": 20.0 + i, "returnOnEquity": 0.3}
+                                             for i, date in enumerate(dates)])
+        if endpoint == "income-statement":
+            return httpx.Response(200, json=[{"date": date, "netIncome": 100 - i, "eps": "n/a"}
+                                             for i, date in enumerate(dates)])
+        return httpx.Response(200, json=[{"date": date, "totalAssets": 1000, "totalStockholdersEquity": 50}
+                                         for date in dates[:2]])
+
+    transport = FMPTransport(http_transport=httpx.MockTransport(handler), use_cache=False)
+    with tempfile.TemporaryDirectory() as directory:
+        store = FundamentalsStore(directory)
+        plan = FetchPlan("aapl", api_key="test", transport=transport)
+        plan.require(RATIOS, INCOME_STATEMENT, BALANCE_SHEET).fetch_sync()
+        assert store.append_plan(plan) == 3
+        path = store._file("AAPL", "annual")
+        written = file_id(path)
+        assert store.append_plan(plan) == 0 and file_id(path) == written
+        # Stessi statement (es. dalla cache delle risposte): né lettura né lock dell'archivio
+        read, store._read = store._read, None
+        assert store.append_plan(plan) == 0
+        store._read = read
+
+        # FinancialRatios usa il periodo più recente e salva anche gli altri trimestri
+        quarterly = FetchPlan("AAPL", api_key="test", transport=transport, period="quarter")
+        ratios = FinancialRatios("AAPL", api_key="test", transport=transport, plan=quarterly, store=store)
+        assert ratios.get_pe_ratio() is None and ratios.get_roe() == 30.0
+        assert len(store.series("AAPL", "quarter")) == 2
+        fetched = len(calls)
+
+        # Un altro worker legge lo storico dal file mappato, senza chiamate
+        reader = FundamentalsStore(directory)
+        series = reader.series("aapl")
+        assert isinstance(series.data, np.memmap) and len(calls) == fetched
+        assert series.dates() == ["2022-09-30", "2023-09-30", "2024-09-30"]
+        assert series.column(RATIOS, "priceToEarningsRatio").tolist() == [22.0, 21.0, 20.0]
+        oldest = series.statements(0)
+        assert oldest[INCOME_STATEMENT] == {"date": "2022-09-30", "netIncome": 98.0}
+        assert oldest[BALANCE_SHEET] is None
+        assert series.locate("2023-12-31") == 1 and series.locate("2020-01-01") is None
+        assert reader.series("aapl") is series
+
+        # Append incrementale: un nuovo esercizio, risorse mancanti non cancellano i valori noti
+        years.insert(0, 2025)
+        update = FetchPlan("AAPL", api_key="test", transport=transport)
+        update.require(RATIOS).fetch_sync()
+        assert store.append_plan(update) == 1
+        refreshed = reader.series("AAPL")
+        assert refreshed is not series and len(refreshed) == 4
+        assert refreshed.statements(-2)[INCOME_STATEMENT]["netIncome"] == 100.0
+        assert refreshed.statements(-1)[INCOME_STATEMENT] is None
+        # Il lettore precedente continua a vedere la sua versione
+        assert len(series) == 3
+        print(f"✓ Storico fondamentali: {refreshed.dates()}, archivio {store.get_stats()}")
+        assert store.tickers() == ["AAPL"] and store.tickers("quarter") == ["AAPL"]
+        del series, refreshed, reader
+
+        # Storici mappati limitati: i descrittori aperti non crescono con i ticker letti
+        for i in range(SERIES_CACHE_SIZE * 2):
+            store.append(f"T{i}", "annual", {RATIOS: [{"date": "2024-12-31", "returnOnEquity": 0.1 * i}]})
+        descriptors = len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else None
+        for ticker in store.tickers():
+            assert store.series(ticker) is not None
+        assert len(store._series) == SERIES_CACHE_SIZE
+        if descriptors is not None:
+            assert len(os.listdir("/proc/self/fd")) - descriptors <= SERIES_CACHE_SIZE
+        print(f"✓ Storici mappati aperti: {len(store._series)} su {len(store.tickers())} ticker")
+    asyncio.run(transport.aclose())
+
+
+APP_ENV = {
+    "FMP_API_KEY": "test",
+    "FMP_DISK_CACHE_ENABLED": "false",
+    "FUNDAMENTALS_STORE_ENABLED": "false",
+    "BENCHMARK_SCHEDULER_ENABLED": "false",
+}
+
+
+def load_app(directory, handler, env=None):
+    """
+    Importa l'applicazione FastAPI con FMP simulato e file di lavoro in `directory`
+
+    Returns:
+        Modulo main (reimportato se già caricato)
+    """
+    import importlib
+    from modules import http_client
+    transport = FMPTransport(http_transport=httpx.MockTransport(handler), use_cache=False)
+    transport.rate_limiter = TokenBucket(rate=1000, capacity=1000)
+    http_client.set_transport(transport)
+    os.environ.update({**APP_ENV, **(env or {})})
+    os.chdir(directory)
+    if "main" in sys.modules:
+        return importlib.reload(sys.modules["main"])
+    return importlib.import_module("main")
+
+
+def test_analysis_non_technology_sector():
+    """Il settore viene dal profilo FMP (o dalla cache, in nomi FMP) e ha un benchmark"""
+    from fastapi import HTTPException
+    from modules import http_client
+    screened = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        endpoint = request.url.path.rsplit("/", 1)[-1]
+        symbol = request.url.params.get("symbol")
+        if endpoint == "stock-screener":
+            sector = request.url.params.get("sector")
+            screened.append(sector)
+            # Come FMP: solo i nomi del stock-screener hanno aziende
+            if sector != "Healthcare":
+                return httpx.Response(200, json=[])
+            return httpx.Response(200, json=[{"symbol": f"H{i}", "companyName": f"Health {i}",
+                                              "marketCap": 1e9 * (i + 1)} for i in range(12)])
+        if endpoint == "profile" and symbol == "JNJ":
+            return httpx.Response(200, json=[{"symbol": symbol, "companyName": "Johnson & Johnson",
+                                              "sector": "Healthcare", "price": 150.0, "pe": 20.0}])
+        return make_handler([])(request)
+
+    cwd, env = os.getcwd(), dict(os.environ)
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app = load_app(directory, handler)
+            analysis = asyncio.run(app.get_company_analysis("JNJ"))
+            assert analysis["sector"] == "Healthcare"
+            assert analysis["benchmark"]["PB"] == 40.0 and analysis["final_signal"]
+            # Profilo senza settore: quello della cache ("Health Care") in nome FMP
+            company = asyncio.run(app.get_company_data("PFE"))
+            assert company["sector"] == "Healthcare" and company["name"] == "Pfizer Inc."
+            # Anche l'endpoint dei benchmark accetta i nomi GICS
+            benchmark = asyncio.run(app.get_sector_benchmark("Health Care"))
+            assert benchmark["sector"] == "Healthcare"
+            assert set(screened) == {"Healthcare"}
+            print(f"✓ Analisi di JNJ con benchmark {analysis['sector']}, chiamate allo screener: {len(screened)}")
+
+            # Né profilo né cache con il settore: 404 esplicito, non un errore interno
+            assert asyncio.run(app.get_company_data("ZZZZ"))["sector"] is None
+            for endpoint in (app.get_company_analysis, app.get_complete_analysis):
+                try:
+                    asyncio.run(endpoint("ZZZZ"))
+                    assert False, "analisi senza settore"
+                except HTTPException as e:
+                    assert e.status_code == 404 and "Settore non disponibile" in e.detail, e.detail
+            batch = asyncio.run(app.analyze_batch(app.BatchAnalysisRequest(tickers=["ZZZZ", "JNJ"])))
+            assert "Settore non disponibile" in batch["results"][0]["error"]["detail"]
+            assert batch["results"][1]["sector"] == "Healthcare"
+            print("✓ Ticker senza settore: 404 nell'analisi, errore del solo ticker nel batch")
+        finally:
+            asyncio.run(http_client.close_transport())
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(env)
+
+
+def test_screener_seeded_from_store():
+    """Il screener riparte dallo storico dei fondamentali, con i settori della cache in nomi FMP"""
+    from modules import http_client
+    cwd, env = os.getcwd(), dict(os.environ)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "fundamentals")
+        FundamentalsStore(path).append("PFE", "annual", {
+            RATIOS: [{"date": "2023-12-31", "priceToEarningsRatio": 30.0, "priceToBookRatio": 9.0,
+                      "returnOnEquity": 0.1},
+                     {"date": "2024-12-31", "priceToEarningsRatio": 10.0, "priceToBookRatio": 1.5,
+                      "returnOnEquity": 0.3}],
+            BALANCE_SHEET: [{"date": "2024-12-31", "totalAssets": 9e11}]
+        })
+        try:
+            def handler(request: httpx.Request) -> httpx.Response:
+                endpoint = request.url.path.rsplit("/", 1)[-1]
+                if endpoint == "profile":
+                    return httpx.Response(200, json=[{"symbol": "PFE", "marketCap": 1.6e11}])
+                if endpoint == "balance-sheet-statement":
+                    return httpx.Response(200, json=[{"symbol": "PFE", "totalAssets": 9e11,
+                                                      "totalStockholdersEquity": 50}])
+                return make_handler([])(request)
+
+            app = load_app(directory, handler, env={"FUNDAMENTALS_STORE_ENABLED": "true",
+                                                    "FUNDAMENTALS_STORE_PATH": path})
+            asyncio.run(app.seed_screener())
+            row = app.screener.describe_row(app.screener._rows["PFE"])
+            assert row["fundamentals"] == {"PE": 10.0, "PB": 1.5, "ROE": 30.0}
+            assert row["sector"] == "Healthcare" and row["name"] == "Pfizer Inc."
+            # Capitalizzazione della cache (qui assente), non il proxy totalAssets dei fondamentali
+            assert app.fmp_client.cache.get_company_by_symbol("PFE").market_cap is None
+            assert row["market_cap"] is None
+
+            # Il benchmark (anche con nome GICS) rivaluta la riga caricata
+            app.screener.update_benchmark("Health Care", {"PE": 20.0, "PB": 3.0, "ROE": 15.0}, version=1)
+            page = app.screener.query(sector="Health Care", signals=["Undervalued"])
+            assert [item["ticker"] for item in page["results"]] == ["PFE"]
+
+            # Un'analisi senza settore nel profilo mantiene quello della cache
+            company = asyncio.run(app.get_company_data("PFE"))
+            row = app.screener.describe_row(app.screener._rows["PFE"])
+            assert row["sector"] == "Healthcare" and row["fundamentals"]["PB"] == 40.0
+            assert row["market_cap"] == 1.6e11 and company["market_cap"] == 9e11
+            assert app.screener.load_fundamentals(app.stored_fundamentals()) == 0
+
+            # Lo storico servito dall'endpoint è letto fuori dall'event loop
+            readers = []
+            series = app.fundamentals_store.series
+            app.fundamentals_store.series = lambda *args: readers.append(threading.current_thread()) or series(*args)
+            history = asyncio.run(app.get_company_history("PFE"))
+            assert history["source"] == "store" and len(history["periods"]) == 2
+            assert readers and threading.main_thread() not in readers
+            print(f"✓ Screener ricostruito dallo storico: {app.screener.get_stats()}")
+        finally:
+            asyncio.run(http_client.close_transport())
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(env)
+
+
+def test_screener_errors_are_not_empty_sectors():
+    """Un errore del stock-screener (429) non rende vuoto il settore: niente backoff né 404"""
+    from fastapi import HTTPException
+    from modules import http_client
+    screened = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("stock-screener"):
+            screened.append(request)
+            return httpx.Response(429, json={"error": "Limit Reach"})
+        return make_handler([])(request)
+
+    cwd, env = os.getcwd(), dict(os.environ)
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app = load_app(directory, handler)
+            scheduler = BenchmarkScheduler(app.sector_analyzer, lambda: ["Technology"], interval=30, stagger=0)
+
+            async def scenario():
+                summary = {"skipped": 0, "failed": 0, "computed": 0}
+                for _ in range(3):
+                    assert await scheduler._refresh("Technology", summary)
+                return summary
+
+            summary = app.sector_analyzer.transport.run(scenario())
+            assert summary["failed"] == 3 and len(screened) >= 3
+            assert not scheduler.has_no_companies("Technology") and not scheduler._skip
+            assert "empty_runs" not in scheduler.sector_status["Technology"]
+            try:
+                asyncio.run(app.get_sector_benchmark("Technology"))
+                assert False, "benchmark senza screener"
+            except HTTPException as e:
+                assert e.status_code == 503 and e.headers["Retry-After"]
+            print(f"✓ Screener in errore (429): settore ritentato, risposta 503 ({len(screened)} chiamate)")
+        finally:
+            asyncio.run(http_client.close_transport())
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(env)
+
+
+def test_standby_worker_reads_shared_benchmarks():
+    """Con lo scheduler in un altro worker la richiesta legge solo i benchmark su disco"""
+    from fastapi import HTTPException
+    from modules import http_client
+    from modules.sector_analysis import BENCHMARK_NAMESPACE, BENCHMARK_STALE_TTL
+    calls = []
+    cwd, env = os.getcwd(), dict(os.environ)
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app = load_app(directory, make_handler(calls), env={"BENCHMARK_SCHEDULER_ENABLED": "true"})
+            shared = os.path.join(directory, "disk")
+            app.sector_analyzer.disk_cache = DiskCache(shared)
+            # Worker in standby: lo scheduler non è attivo in questo processo
+            assert not app.benchmark_scheduler.running
+            try:
+                asyncio.run(app.get_sector_benchmark("Technology"))
+                assert False, "benchmark calcolato nella richiesta"
+            except HTTPException as e:
+                assert e.status_code == 503 and e.headers["Retry-After"]
+            assert calls == []
+
+            # Il worker attivo salva il benchmark nella cache su disco condivisa
+            DiskCache(shared).set(BENCHMARK_NAMESPACE, "sector_Technology",
+                                  {"sector": "Technology", "companies_used": ["AAPL"],
+                                   "benchmark": {"PE": 20.0, "PB": 3.0, "ROE": 15.0}},
+                                  BENCHMARK_TTL, BENCHMARK_STALE_TTL)
+            result = asyncio.run(app.get_sector_benchmark("Technology"))
+            assert result["benchmark"]["PE"] == 20.0 and not result["stale"] and calls == []
+            print("✓ Worker in standby: 503 e poi benchmark dalla cache condivisa, nessuna chiamata a FMP")
+        finally:
+            asyncio.run(http_client.close_transport())
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(env)
+
+
+def test_screener_request_only_queries():
+    """La richiesta al screener non legge la cache aziende: l'allineamento è in background"""
+    from modules import http_client
+    cwd, env = os.getcwd(), dict(os.environ)
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app = load_app(directory, make_handler([]))
+            cache = app.fmp_client.cache
+            reads = []
+            companies = cache.companies
+            cache.companies = lambda: reads.append(1) or companies()
+            empty = asyncio.run(app.screen_universe())
+            assert reads == [] and empty["total"] == 0
+
+            asyncio.run(app.sync_screener())
+            asyncio.run(app.sync_screener())
+            assert len(reads) == 1
+            page = asyncio.run(app.screen_universe(sort="market_cap", limit=5))
+            assert page["total"] == len(companies()) and len(page["results"]) == 5
+            print(f"✓ Screener: {page['total']} aziende allineate fuori dalla richiesta")
+        finally:
+            asyncio.run(http_client.close_transport())
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(env)
+
+
+def test_deadline_scope_and_gather():
+    """Scadenza per richiesta: mai estesa, visibile nei task annidati, rami parziali"""
+    assert remaining_time() is None and remaining_time(7.0) == 7.0
+    with deadline_scope(1.0):
+        outer = remaining_time()
+        with deadline_scope(30.0):
+            # Una scadenza annidata più lontana non estende quella attiva
+            assert remaining_time() <= outer
+        with deadline_scope(0.2):
+            assert remaining_time() <= 0.2
+        assert 0.2 < remaining_time() <= 1.0
+    assert remaining_time() is None
+
+    cancelled = []
+
+    async def nested():
+        # I task creati nello scope ereditano la scadenza (ContextVar)
+        await asyncio.sleep(0)
+        return remaining_time()
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def failing():
+        raise ValueError("ramo fallito")
+
+    async def scenario():
+        with deadline_scope(0.3):
+            started = time.perf_counter()
+            results, timed_out = await gather_with_deadline(
+                {"nested": nested(), "slow": slow(), "failing": failing()}, remaining_time()
+            )
+            return results, timed_out, time.perf_counter() - started
+
+    results, timed_out, elapsed = asyncio.run(scenario())
+    assert timed_out == ["slow"] and cancelled == [True] and elapsed < 1.0
+    assert 0 < results["nested"] <= 0.3
+    assert isinstance(results["failing"], ValueError) and "slow" not in results
+    assert asyncio.run(gather_with_deadline({}, 0.1)) == ({}, [])
+    print(f"✓ Scadenza: ramo lento cancellato dopo {elapsed * 1000:.0f}ms, gli altri restituiti")
+
+
+def test_complete_analysis_deadline():
+    """L'analisi completa restituisce lo scoring se scadono gli analisti; 504 se scadono i dati"""
+    from fastapi import HTTPException
+    from modules import http_client
+    slow = {"grades-consensus"}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        endpoint = request.url.path.rsplit("/", 1)[-1]
+        if endpoint in slow:
+            await asyncio.sleep(1.0)
+        if endpoint == "stock-screener":
+            return httpx.Response(200, json=[{"symbol": f"H{i}", "companyName": f"Health {i}",
+                                              "marketCap": 1e9 * (i + 1)} for i in range(3)])
+        if endpoint == "profile":
+            return httpx.Response(200, json=[{"symbol": "JNJ", "companyName": "Johnson & Johnson",
+                                              "sector": "Healthcare"}])
+        return make_handler([])(request)
+
+    cwd, env = os.getcwd(), dict(os.environ)
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app = load_app(directory, handler, env={"ANALYSIS_DEADLINE": "0.3"})
+            async def scenario():
+                # Benchmark già calcolato: la scadenza riguarda solo i dati del ticker
+                await app.get_sector_benchmark("Healthcare")
+                started = time.perf_counter()
+                complete = await app.get_complete_analysis("JNJ")
+                elapsed = time.perf_counter() - started
+
+                # La scadenza arriva fino al piano di fetch annidato nell'analisi
+                slow.add("ratios")
+                try:
+                    await app.get_complete_analysis("JNJ")
+                    assert False, "analisi oltre la scadenza"
+                except HTTPException as e:
+                    assert e.status_code == 504
+                late = time.perf_counter() - started - elapsed
+
+                # Le richieste lente terminano sul loop del trasporto prima della chiusura
+                await asyncio.sleep(1.0)
+                return complete, elapsed, late
+
+            complete, elapsed, late = asyncio.run(scenario())
+            assert complete["partial"] and complete["timed_out"] == ["analyst_recommendations"]
+            assert complete["final_signal"] and complete["analyst_recommendations"] is None
+            assert elapsed < 0.9 and late < 0.9
+            print(f"✓ Analisi completa parziale in {elapsed * 1000:.0f}ms (analisti scaduti), "
+                  f"504 in {late * 1000:.0f}ms con i dati scaduti")
+        finally:
+            asyncio.run(http_client.close_transport())
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(env)
+
+
+def test_batch_endpoint_limits_and_errors():
+    """Batch: limite di ticker da configurazione, concorrenza limitata, errori per singolo ticker"""
+    from fastapi.testclient import TestClient
+    from modules import http_client
+    state = {"in_flight": set(), "peak": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        endpoint = request.url.path.rsplit("/", 1)[-1]
+        symbol = request.url.params.get("symbol")
+        if endpoint == "stock-screener":
+            return httpx.Response(200, json=[{"symbol": f"H{i}", "companyName": f"Health {i}",
+                                              "marketCap": 1e9 * (i + 1)} for i in range(3)])
+        if endpoint == "profile":
+            return httpx.Response(200, json=[{"symbol": symbol, "companyName": f"{symbol} Corp",
+                                              "sector": "Healthcare"}])
+        if endpoint == "ratios" and not symbol.startswith("H"):
+            # Ticker del batch in elaborazione nello stesso momento
+            state["in_flight"].add(symbol)
+            state["peak"] = max(state["peak"], len(state["in_flight"]))
+            await asyncio.sleep(0.05)
+            state["in_flight"].discard(symbol)
+            if symbol == "BAD":
+                return httpx.Response(200, json=[])
+        return make_handler([])(request)
+
+    cwd, env = os.getcwd(), dict(os.environ)
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app = load_app(directory, handler, env={"BATCH_MAX_TICKERS": "8", "BATCH_CONCURRENCY": "2"})
+            client = TestClient(app.app)
+            tickers = ["T0", "t0", "T1", "BAD", "T2", "T3", "T4"]
+            response = client.post("/api/analysis/batch", json={"tickers": tickers})
+            assert response.status_code == 200, response.text
+            batch = response.json()
+            assert batch["requested"] == 7 and batch["unique"] == 6
+            assert batch["succeeded"] == 5 and batch["failed"] == 1
+            assert [item["ticker"] for item in batch["results"]] == ["T0", "T1", "BAD", "T2", "T3", "T4"]
+            assert batch["results"][2]["error"]["status_code"] == 404
+            assert all(item["final_signal"] for i, item in enumerate(batch["results"]) if i != 2)
+            assert 1 <= state["peak"] <= 2
+
+            # Limite da BATCH_MAX_TICKERS e richiesta senza ticker validi
+            response = client.post("/api/analysis/batch", json={"tickers": [f"T{i}" for i in range(9)]})
+            assert response.status_code == 413 and "8" in response.json()["detail"]
+            assert client.post("/api/analysis/batch", json={"tickers": [" ", ""]}).status_code == 400
+            print(f"✓ Batch: {batch['succeeded']} riusciti, 1 errore isolato, concorrenza massima {state['peak']}")
+        finally:
+            asyncio.run(http_client.close_transport())
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(env)
+
+
+def main():
+    """Funzione principale di test"""
+    print("🚀 Test Trasporto HTTP FMP")
+    print("=" * 60)
+    test_sync_wrapper()
+    test_async_from_foreign_loop()
+    test_per_host_limit()
+    test_single_flight()
+    test_response_cache_ttl_and_lru()
+    test_transport_cache()
+    test_disk_cache_survives_restart()
+    test_fetch_plan_shared()
+    test_bounded_as_completed()
+    test_token_bucket()
+    test_sector_benchmark_concurrent()
+    test_sector_benchmark_stale_while_revalidate()
+    test_benchmark_scheduler()
+    test_benchmark_scheduler_leader_and_backoff()
+    test_fundamentals_store()
+    test_analysis_non_technology_sector()
+    test_screener_seeded_from_store()
+    test_screener_errors_are_not_empty_sectors()
+    test_standby_worker_reads_shared_benchmarks()
+    test_screener_request_only_queries()
+    test_deadline_scope_and_gather()
+    test_complete_analysis_deadline()
+    test_batch_endpoint_limits_and_errors()
+    print("\n🎉 Test completati!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Test delle statistiche settoriali e dello scoring
+Calcoli locali su dati sintetici: non richiede API key né rete
+"""
+
+import sys
+import os
+import time
+import types
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from modules.sector_analysis import SectorAnalyzer
+from modules.scoring_system import (DEFAULT_PROFILE, INDICATORS, PROFILES, ScoringProfile, ScoringSystem,
+                                    compile_profile, parse_weights, resolve_profile)
+from modules.screener import ScoreTable
+from modules.fortune500_cache import CachedCompany
+from modules.sector_statistics import (PERCENTILES, STATISTICS, describe_matrix,
+                                       summarize_peers, top_peers)
+
+
+def reference_statistics(values, trim):
+    """Statistiche di una colonna calcolate in modo diretto (riferimento)"""
+    ordered = np.sort(values[~np.isnan(values)])
+    n = len(ordered)
+    cut = min(int(n * trim), (n - 1) // 2)
+    winsorized = ordered.copy()
+    winsorized[:cut] = ordered[cut]
+    winsorized[n - cut:] = ordered[n - cut - 1]
+    return {
+        "mean": ordered.mean(),
+        "median": np.median(ordered),
+        "trimmed_mean": ordered[cut:n - cut].mean(),
+        "winsorized_mean": winsorized.mean(),
+        "percentiles": np.percentile(ordered, PERCENTILES),
+    }
+
+
+def test_robust_statistics():
+    """Statistiche vettorizzate identiche al calcolo diretto, con NaN e valori estremi"""
+    rng = np.random.default_rng(7)
+    for peers in (1, 2, 3, 10, 11, 400):
+        matrix = rng.lognormal(3, 0.5, (peers, 3))
+        matrix[rng.random((peers, 3)) < 0.2] = np.nan
+        matrix[0, 0] = 300.0
+        stats = describe_matrix(matrix, trim=0.1)
+        for column in range(3):
+            values = matrix[:, column]
+            if np.isnan(values).all():
+                assert np.isnan(stats["median"][column])
+                continue
+            expected = reference_statistics(values, 0.1)
+            for name, value in expected.items():
+                got = stats[name][..., column]
+                assert np.allclose(got, value), (peers, column, name, got, value)
+    print("✓ Statistiche vettorizzate coerenti con il calcolo diretto")
+
+    # Un P/E anomalo sposta la media ma non mediana e media troncata
+    peers = [{"symbol": f"S{i}", "market_cap": 100 - i, "PE": pe, "PB": 5.0, "ROE": 15.0}
+             for i, pe in enumerate([300, 22, 24, 25, 21, 23, 26, 20, 24, 25, -4, None])]
+    summary = summarize_peers(peers)
+    print(f"✓ PE con valore anomalo: {({name: summary['PE'][name] for name in STATISTICS})}")
+    assert summary["PE"]["count"] == 10
+    assert summary["PE"]["mean"] > 45
+    assert summary["PE"]["median"] == 24.0
+    assert 20 < summary["PE"]["trimmed_mean"] < 26
+    assert summary["PE"]["percentiles"]["50"] == summary["PE"]["median"]
+    assert [peer["symbol"] for peer in top_peers(peers, 3)] == ["S0", "S1", "S2"]
+
+    # Centinaia di peer: tutte le statistiche di tutti i ratios in un solo passaggio
+    matrix = rng.lognormal(3, 0.5, (500, 3))
+    describe_matrix(matrix)
+    start = time.perf_counter()
+    for _ in range(200):
+        describe_matrix(matrix)
+    elapsed = (time.perf_counter() - start) / 200
+    print(f"✓ 500 peer x 3 ratios in {elapsed * 1e6:.0f}µs")
+    assert elapsed < 0.005
+
+    # Statistica e peer scelti per richiesta a partire dal benchmark salvato
+    analyzer = SectorAnalyzer(types.SimpleNamespace(api_key="test", transport=None))
+    stored = {"sector": "Technology", "companies_used": [peer["symbol"] for peer in peers],
+              "statistic": "median", "statistics": summary,
+              "benchmark": {"PE": summary["PE"]["median"], "PB": 5.0, "ROE": 15.0}, "peers": peers}
+    assert analyzer.select_benchmark(stored) is stored
+    assert analyzer.select_benchmark(stored, "mean")["benchmark"]["PE"] == summary["PE"]["mean"]
+    top = analyzer.select_benchmark(stored, "mean", top=2)
+    assert top["companies_used"] == ["S0", "S1"] and top["benchmark"]["PE"] == 161.0
+    try:
+        analyzer.select_benchmark(stored, "mode")
+        assert False, "statistica non valida"
+    except ValueError:
+        pass
+
+
+def test_vectorized_scoring():
+    """analyze_many produce gli stessi risultati di analyze_company, in millisecondi"""
+    rng = np.random.default_rng(11)
+    count = 20000
+
+    def column():
+        values = rng.lognormal(2.5, 0.6, count)
+        values[rng.random(count) < 0.1] = np.nan
+        return values
+
+    fundamentals = {name: column() for name in INDICATORS}
+    benchmarks = {name: column() for name in INDICATORS}
+    benchmarks["PB"][:100] = 0.0
+    # Valori esattamente sulle soglie (±20%)
+    fundamentals["PE"][:10] = benchmarks["PE"][:10] * 1.2
+
+    def value(array, i):
+        return None if np.isnan(array[i]) else float(array[i])
+
+    scoring = ScoringSystem()
+    for weights in (None, {"PE": 0.2, "PB": 0.2, "ROE": 0.6}):
+        if weights:
+            assert scoring.update_weights(weights)
+        start = time.perf_counter()
+        result = scoring.analyze_many(fundamentals, benchmarks)
+        elapsed = time.perf_counter() - start
+        records = scoring.unpack_many(result)
+        for i in range(count):
+            expected = scoring.analyze_company(
+                {name: value(fundamentals[name], i) for name in INDICATORS},
+                {name: value(benchmarks[name], i) for name in INDICATORS}
+            )
+            assert records[i] == expected and repr(records[i]) == repr(expected), (i, records[i], expected)
+        print(f"✓ {count} aziende valutate in {elapsed * 1000:.1f}ms, identiche al percorso scalare")
+        assert elapsed < 0.1
+
+    # Valori mancanti come NaN, None o chiave assente: stesso risultato dei due percorsi
+    nan = float("nan")
+    rows = [
+        ({"PE": nan, "PB": 2.0, "ROE": 30.0}, {"PE": 20.0, "PB": 3.0, "ROE": 20.0}),
+        ({"PE": None, "PB": 2.0, "ROE": 30.0}, {"PE": 20.0, "PB": 3.0, "ROE": 20.0}),
+        ({"PB": 2.0, "ROE": 30.0}, {"PE": 20.0, "PB": 3.0, "ROE": 20.0}),
+        ({"PE": 10.0, "PB": 2.0, "ROE": 30.0}, {"PE": nan, "PB": None, "ROE": 20.0}),
+        ({"PE": nan, "PB": nan, "ROE": nan}, {"PE": 20.0, "PB": 3.0, "ROE": 20.0}),
+        ({"PE": 30.0, "PB": 5.0, "ROE": nan}, {"PE": 20.0, "PB": 3.0}),
+    ]
+    for profile in (None, PROFILES["value"]):
+        records = scoring.unpack_many(scoring.analyze_many(
+            {name: [company.get(name) for company, _ in rows] for name in INDICATORS},
+            {name: [benchmark.get(name) for _, benchmark in rows] for name in INDICATORS},
+            profile
+        ))
+        for (company, benchmark), record in zip(rows, records):
+            assert scoring.analyze_company(company, benchmark, profile) == record, (company, benchmark)
+    assert records[0]["indicators"]["PE"] == "N/A" and records[4]["final_signal"] == "Fairly valued"
+    assert scoring.calculate_individual_score(nan, 20.0, "PE") == (0.0, "N/A")
+
+    # Benchmark scalare (un solo settore) applicato a tutte le righe
+    single = scoring.analyze_many(fundamentals, {"PE": 20.0, "PB": 3.0, "ROE": None})
+    assert single["final_signal"].shape == (count,)
+    assert set(single["indicators"]["ROE"]) == {"N/A"}
+
+
+def test_screener_table():
+    """Il screener filtra e ordina l'universo come un filtro diretto sui punteggi scalari"""
+    rng = np.random.default_rng(3)
+    sectors = ["Technology", "Healthcare", "Energy", "Utilities"]
+    count = 30000
+    companies = [CachedCompany(f"T{i}", f"Company {i}", "NYSE", market_cap=float(rng.integers(1, 10**6)) * 1e6,
+                               sector=sectors[i % 4]) for i in range(count)]
+    scoring = ScoringSystem()
+    table = ScoreTable(scoring)
+    table.sync_universe(companies, version=1)
+    assert table.sync_universe(companies, version=1) == 0
+
+    fundamentals = {}
+    for i in range(0, count, 2):
+        values = {name: float(rng.lognormal(2.5, 0.6)) for name in INDICATORS}
+        if i % 10 == 0:
+            values["PB"] = None
+        fundamentals[f"T{i}"] = values
+        table.update_fundamentals(f"T{i}", values)
+    benchmarks = {sector: {"PE": 14.0 + i, "PB": 12.0, "ROE": 13.0} for i, sector in enumerate(sectors[:3])}
+
+    start = time.perf_counter()
+    for sector, benchmark in benchmarks.items():
+        assert table.update_benchmark(sector, benchmark, version=1)
+    assert not table.update_benchmark("Technology", benchmarks["Technology"], version=1)
+    elapsed = time.perf_counter() - start
+    print(f"✓ Punteggi di {table.get_stats()['scored']} aziende calcolati in {elapsed * 1000:.1f}ms")
+
+    # Riferimento: analyze_company su ogni azienda con fondamentali e benchmark
+    expected = {}
+    for company in companies:
+        if company.symbol in fundamentals and company.sector in benchmarks:
+            expected[company.symbol] = (company, scoring.analyze_company(fundamentals[company.symbol],
+                                                                         benchmarks[company.sector]))
+    assert table.get_stats()["scored"] == len(expected)
+
+    def reference(predicate, key):
+        rows = [(symbol, company, analysis) for symbol, (company, analysis) in expected.items()
+                if predicate(company, analysis)]
+        rows.sort(key=key)
+        return [symbol for symbol, _, _ in rows]
+
+    start = time.perf_counter()
+    page = table.query(signals=["Undervalued"], sector="Technology", classifications={"PE": "Undervalued"},
+                       min_market_cap=1e11, sort="market_cap", offset=5, limit=20)
+    elapsed = time.perf_counter() - start
+    symbols = reference(
+        lambda c, a: a["final_signal"] == "Undervalued" and c.sector == "Technology"
+        and a["indicators"]["PE"] == "Undervalued" and c.market_cap >= 1e11,
+        key=lambda row: -row[1].market_cap
+    )
+    assert page["total"] == len(symbols)
+    assert [row["ticker"] for row in page["results"]] == symbols[5:25]
+    assert all(row["score"] == expected[row["ticker"]][1]["score"] for row in page["results"])
+    print(f"✓ Interrogazione su {table.size} aziende in {elapsed * 1000:.2f}ms ({page['total']} risultati)")
+
+    ranked = table.query(min_score=0.1, sort="score", limit=count)
+    scores = [row["score"] for row in ranked["results"]]
+    assert scores == sorted(scores, reverse=True) and min(scores) >= 0.1
+    assert ranked["total"] == sum(1 for _, analysis in expected.values() if analysis["score"] >= 0.1)
+
+    # Aggiornamento incrementale: una sola riga e poi un solo settore
+    table.update_fundamentals("T1", {"PE": 5.0, "PB": 5.0, "ROE": 30.0}, sector="Energy")
+    row = table.query(sector="Energy", signals=["Undervalued"], limit=count)["results"]
+    assert "T1" in [item["ticker"] for item in row]
+    table.update_benchmark("Energy", {"PE": 2.0, "PB": 2.0, "ROE": 60.0}, version=2)
+    assert table.describe_row(table._rows["T1"])["final_signal"] == "Overvalued"
+    unscored = table.query(sector="Utilities", limit=1)["results"][0]
+    assert unscored["score"] is None and unscored["final_signal"] is None
+
+
+def test_scoring_profiles():
+    """Profili immutabili per richiesta: nessuno stato condiviso, closure compilate una volta"""
+    custom = resolve_profile(weights=parse_weights("PE:0.2, pb:0.2,ROE:0.6"), threshold=10)
+    same = ScoringProfile.create(weights={"PE": 0.2, "PB": 0.2, "ROE": 0.6},
+                                 thresholds={"overvalued_threshold": 10, "fair_range": 10,
+                                             "undervalued_threshold": 10})
+    assert custom == same and hash(custom) == hash(same) and custom.name != same.name
+    assert custom != DEFAULT_PROFILE and resolve_profile() is DEFAULT_PROFILE
+    assert compile_profile(custom) is compile_profile(same)
+    try:
+        custom.weights = ()
+        assert False, "profilo modificabile"
+    except AttributeError:
+        pass
+    for invalid in ({"PE": 2.0}, {"PE": -0.1, "PB": 0.6, "ROE": 0.5}, {"EPS": 0.5}, {"PE": "0.5"}):
+        try:
+            ScoringProfile.create(weights=invalid)
+            assert False, invalid
+        except ValueError:
+            pass
+    try:
+        resolve_profile("growth")
+        assert False, "profilo sconosciuto"
+    except ValueError:
+        pass
+    print(f"✓ Profili hashable, validati e registrati: {', '.join(PROFILES)}")
+
+    # Stesse risposte del percorso non compilato e del vettorizzato, per ogni profilo
+    rng = np.random.default_rng(5)
+    count = 2000
+    fundamentals = {name: rng.lognormal(2.5, 0.6, count) for name in INDICATORS}
+    benchmarks = {name: rng.lognormal(2.5, 0.6, count) for name in INDICATORS}
+    fundamentals["ROE"][rng.random(count) < 0.2] = np.nan
+    scoring = ScoringSystem()
+    for profile in (*PROFILES.values(), custom):
+        records = scoring.unpack_many(scoring.analyze_many(fundamentals, benchmarks, profile))
+        for i in range(count):
+            company = {name: None if np.isnan(fundamentals[name][i]) else float(fundamentals[name][i])
+                       for name in INDICATORS}
+            benchmark = {name: float(benchmarks[name][i]) for name in INDICATORS}
+            analysis = scoring.analyze_company(company, benchmark, profile)
+            individual = {name: scoring.calculate_individual_score(company[name], benchmark[name], name, profile)
+                          for name in INDICATORS}
+            weighted = scoring.calculate_weighted_score({name: value[0] for name, value in individual.items()},
+                                                        profile)
+            assert analysis == records[i], (profile.name, i)
+            assert analysis["indicators"] == {name: value[1] for name, value in individual.items()}
+            assert analysis["score"] == round(weighted, 3)
+            assert analysis["final_signal"] == scoring.classify_final_signal(weighted, profile)
+    print("✓ Profili compilati identici al calcolo passo per passo e al vettorizzato")
+
+    # Il profilo di una richiesta non tocca il sistema condiviso
+    company, benchmark = {"PE": 15.0, "PB": 2.0, "ROE": 30.0}, {"PE": 20.0, "PB": 2.0, "ROE": 20.0}
+    default = scoring.analyze_company(company, benchmark)
+    quality = scoring.analyze_company(company, benchmark, PROFILES["quality"])
+    assert default["score"] == 0.7 and quality["score"] == 0.8
+    assert scoring.analyze_company(company, benchmark) == default
+    assert scoring.profile is DEFAULT_PROFILE and scoring.weights == {"PE": 0.5, "PB": 0.3, "ROE": 0.2}
+    scoring.weights["PE"] = 0.0
+    assert scoring.analyze_company(company, benchmark) == default
+
+    # update_weights sostituisce il profilo senza modificare quello in uso altrove
+    previous = scoring.profile
+    assert scoring.update_weights({"PE": 0.3, "PB": 0.2, "ROE": 0.5})
+    assert scoring.profile == PROFILES["quality"] and previous == DEFAULT_PROFILE
+    assert not scoring.update_weights({"PE": 5.0}) and scoring.profile == PROFILES["quality"]
+    # Semantica originale: validati i soli pesi passati, poi uniti a quelli attuali
+    assert not scoring.update_weights({"PE": 0.3, "PB": 0.3}) and not scoring.update_weights([0.5])
+    assert scoring.update_weights({"PE": 0.95}) and scoring.weights == {"PE": 0.95, "PB": 0.2, "ROE": 0.5}
+    assert previous == DEFAULT_PROFILE
+
+    # Nessun costo aggiuntivo sul percorso caldo per pesi personalizzati
+    compile_profile(custom)
+    hits = compile_profile.cache_info().hits
+    start = time.perf_counter()
+    for _ in range(20000):
+        scoring.analyze_company(company, benchmark, custom)
+    elapsed = (time.perf_counter() - start) / 20000
+    assert compile_profile.cache_info().hits - hits == 20000
+    print(f"✓ Analisi con profilo personalizzato in {elapsed * 1e6:.1f}µs")
+
+    # Screener interrogato con un profilo diverso da quello della tabella
+    table = ScoreTable(ScoringSystem())
+    table.sync_universe([CachedCompany(f"T{i}", f"Company {i}", "NYSE", market_cap=float(i + 1),
+                                       sector="Technology") for i in range(200)], version=1)
+    values = {}
+    for i in range(200):
+        values[f"T{i}"] = {name: float(rng.lognormal(2.5, 0.6)) for name in INDICATORS}
+        table.update_fundamentals(f"T{i}", values[f"T{i}"])
+    table.update_benchmark("Technology", {"PE": 12.0, "PB": 12.0, "ROE": 12.0}, version=1)
+    page = table.query(signals=["Undervalued"], limit=200, profile=custom)
+    expected = [symbol for symbol, value in values.items()
+                if scoring.analyze_company(value, {"PE": 12.0, "PB": 12.0, "ROE": 12.0}, custom)["final_signal"]
+                == "Undervalued"]
+    assert sorted(row["ticker"] for row in page["results"]) == sorted(expected)
+    scores = [row["score"] for row in page["results"]]
+    assert scores == sorted(scores, reverse=True)
+    assert table.query(limit=1)["results"][0]["score"] == table.query(limit=1, profile=DEFAULT_PROFILE)["results"][0]["score"]
+    assert len(table._profile_columns) == 1
+
+
+def main():
+    """Funzione principale di test"""
+    print("🚀 Test Statistiche e Scoring")
+    print("=" * 60)
+
+    # Test 1: Statistiche settoriali robuste
+    test_robust_statistics()
+
+    # Test 2: Scoring vettorizzato
+    test_vectorized_scoring()
+
+    # Test 3: Screener sull'universo
+    test_screener_table()
+
+    # Test 4: Profili di scoring per richiesta
+    test_scoring_profiles()
+
+    print("\n🎉 Test completati!")
+
+
+if __name__ == "__main__":
+    main()